@@ -3,6 +3,7 @@ Admin Console UI for iAmSmartGate
 Web-based admin interface
 """
 from flask import Flask, render_template_string, request, redirect, url_for
+import compression
 import requests
 import json
 from datetime import datetime
@@ -627,6 +628,14 @@ ADMIN_CONSOLE_HTML = """
             <!-- Pending Passes Tab -->
             <div id="pending" class="tab-content">
                 <h2 style="margin-bottom: 20px;">Pending Pass Applications</h2>
+                <div class="controls">
+                    <select id="bulk-site">
+                        <option value="">All Sites</option>
+                    </select>
+                    <input type="date" id="bulk-visit-date">
+                    <button class="btn btn-success" onclick="bulkUpdatePending('approve')">✓ Approve All Matching</button>
+                    <button class="btn btn-danger" onclick="bulkUpdatePending('reject')">✗ Reject All Matching</button>
+                </div>
                 <div class="table-container">
                     <table id="pending-table">
                         <thead>
@@ -661,10 +670,6 @@ ADMIN_CONSOLE_HTML = """
                     </select>
                     <select id="site-filter" onchange="loadAllPasses()">
                         <option value="">All Sites</option>
-                        <option value="SITE001">Main Campus</option>
-                        <option value="SITE002">Student Halls</option>
-                        <option value="SITE003">Research Center</option>
-                        <option value="SITE004">Library</option>
                     </select>
                 </div>
                 <div class="table-container">
@@ -705,18 +710,8 @@ ADMIN_CONSOLE_HTML = """
                 </div>
                 
                 <h3 style="margin-top: 30px; margin-bottom: 15px;">Site-Specific Controls</h3>
-                <div class="controls">
-                    <button class="btn btn-warning" onclick="pauseSite('SITE001', true)">Pause Main Campus</button>
-                    <button class="btn btn-warning" onclick="pauseSite('SITE002', true)">Pause Student Halls</button>
-                    <button class="btn btn-warning" onclick="pauseSite('SITE003', true)">Pause Research Center</button>
-                    <button class="btn btn-warning" onclick="pauseSite('SITE004', true)">Pause Library</button>
-                </div>
-                <div class="controls">
-                    <button class="btn btn-success" onclick="pauseSite('SITE001', false)">Resume Main Campus</button>
-                    <button class="btn btn-success" onclick="pauseSite('SITE002', false)">Resume Student Halls</button>
-                    <button class="btn btn-success" onclick="pauseSite('SITE003', false)">Resume Research Center</button>
-                    <button class="btn btn-success" onclick="pauseSite('SITE004', false)">Resume Library</button>
-                </div>
+                <div class="controls" id="site-pause-controls"></div>
+                <div class="controls" id="site-resume-controls"></div>
             </div>
             
             <!-- Register Gate Tab -->
@@ -733,12 +728,7 @@ ADMIN_CONSOLE_HTML = """
                     </div>
                     <div class="form-group">
                         <label>Site</label>
-                        <select id="gate-site" required>
-                            <option value="SITE001">Main Campus</option>
-                            <option value="SITE002">Student Halls</option>
-                            <option value="SITE003">Research Center</option>
-                            <option value="SITE004">Library</option>
-                        </select>
+                        <select id="gate-site" required></select>
                     </div>
                     <button type="submit" class="btn btn-primary" style="width: 100%;">Register Gate</button>
                 </form>
@@ -830,6 +820,16 @@ ADMIN_CONSOLE_HTML = """
     <script>
         const API_BASE = 'https://iamsmartgate-backend.onrender.com';
         let currentTabScroll = 0;
+        let siteNames = {};
+        
+        // Lists reloaded right after a change read from the primary, in case admin reads use a replica
+        let freshUntil = 0;
+        function markChanged() {
+            freshUntil = Date.now() + 10000;
+        }
+        function readUrl(url) {
+            return Date.now() < freshUntil ? url + (url.includes('?') ? '&' : '?') + 'fresh=1' : url;
+        }
         
         function scrollTabs(direction) {
             const wrapper = document.getElementById('tabs-wrapper');
@@ -861,7 +861,7 @@ ADMIN_CONSOLE_HTML = """
         async function loadDashboard() {
             try {
                 const [statsRes, statusRes] = await Promise.all([
-                    fetch(`${API_BASE}/admin/statistics`),
+                    fetch(readUrl(`${API_BASE}/admin/statistics`)),
                     fetch(`${API_BASE}/admin/system-status`)
                 ]);
                 
@@ -908,19 +908,12 @@ ADMIN_CONSOLE_HTML = """
                 
                 // Update site groups
                 if (stats.by_site) {
-                    const siteNames = {
-                        'SITE001': 'Main Campus',
-                        'SITE002': 'Student Halls',
-                        'SITE003': 'Research Center',
-                        'SITE004': 'Library'
-                    };
-                    
                     let html = '<h2 style="margin-top: 30px; margin-bottom: 20px;">Site Statistics</h2>';
                     for (const [siteId, siteStats] of Object.entries(stats.by_site)) {
                         const isPaused = status.site_pauses[siteId] || false;
                         html += `
                             <div class="site-group">
-                                <h3>${siteNames[siteId]} ${isPaused ? '⏸️ (Paused)' : '✅'}</h3>
+                                <h3>${siteNames[siteId] || siteId} ${isPaused ? '⏸️ (Paused)' : '✅'}</h3>
                                 <div class="site-stats">
                                     <div class="site-stat">
                                         <div class="number">${siteStats.approved}</div>
@@ -951,7 +944,7 @@ ADMIN_CONSOLE_HTML = """
         
         async function loadPendingPasses() {
             try {
-                const res = await fetch(`${API_BASE}/admin/pending-passes`);
+                const res = await fetch(readUrl(`${API_BASE}/admin/pending-passes`));
                 const data = await res.json();
                 
                 const tbody = document.getElementById('pending-tbody');
@@ -983,7 +976,7 @@ ADMIN_CONSOLE_HTML = """
                 if (status) url += `status=${status}&`;
                 if (site) url += `site_id=${site}`;
                 
-                const res = await fetch(url);
+                const res = await fetch(readUrl(url));
                 const data = await res.json();
                 
                 const tbody = document.getElementById('all-passes-tbody');
@@ -1013,28 +1006,30 @@ ADMIN_CONSOLE_HTML = """
                 const data = await res.json();
                 
                 const container = document.getElementById('logs-container');
-                container.innerHTML = data.logs.map(log => {
-                    let className = 'log-entry';
-                    if (log.result && log.result.includes('SUCCESS') || log.result === 'PASS') className += ' log-success';
-                    else if (log.result && (log.result.includes('FAILED') || log.result === 'REVOKED')) className += ' log-error';
-                    else if (log.result && log.result.includes('PAUSED')) className += ' log-warning';
-                    
-                    return `
-                        <div class="${className}">
-                            <strong>[${new Date(log.timestamp).toLocaleString()}]</strong>
-                            ${log.event_type.toUpperCase()} - ${log.result || 'N/A'}
-                            ${log.user_id ? ` | User: ${log.user_id}` : ''}
-                            ${log.gate_id ? ` | Gate: ${log.gate_id}` : ''}
-                            ${log.pass_id ? ` | Pass: ${log.pass_id}` : ''}
-                            ${log.details ? ` | ${log.details}` : ''}
-                        </div>
-                    `;
-                }).join('');
+                container.innerHTML = data.logs.map(renderLogEntry).join('');
             } catch (err) {
                 console.error('Error loading audit logs:', err);
             }
         }
         
+        function renderLogEntry(log) {
+            let className = 'log-entry';
+            if (log.result && log.result.includes('SUCCESS') || log.result === 'PASS') className += ' log-success';
+            else if (log.result && (log.result.includes('FAILED') || log.result === 'REVOKED')) className += ' log-error';
+            else if (log.result && log.result.includes('PAUSED')) className += ' log-warning';
+            
+            return `
+                <div class="${className}">
+                    <strong>[${new Date(log.timestamp).toLocaleString()}]</strong>
+                    ${log.event_type.toUpperCase()} - ${log.result || 'N/A'}
+                    ${log.user_id ? ` | User: ${log.user_id}` : ''}
+                    ${log.gate_id ? ` | Gate: ${log.gate_id}` : ''}
+                    ${log.pass_id ? ` | Pass: ${log.pass_id}` : ''}
+                    ${log.details ? ` | ${log.details}` : ''}
+                </div>
+            `;
+        }
+        
         async function approvePass(passId) {
             if (!confirm(`Approve pass ${passId}?`)) return;
             try {
@@ -1043,6 +1038,7 @@ ADMIN_CONSOLE_HTML = """
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ expiry_hours: 24 })
                 });
+                markChanged();
                 const data = await res.json();
                 alert(data.message);
                 loadPendingPasses();
@@ -1061,6 +1057,7 @@ ADMIN_CONSOLE_HTML = """
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ reason })
                 });
+                markChanged();
                 const data = await res.json();
                 alert(data.message);
                 loadPendingPasses();
@@ -1070,6 +1067,41 @@ ADMIN_CONSOLE_HTML = """
             }
         }
         
+        // Approve or reject every pending pass matching the site/date filter in one request
+        async function bulkUpdatePending(action) {
+            const filter = { status: 'In Process' };
+            const site = document.getElementById('bulk-site').value;
+            const visitDate = document.getElementById('bulk-visit-date').value;
+            if (site) filter.site_id = site;
+            if (visitDate) filter.visit_date = visitDate;
+            
+            const scope = `${site || 'all sites'}${visitDate ? ' on ' + visitDate : ''}`;
+            let body = { filter };
+            if (action === 'approve') {
+                if (!confirm(`Approve all pending passes for ${scope}?`)) return;
+                body.expiry_hours = 24;
+            } else {
+                const reason = prompt(`Reason for rejecting all pending passes for ${scope}:`);
+                if (!reason) return;
+                body.reason = reason;
+            }
+            
+            try {
+                const res = await fetch(`${API_BASE}/admin/bulk/${action}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(body)
+                });
+                markChanged();
+                const data = await res.json();
+                alert(data.message || data.error);
+                loadPendingPasses();
+                loadDashboard();
+            } catch (err) {
+                alert(`Error in bulk ${action}: ` + err.message);
+            }
+        }
+        
         async function revokePass(passId) {
             const reason = prompt('Reason for revocation:');
             if (!reason) return;
@@ -1079,6 +1111,7 @@ ADMIN_CONSOLE_HTML = """
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ reason })
                 });
+                markChanged();
                 const data = await res.json();
                 alert(data.message);
                 loadAllPasses();
@@ -1140,6 +1173,32 @@ ADMIN_CONSOLE_HTML = """
             }
         }
         
+        // Site lists and per-site controls are built from the server registry
+        async function loadSites() {
+            try {
+                const res = await fetch(`${API_BASE}/admin/registry/sites`);
+                const data = await res.json();
+                const sites = Object.entries(data.sites);
+                siteNames = Object.fromEntries(sites.map(([id, site]) => [id, site.name]));
+                
+                const active = sites.filter(([, site]) => site.active);
+                const options = active.map(([id, site]) => `<option value="${id}">${site.name}</option>`).join('');
+                for (const selectId of ['bulk-site', 'site-filter']) {
+                    const select = document.getElementById(selectId);
+                    const selected = select.value;
+                    select.innerHTML = '<option value="">All Sites</option>' + options;
+                    select.value = selected;
+                }
+                document.getElementById('gate-site').innerHTML = options;
+                document.getElementById('site-pause-controls').innerHTML = active.map(([id, site]) =>
+                    `<button class="btn btn-warning" onclick="pauseSite('${id}', true)">Pause ${site.name}</button>`).join('');
+                document.getElementById('site-resume-controls').innerHTML = active.map(([id, site]) =>
+                    `<button class="btn btn-success" onclick="pauseSite('${id}', false)">Resume ${site.name}</button>`).join('');
+            } catch (err) {
+                console.error('Error loading sites:', err);
+            }
+        }
+        
         function refreshData() {
             const activeTab = document.querySelector('.tab.active').textContent;
             if (activeTab.includes('Dashboard')) loadDashboard();
@@ -1600,11 +1659,60 @@ ADMIN_CONSOLE_HTML = """
             }
         }
         
-        // Initial load
-        loadDashboard();
+        // Initial load (site names first, the dashboard labels its site groups with them)
+        loadSites().then(loadDashboard);
+        
+        // Live updates: the backend pushes pass changes, audit events and pause
+        // toggles; only the active tab is refreshed, and only when relevant
+        const TAB_EVENTS = {
+            'Dashboard': ['pass', 'pause'],
+            'Pending': ['pass'],
+            'All Passes': ['pass'],
+            'HSM': ['pass']
+        };
+        let refreshTimer = null;
+        
+        function activeTabName() {
+            return document.querySelector('.tab.active').textContent;
+        }
+        
+        function scheduleRefresh(eventType) {
+            const activeTab = activeTabName();
+            const relevant = Object.entries(TAB_EVENTS).some(
+                ([tab, types]) => activeTab.includes(tab) && types.includes(eventType)
+            );
+            if (!relevant || refreshTimer) return;
+            // Coalesce bursts (e.g. bulk approvals) into one reload
+            refreshTimer = setTimeout(() => {
+                refreshTimer = null;
+                refreshData();
+            }, 500);
+        }
+        
+        function appendAuditLog(log) {
+            if (!activeTabName().includes('Audit')) return;
+            const container = document.getElementById('logs-container');
+            container.insertAdjacentHTML('afterbegin', renderLogEntry(log));
+            while (container.children.length > 100) {
+                container.removeChild(container.lastElementChild);
+            }
+        }
+        
+        function connectEventStream() {
+            if (!window.EventSource) {
+                // Fallback: poll every 10 seconds
+                setInterval(refreshData, 10000);
+                return;
+            }
+            // EventSource reconnects on its own and resumes from Last-Event-ID
+            const source = new EventSource(`${API_BASE}/admin/events`);
+            source.addEventListener('pass', () => scheduleRefresh('pass'));
+            source.addEventListener('pause', () => scheduleRefresh('pause'));
+            source.addEventListener('audit', (e) => appendAuditLog(JSON.parse(e.data)));
+            source.addEventListener('resync', () => refreshData());
+        }
         
-        // Auto-refresh every 10 seconds
-        setInterval(refreshData, 10000);
+        connectEventStream();
     </script>
 </body>
 </html>
@@ -1613,6 +1721,7 @@ ADMIN_CONSOLE_HTML = """
 def create_admin_app():
     """Create admin console Flask app"""
     app = Flask(__name__)
+    compression.init_app(app)
     
     @app.route('/')
     def index():
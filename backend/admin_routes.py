@@ -1,22 +1,54 @@
 """
 Admin routes for iAmSmartGate
 """
-from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-from models import db, User, Gate, Pass, AuditLog, SystemState
+from flask import Blueprint, request, jsonify, send_file, Response
+from datetime import datetime, timedelta, timezone
+from models import db, User, Gate, Pass, SystemState, PASS_PROJECTION, record_change, record_gate_change
+from audit_partitions import record_event, record_events, query_events, count_events
+from exports import (EXPORT_FORMATS, PASS_FIELDS, AUDIT_FIELDS, decode_pass_cursor,
+                     iter_passes, iter_audit_events, export_response)
 from crypto_utils import hsm
+from pass_state import TRANSITIONS, apply_transition
+from event_feed import hub, sse_response
+from profiling import list_profiles, profile_path
+from registry import REGISTRY_MODELS, registry, upsert_entry
+from sharding import each_shard, execute_all, route_to_pass
+from sqlalchemy import select, or_, func
+from config import Config
+import io
 import json
 import logging
+import os
+import pstats
 
 admin_bp = Blueprint('admin', __name__)
 logger = logging.getLogger(__name__)
 
+# HSM signature log classification
+SIGN_EVENT_TYPES = ['sign', 'pass_sign']
+VERIFY_EVENT_TYPES = ['verify', 'gate_verify']
+SUCCESS_RESULTS = ['SUCCESS', 'VERIFIED', 'PASS']
+BULK_ACTIONS = ['approve', 'reject', 'revoke']
+
+def parse_time_arg(name):
+    """Parse an optional ISO date time query argument as naive UTC"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 @admin_bp.route('/pending-passes', methods=['GET'])
 def pending_passes():
     """Get all pending pass applications"""
     try:
-        passes = Pass.query.filter_by(status='In Process').order_by(Pass.created_timestamp.desc()).all()
-        return jsonify({'passes': [p.to_dict() for p in passes]}), 200
+        rows = execute_all(
+            PASS_PROJECTION.select().where(Pass.status == 'In Process').order_by(Pass.created_timestamp.desc()),
+            order_by=lambda row: row.created_timestamp, reverse=True
+        )
+        return jsonify({'passes': PASS_PROJECTION.dicts(rows)}), 200
     except Exception as e:
         logger.error(f"[ADMIN] Get pending passes error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -28,14 +60,17 @@ def all_passes():
         status_filter = request.args.get('status')
         site_filter = request.args.get('site_id')
         
-        query = Pass.query
+        stmt = PASS_PROJECTION.select()
         if status_filter:
-            query = query.filter_by(status=status_filter)
+            stmt = stmt.where(Pass.status == status_filter)
         if site_filter:
-            query = query.filter_by(site_id=site_filter)
+            stmt = stmt.where(Pass.site_id == site_filter)
         
-        passes = query.order_by(Pass.created_timestamp.desc()).all()
-        return jsonify({'passes': [p.to_dict() for p in passes]}), 200
+        rows = execute_all(
+            stmt.order_by(Pass.created_timestamp.desc()),
+            order_by=lambda row: row.created_timestamp, reverse=True, site_id=site_filter
+        )
+        return jsonify({'passes': PASS_PROJECTION.dicts(rows)}), 200
     except Exception as e:
         logger.error(f"[ADMIN] Get all passes error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -47,27 +82,23 @@ def approve_pass(pass_id):
         data = request.json or {}
         expiry_hours = data.get('expiry_hours', 24)  # Default 24 hours
         
-        pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
-        if not pass_obj:
-            return jsonify({'error': 'Pass not found'}), 404
-        
-        if pass_obj.status != 'In Process':
+        route_to_pass(pass_id)
+        if not apply_transition('approve', [pass_id], expiry_hours=expiry_hours):
+            pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
+            if not pass_obj:
+                return jsonify({'error': 'Pass not found'}), 404
             return jsonify({'error': f'Pass cannot be approved (status: {pass_obj.status})'}), 400
         
-        pass_obj.status = 'Pass'
-        pass_obj.approved_timestamp = datetime.utcnow()
-        pass_obj.expiry_timestamp = datetime.utcnow() + timedelta(hours=expiry_hours)
-        db.session.commit()
+        pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
         
         # Audit log
-        audit = AuditLog(
-            event_type='approval',
+        record_event(
+            'approval',
+            'APPROVED',
             pass_id=pass_id,
             user_id=pass_obj.iamsmart_id,
-            result='APPROVED',
             details=f'Expiry: {expiry_hours}h'
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[ADMIN] Pass approved: {pass_id}")
@@ -88,25 +119,23 @@ def reject_pass(pass_id):
         data = request.json or {}
         reason = data.get('reason', 'No reason provided')
         
-        pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
-        if not pass_obj:
-            return jsonify({'error': 'Pass not found'}), 404
-        
-        if pass_obj.status != 'In Process':
+        route_to_pass(pass_id)
+        if not apply_transition('reject', [pass_id]):
+            pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
+            if not pass_obj:
+                return jsonify({'error': 'Pass not found'}), 404
             return jsonify({'error': f'Pass cannot be rejected (status: {pass_obj.status})'}), 400
         
-        pass_obj.status = 'No Pass'
-        db.session.commit()
+        pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
         
         # Audit log
-        audit = AuditLog(
-            event_type='rejection',
+        record_event(
+            'rejection',
+            'REJECTED',
             pass_id=pass_id,
             user_id=pass_obj.iamsmart_id,
-            result='REJECTED',
             details=reason
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[ADMIN] Pass rejected: {pass_id}")
@@ -127,23 +156,20 @@ def revoke_pass(pass_id):
         data = request.json or {}
         reason = data.get('reason', 'No reason provided')
         
+        route_to_pass(pass_id)
+        apply_transition('revoke', [pass_id])
         pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
         if not pass_obj:
             return jsonify({'error': 'Pass not found'}), 404
         
-        pass_obj.revoked_flag = True
-        pass_obj.status = 'Revoked'
-        db.session.commit()
-        
         # Audit log
-        audit = AuditLog(
-            event_type='revoke',
+        record_event(
+            'revoke',
+            'REVOKED',
             pass_id=pass_id,
             user_id=pass_obj.iamsmart_id,
-            result='REVOKED',
             details=reason
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[ADMIN] Pass revoked: {pass_id}")
@@ -157,6 +183,102 @@ def revoke_pass(pass_id):
         logger.error(f"[ADMIN] Revoke pass error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/bulk/<action>', methods=['POST'])
+def bulk_update_passes(action):
+    """
+    Approve, reject or revoke many passes in one transaction (one per shard with
+    site sharding, each with its passes' audit events)
+    Takes pass_ids or a filter (status, site_id, purpose_id, visit_date) and
+    returns a result per pass
+    """
+    try:
+        if action not in BULK_ACTIONS:
+            return jsonify({'error': f'Unknown bulk action: {action}'}), 404
+        spec = TRANSITIONS[action]
+        
+        data = request.json or {}
+        pass_ids = data.get('pass_ids')
+        filters = data.get('filter')
+        if bool(pass_ids) == bool(filters):
+            return jsonify({'error': 'Provide either pass_ids or filter'}), 400
+        
+        table = Pass.__table__
+        if pass_ids:
+            pass_ids = list(dict.fromkeys(pass_ids))
+            if len(pass_ids) > Config.BULK_MAX_PASSES:
+                return jsonify({'error': f'At most {Config.BULK_MAX_PASSES} passes per request'}), 400
+            stmt = select(table.c.pass_id, table.c.status).where(table.c.pass_id.in_(pass_ids))
+        else:
+            stmt = select(table.c.pass_id, table.c.status)
+            for field in ('status', 'site_id', 'purpose_id'):
+                if filters.get(field):
+                    stmt = stmt.where(table.c[field] == filters[field])
+            if filters.get('visit_date'):
+                day = datetime.strptime(filters['visit_date'], '%Y-%m-%d')
+                stmt = stmt.where(table.c.visit_date_time >= day, table.c.visit_date_time < day + timedelta(days=1))
+            stmt = stmt.order_by(table.c.pass_id).limit(Config.BULK_MAX_PASSES + 1)
+        
+        # Each shard is searched and later updated on its own; unsharded there is just the primary
+        shard_site = filters.get('site_id') if filters else None
+        found, by_shard = {}, {}
+        for key in each_shard(shard_site):
+            rows = db.session.execute(stmt).all()
+            found.update(rows)
+            by_shard[key] = [pass_id for pass_id, _ in rows]
+        if not pass_ids:
+            if len(found) > Config.BULK_MAX_PASSES:
+                return jsonify({'error': f'Filter matches more than {Config.BULK_MAX_PASSES} passes'}), 400
+            pass_ids = sorted(found)
+        
+        now = datetime.utcnow()
+        expiry_hours = data.get('expiry_hours', 24)
+        if action == 'approve':
+            details = f'Expiry: {expiry_hours}h (bulk)'
+        else:
+            details = f"{data.get('reason', 'No reason provided')} (bulk)"
+        
+        # The status guard is re-checked in the UPDATE so a concurrent change is never overwritten
+        updated = []
+        for key in each_shard(shard_site):
+            rows = apply_transition(action, by_shard[key], now=now, expiry_hours=expiry_hours)
+            record_events([{
+                'event_type': spec['event_type'],
+                'result': spec['result'],
+                'pass_id': row.pass_id,
+                'user_id': row.iamsmart_id,
+                'details': details,
+                'timestamp': now
+            } for row in rows])
+            db.session.commit()
+            updated += rows
+        
+        changed = {row.pass_id for row in updated}
+        results = []
+        for pass_id in pass_ids:
+            if pass_id in changed:
+                results.append({'pass_id': pass_id, 'result': spec['result'], 'status': spec['status']})
+            elif pass_id in found:
+                results.append({'pass_id': pass_id, 'result': 'INVALID_STATUS', 'status': found[pass_id]})
+            else:
+                results.append({'pass_id': pass_id, 'result': 'NOT_FOUND', 'status': None})
+        
+        logger.info(f"[ADMIN] Bulk {action}: {len(changed)} of {len(pass_ids)} passes updated")
+        
+        return jsonify({
+            'message': f'{len(changed)} of {len(pass_ids)} passes updated',
+            'action': action,
+            'requested': len(pass_ids),
+            'updated': len(changed),
+            'results': results
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[ADMIN] Bulk {action} error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/pause-system', methods=['POST'])
 def pause_system():
     """Pause/unpause entire system"""
@@ -172,15 +294,16 @@ def pause_system():
             state = SystemState(key='global_pause', value='true' if paused else 'false')
             db.session.add(state)
         
+        record_change('pause', {'scope': 'system', 'paused': paused})
+        record_gate_change(None, 'pause' if paused else 'resume', {'scope': 'system'})
         db.session.commit()
         
         # Audit log
-        audit = AuditLog(
-            event_type='pause',
-            result='SYSTEM_PAUSED' if paused else 'SYSTEM_RESUMED',
+        record_event(
+            'pause',
+            'SYSTEM_PAUSED' if paused else 'SYSTEM_RESUMED',
             details='Global system pause toggled'
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[ADMIN] System {'paused' if paused else 'resumed'}")
@@ -220,15 +343,16 @@ def pause_site():
             state = SystemState(key='site_pauses', value=json.dumps(pauses))
             db.session.add(state)
         
+        record_change('pause', {'scope': 'site', 'site_id': site_id, 'paused': paused}, site_id=site_id)
+        record_gate_change(site_id, 'pause' if paused else 'resume', {'scope': 'site'})
         db.session.commit()
         
         # Audit log
-        audit = AuditLog(
-            event_type='pause',
-            result=f'SITE_{"PAUSED" if paused else "RESUMED"}',
+        record_event(
+            'pause',
+            f'SITE_{"PAUSED" if paused else "RESUMED"}',
             details=f'Site {site_id} pause toggled'
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[ADMIN] Site {site_id} {'paused' if paused else 'resumed'}")
@@ -270,26 +394,34 @@ def statistics():
         # Overall statistics
         stats['total_users'] = User.query.count()
         stats['total_gates'] = Gate.query.count()
-        stats['total_passes'] = Pass.query.count()
+        
+        # Pass counts per site and status, one grouped query per shard
+        counts = {}
+        for row_site, status, count in execute_all(
+            select(Pass.site_id, Pass.status, func.count()).group_by(Pass.site_id, Pass.status)
+        ):
+            counts[(row_site, status)] = counts.get((row_site, status), 0) + count
+        stats['total_passes'] = sum(counts.values())
         
         # Pass statistics by status
         for status in ['In Process', 'Pass', 'No Pass', 'Used', 'Revoked']:
-            query = Pass.query.filter_by(status=status)
-            if site_id:
-                query = query.filter_by(site_id=site_id)
-            stats[f'passes_{status.lower().replace(" ", "_")}'] = query.count()
+            stats[f'passes_{status.lower().replace(" ", "_")}'] = sum(
+                count for (row_site, row_status), count in counts.items()
+                if row_status == status and (not site_id or row_site == site_id)
+            )
         
         # Site-specific statistics
         if site_id:
             stats['site_id'] = site_id
         else:
             site_stats = {}
-            for site_id_key in ['SITE001', 'SITE002', 'SITE003', 'SITE004']:
+            # Every registered site, including deactivated ones that still have passes
+            for site_id_key in registry.snapshot().sites:
                 site_stats[site_id_key] = {
-                    'approved': Pass.query.filter_by(site_id=site_id_key, status='Pass').count(),
-                    'requested': Pass.query.filter_by(site_id=site_id_key, status='In Process').count(),
-                    'used': Pass.query.filter_by(site_id=site_id_key, status='Used').count(),
-                    'revoked': Pass.query.filter_by(site_id=site_id_key, status='Revoked').count()
+                    'approved': counts.get((site_id_key, 'Pass'), 0),
+                    'requested': counts.get((site_id_key, 'In Process'), 0),
+                    'used': counts.get((site_id_key, 'Used'), 0),
+                    'revoked': counts.get((site_id_key, 'Revoked'), 0)
                 }
             stats['by_site'] = site_stats
         
@@ -305,19 +437,178 @@ def audit_logs():
     try:
         limit = int(request.args.get('limit', 100))
         event_type = request.args.get('event_type')
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
         
-        query = AuditLog.query
-        if event_type:
-            query = query.filter_by(event_type=event_type)
+        try:
+            start = parse_time_arg('start')
+            end = parse_time_arg('end')
+        except ValueError:
+            return jsonify({'error': 'Invalid date time format'}), 400
         
-        logs = query.order_by(AuditLog.timestamp.desc()).limit(limit).all()
+        # Only partitions whose day falls inside [start, end] are queried
+        logs = query_events(start=start, end=end, event_type=event_type, limit=limit,
+                            include_archived=include_archived)
         
-        return jsonify({'logs': [log.to_dict() for log in logs]}), 200
+        return jsonify({'logs': logs}), 200
         
     except Exception as e:
         logger.error(f"[ADMIN] Get audit logs error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/export/passes', methods=['GET'])
+def export_passes():
+    """Stream passes as NDJSON or CSV"""
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+        
+        cursor = request.args.get('cursor')
+        try:
+            start = parse_time_arg('start')
+            end = parse_time_arg('end')
+            if cursor:
+                decode_pass_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid date time or cursor'}), 400
+        
+        records = iter_passes(
+            start=start,
+            end=end,
+            site_id=request.args.get('site_id'),
+            status=request.args.get('status'),
+            cursor=cursor
+        )
+        
+        logger.info(f"[ADMIN] Pass export started ({export_format})")
+        return export_response(records, export_format, PASS_FIELDS, 'passes')
+    
+    except Exception as e:
+        logger.error(f"[ADMIN] Export passes error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/audit-logs', methods=['GET'])
+def export_audit_logs():
+    """Stream audit events as NDJSON or CSV"""
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+        
+        cursor = request.args.get('cursor')
+        try:
+            start = parse_time_arg('start')
+            end = parse_time_arg('end')
+            if cursor:
+                int(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid date time or cursor'}), 400
+        
+        records = iter_audit_events(
+            start=start,
+            end=end,
+            site_id=request.args.get('site_id'),
+            event_type=request.args.get('event_type'),
+            cursor=cursor,
+            include_archived=request.args.get('include_archived', 'false').lower() == 'true'
+        )
+        
+        logger.info(f"[ADMIN] Audit log export started ({export_format})")
+        return export_response(records, export_format, AUDIT_FIELDS, 'audit-logs')
+    
+    except Exception as e:
+        logger.error(f"[ADMIN] Export audit logs error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/events', methods=['GET'])
+def admin_events():
+    """Server-Sent Events feed of pass changes, audit events and pause toggles"""
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        subscription = hub.subscribe(lambda event: True, last_event_id)
+        return sse_response(subscription)
+    except Exception as e:
+        logger.error(f"[ADMIN] Event feed error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/gate-push-stats', methods=['GET'])
+def gate_push_stats():
+    """Delay from a gate change being recorded until all connected gates were sent it (this worker)"""
+    try:
+        return jsonify(hub.tracker.stats()), 200
+    except Exception as e:
+        logger.error(f"[ADMIN] Gate push stats error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """List saved request profiles (newest first)"""
+    try:
+        return jsonify({'profiles': list_profiles()}), 200
+    except Exception as e:
+        logger.error(f"[ADMIN] List profiles error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download a saved profile, or ?format=text for the top functions by cumulative time"""
+    try:
+        path = profile_path(name)
+        if not path:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        if request.args.get('format') == 'text':
+            out = io.StringIO()
+            stats = pstats.Stats(path, stream=out)
+            stats.sort_stats('cumulative').print_stats(request.args.get('limit', 40, type=int))
+            return Response(out.getvalue(), mimetype='text/plain')
+        
+        return send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True, download_name=name)
+    except Exception as e:
+        logger.error(f"[ADMIN] Get profile error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/registry/<kind>', methods=['GET'])
+def get_registry(kind):
+    """List all sites or purposes, including inactive ones"""
+    try:
+        if kind not in REGISTRY_MODELS:
+            return jsonify({'error': 'Unknown registry'}), 404
+        snapshot = registry.snapshot()
+        return jsonify({kind: getattr(snapshot, kind), 'version': snapshot.version}), 200
+    except Exception as e:
+        logger.error(f"[ADMIN] Get registry error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/registry/<kind>', methods=['POST'])
+def update_registry(kind):
+    """Add or update a site or purpose (id, name, active)"""
+    try:
+        if kind not in REGISTRY_MODELS:
+            return jsonify({'error': 'Unknown registry'}), 404
+        data = request.json or {}
+        entry_id = data.get('id')
+        if not entry_id:
+            return jsonify({'error': 'Missing id'}), 400
+        
+        try:
+            upsert_entry(kind, entry_id, name=data.get('name'), active=data.get('active'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        record_event('registry', 'UPDATED', details=f'{kind}: {json.dumps(data)}')
+        db.session.commit()
+        registry.invalidate()
+        
+        logger.info(f"[ADMIN] Registry {kind} updated: {entry_id}")
+        snapshot = registry.snapshot()
+        return jsonify({'entry': getattr(snapshot, kind)[entry_id], 'version': snapshot.version}), 200
+    
+    except Exception as e:
+        logger.error(f"[ADMIN] Update registry error: {e}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/register-gate', methods=['POST'])
 def register_gate():
     """Register a new gate"""
@@ -330,6 +621,9 @@ def register_gate():
         if not all([tablet_id, gps_location, site_id]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        if not registry.has_site(site_id):
+            return jsonify({'error': 'Unknown site'}), 400
+        
         # Check if gate already exists
         existing = Gate.query.filter_by(tablet_id=tablet_id).first()
         if existing:
@@ -347,6 +641,7 @@ def register_gate():
             site_id=site_id
         )
         db.session.add(gate)
+        record_gate_change(site_id, 'config', {'gate': gate.to_dict()})
         db.session.commit()
         
         logger.info(f"[ADMIN] Gate registered: {tablet_id}")
@@ -376,13 +671,12 @@ def query_public_key(user_id):
         public_key = user.public_key
         
         # Log the query
-        audit = AuditLog(
-            event_type='hsm_query',
+        record_event(
+            'hsm_query',
+            'SUCCESS',
             user_id=user_id,
-            result='SUCCESS',
             details='PKCS#11 public key query'
         )
-        db.session.add(audit)
         db.session.commit()
         
         logger.info(f"[HSM] Public key queried for user: {user_id}")
@@ -408,41 +702,45 @@ def signature_logs():
     """Get HSM signature operation logs"""
     try:
         filter_type = request.args.get('filter', 'all')
-        
-        # Query audit logs for signature operations
-        query = AuditLog.query.filter(
-            AuditLog.event_type.in_(['sign', 'verify', 'pass_sign', 'gate_verify'])
-        )
-        
-        logs = query.order_by(AuditLog.timestamp.desc()).limit(100).all()
+        limit = min(int(request.args.get('limit', 100)), 500)
+        cursor = request.args.get('cursor')
+        
+        # Filters are SQL predicates so every page is full and uses the partition index
+        event_types = SIGN_EVENT_TYPES + VERIFY_EVENT_TYPES
+        where = None
+        if filter_type == 'sign':
+            event_types = SIGN_EVENT_TYPES
+        elif filter_type == 'verify':
+            event_types = VERIFY_EVENT_TYPES
+        elif filter_type == 'success':
+            where = lambda table: [table.c.result.in_(SUCCESS_RESULTS)]
+        elif filter_type == 'failed':
+            where = lambda table: [or_(table.c.result.is_(None), table.c.result.notin_(SUCCESS_RESULTS))]
+        
+        logs = query_events(event_type=event_types, limit=limit, where=where,
+                            before_id=int(cursor) if cursor else None)
+        total = count_events(event_type=event_types, where=where)
         
         # Format logs for HSM console
         formatted_logs = []
         for log in logs:
-            # Determine operation type
-            operation = 'SIGN' if 'sign' in log.event_type else 'VERIFY'
-            
-            # Apply filter
-            if filter_type == 'sign' and operation != 'SIGN':
-                continue
-            if filter_type == 'verify' and operation != 'VERIFY':
-                continue
-            if filter_type == 'success' and log.result not in ['SUCCESS', 'VERIFIED', 'PASS']:
-                continue
-            if filter_type == 'failed' and log.result in ['SUCCESS', 'VERIFIED', 'PASS']:
-                continue
-            
+            operation = 'SIGN' if log['event_type'] in SIGN_EVENT_TYPES else 'VERIFY'
             formatted_logs.append({
-                'timestamp': log.timestamp.isoformat(),
+                'log_id': log['log_id'],
+                'timestamp': log['timestamp'],
                 'operation': operation,
-                'user_id': log.user_id or 'N/A',
-                'pass_id': log.pass_id or None,
-                'gate_id': log.gate_id or None,
-                'status': log.result or 'UNKNOWN',
-                'details': log.details or f'{operation} operation completed'
+                'user_id': log['user_id'] or 'N/A',
+                'pass_id': log['pass_id'] or None,
+                'gate_id': log['gate_id'] or None,
+                'status': log['result'] or 'UNKNOWN',
+                'details': log['details'] or f'{operation} operation completed'
             })
         
-        return jsonify({'logs': formatted_logs}), 200
+        return jsonify({
+            'logs': formatted_logs,
+            'total': total,
+            'next_cursor': str(logs[-1]['log_id']) if len(logs) == limit else None
+        }), 200
         
     except Exception as e:
         logger.error(f"[HSM] Get signature logs error: {e}", exc_info=True)
@@ -0,0 +1,134 @@
+"""
+Priority admission control for iAmSmartGate
+Every request falls into a class from Config.ADMISSION_CLASSES:
+  critical  scan and gate login; always admitted
+  normal    everything not listed; waits up to ADMISSION_DEFER_SECONDS for a slot
+  low       admin lists, reports and exports; shed at once while the scan path is slow
+Each worker counts its in-flight requests per class. Non-critical requests may
+only use ADMISSION_MAX_IN_FLIGHT - ADMISSION_RESERVED slots (low ones at most
+ADMISSION_LOW_MAX), so scans always find room. A scan slower than
+ADMISSION_SCAN_TARGET_MS, or any request that queued in front of the worker
+longer than ADMISSION_QUEUE_TARGET_MS (from the proxy's X-Request-Start),
+marks the worker overloaded for ADMISSION_COOLDOWN_SECONDS. Shed requests get
+a fast 503 with Retry-After and are counted in iamsmartgate_admission_shed_total.
+"""
+import logging
+import threading
+import time
+from flask import g, jsonify, request
+from config import Config
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_SHED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CLASSES = ('critical', 'normal', 'low')
+
+def route_class(endpoint):
+    """Admission class of an endpoint, or None for exempt ones (event streams, health, metrics)"""
+    if endpoint is None or endpoint in Config.ADMISSION_EXEMPT:
+        return None
+    return Config.ADMISSION_CLASSES.get(endpoint, 'normal')
+
+def queue_delay(header, now):
+    """Seconds since the proxy received the request, from X-Request-Start (s, ms or us since the epoch)"""
+    try:
+        started = float(header.replace('t=', '').strip())
+    except (AttributeError, ValueError):
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, now - started)
+
+class AdmissionController:
+    """In-flight slots per class and the overload flag for one worker process"""
+    
+    def __init__(self):
+        self.in_flight = dict.fromkeys(CLASSES, 0)
+        self.overloaded_until = 0.0
+        self._condition = threading.Condition()
+    
+    def _has_slot(self, cls):
+        shared = self.in_flight['normal'] + self.in_flight['low']
+        if shared >= Config.ADMISSION_MAX_IN_FLIGHT - Config.ADMISSION_RESERVED:
+            return False
+        return cls != 'low' or self.in_flight['low'] < Config.ADMISSION_LOW_MAX
+    
+    def overloaded(self):
+        return time.monotonic() < self.overloaded_until
+    
+    def breach(self, reason):
+        """Mark the worker overloaded for the cooldown period"""
+        if not self.overloaded():
+            logger.warning(f"[ADMISSION] Overloaded ({reason}), shedding low-priority requests")
+        self.overloaded_until = time.monotonic() + Config.ADMISSION_COOLDOWN_SECONDS
+    
+    def acquire(self, cls):
+        """Take a slot for a request, or return the reason it is shed"""
+        if cls == 'low' and self.overloaded():
+            return 'latency'
+        with self._condition:
+            if cls != 'critical':
+                deadline = time.monotonic() + Config.ADMISSION_DEFER_SECONDS
+                while not self._has_slot(cls):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        if not self._has_slot(cls):
+                            return 'capacity'
+            self.in_flight[cls] += 1
+        return None
+    
+    def release(self, cls):
+        with self._condition:
+            self.in_flight[cls] -= 1
+            self._condition.notify_all()
+    
+    def in_flight_by_class(self):
+        return {(cls,): count for cls, count in self.in_flight.items()}
+
+# Global admission controller instance (per worker process)
+admission = AdmissionController()
+
+ADMISSION_IN_FLIGHT.set_function(admission.in_flight_by_class)
+
+def init_app(app):
+    """Admit, defer or shed each request by its class"""
+    if not Config.ADMISSION_ENABLED:
+        return
+    
+    @app.before_request
+    def _admit():
+        cls = route_class(request.endpoint)
+        if cls is None or request.method == 'OPTIONS':
+            return None
+        
+        now = time.time()
+        delay = queue_delay(request.headers.get('X-Request-Start'), now)
+        if delay is not None and delay * 1000 > Config.ADMISSION_QUEUE_TARGET_MS:
+            admission.breach(f'queued {delay * 1000:.0f}ms')
+        
+        start = time.perf_counter()
+        reason = admission.acquire(cls)
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, cls)
+        if reason:
+            ADMISSION_SHED.inc(request.endpoint, cls, reason)
+            logger.debug(f"[ADMISSION] Shed {request.endpoint} ({cls}, {reason})")
+            response = jsonify({'error': 'Server busy, try again shortly', 'retry_after': Config.ADMISSION_RETRY_AFTER})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(Config.ADMISSION_RETRY_AFTER)
+            return response
+        g.admission = (cls, time.perf_counter())
+        return None
+    
+    @app.teardown_request
+    def _release(exc):
+        admitted = g.pop('admission', None)
+        if admitted is None:
+            return
+        cls, start = admitted
+        admission.release(cls)
+        if cls == 'critical' and request.endpoint == 'api.scan_qr':
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > Config.ADMISSION_SCAN_TARGET_MS:
+                admission.breach(f'scan took {elapsed_ms:.0f}ms')
@@ -2,10 +2,19 @@
 API routes for iAmSmartGate
 User and Gate endpoints
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from datetime import datetime, timedelta
-from models import db, User, Gate, Pass, AuditLog, SystemState
+from models import (db, User, Gate, Pass, SystemState, PASS_PROJECTION, mark_pass_changed, get_pass_version,
+                    parse_pass_version, format_pass_version, get_gate_seq)
+from audit_partitions import record_event
 from crypto_utils import hsm
+from pass_state import apply_transition, scan_rejection
+from registry import registry
+from status_index import status_index, unverified_rejects
+from pass_filter import pass_filter, unknown_passes
+from sharding import shard_sites, use_site, route_to_pass, execute_all
+from event_feed import hub, sse_response
+from metrics import SCAN_OUTCOMES, PASS_FILTER_LOOKUPS
 from dummy_integrations import dummy_iamsmart_authenticate, dummy_validate_gps
 import jwt
 import uuid
@@ -15,20 +24,23 @@ from config import Config
 
 api_bp = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
+# High-volume scan path logs; sample with LOG_SAMPLING=api_routes.scan=<rate>
+scan_logger = logging.getLogger(f'{__name__}.scan')
 
 def create_audit_log(event_type, result, user_id=None, gate_id=None, pass_id=None, details=None):
     """Helper to create audit log entry"""
-    log = AuditLog(
-        event_type=event_type,
+    record_event(
+        event_type,
+        result,
         user_id=user_id,
         gate_id=gate_id,
         pass_id=pass_id,
-        result=result,
         details=details
     )
-    db.session.add(log)
     db.session.commit()
-    logger.info(f"[AUDIT] {event_type}: {result} - {details}")
+    if event_type == 'scan':
+        SCAN_OUTCOMES.inc(result)
+    logger.info("[AUDIT] %s: %s - %s", event_type, result, details)
 
 def generate_jwt_token(user_id):
     """Generate JWT token for authentication"""
@@ -174,13 +186,19 @@ def apply_pass():
         if not all([site_id, purpose_id, visit_date_time_str]):
             return jsonify({'error': 'Missing required fields'}), 400
         
+        if not registry.has_site(site_id):
+            return jsonify({'error': 'Unknown site'}), 400
+        if not registry.has_purpose(purpose_id):
+            return jsonify({'error': 'Unknown purpose'}), 400
+        
         # Parse date time
         try:
             visit_date_time = datetime.fromisoformat(visit_date_time_str.replace('Z', '+00:00'))
         except:
             return jsonify({'error': 'Invalid date time format'}), 400
         
-        # Create pass
+        # Create pass (in the site's shard when sharded)
+        use_site(site_id)
         pass_id = f"PASS{uuid.uuid4().hex[:12].upper()}"
         new_pass = Pass(
             pass_id=pass_id,
@@ -192,6 +210,8 @@ def apply_pass():
             device_id=device_id
         )
         db.session.add(new_pass)
+        mark_pass_changed(new_pass)
+        pass_filter.add(pass_id)
         db.session.commit()
         
         create_audit_log('application', 'SUBMITTED', user_id=user_id, pass_id=pass_id, 
@@ -219,17 +239,106 @@ def my_passes():
         if not user_id:
             return jsonify({'error': 'Invalid or expired token'}), 401
         
-        # Get all passes for user
-        passes = Pass.query.filter_by(iamsmart_id=user_id).order_by(Pass.created_timestamp.desc()).all()
+        # Unchanged since the client's copy: answer from the version row alone
+        version = get_pass_version(user_id)
+        etag = f'v{version}'
+        # Weak comparison: compressed responses carry the ETag as W/"..."
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        # Get all passes for user, or only those changed after ?since=<version>
+        # (compared per database when sharded, since each counts its own passes' changes)
+        since = parse_pass_version(request.args.get('since'))
+        stmt = PASS_PROJECTION.select().where(Pass.iamsmart_id == user_id).order_by(Pass.created_timestamp.desc())
+        rows = execute_all(
+            stmt if since is None else lambda index: stmt.where(Pass.change_version > since[index]),
+            order_by=lambda row: row.created_timestamp, reverse=True
+        )
         
-        return jsonify({
-            'passes': [p.to_dict() for p in passes]
-        }), 200
+        body = {
+            'passes': PASS_PROJECTION.dicts(rows),
+            'version': version
+        }
+        if since is not None:
+            body['since'] = format_pass_version(since)
+        
+        response = make_response(jsonify(body), 200)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         logger.error(f"[API] Get passes error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/pass-events', methods=['GET'])
+def pass_events():
+    """Server-Sent Events feed of status changes to the user's passes"""
+    try:
+        # EventSource cannot set headers, so the token may also be passed as ?token=
+        token = request.headers.get('Authorization', '').replace('Bearer ', '') or request.args.get('token', '')
+        
+        # Verify token
+        user_id = verify_jwt_token(token)
+        if not user_id:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        subscription = hub.subscribe(
+            lambda event: event.type == 'pass',
+            last_event_id,
+            topics=[('user', user_id)],
+            audits=False
+        )
+        
+        logger.info(f"[API] Pass event stream opened for user: {user_id}")
+        return sse_response(subscription)
+    
+    except Exception as e:
+        logger.error(f"[API] Pass events error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/gate-events', methods=['GET'])
+def gate_events():
+    """Server-Sent Events feed of revocations, pause toggles and config changes for the gate's site"""
+    try:
+        # EventSource cannot set headers, so the token may also be passed as ?token=
+        token = request.headers.get('Authorization', '').replace('Bearer ', '') or request.args.get('token', '')
+        
+        # Verify token
+        tablet_id = verify_jwt_token(token)
+        gate = Gate.query.filter_by(tablet_id=tablet_id).first() if tablet_id else None
+        if not gate:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+        
+        # Read the sequence before subscribing: anything committed in between arrives
+        # live with a higher site_seq, or shows up to the gate as a gap
+        global_pause = SystemState.query.filter_by(key='global_pause').first()
+        site_pauses = SystemState.query.filter_by(key='site_pauses').first()
+        hello = {
+            'site_id': gate.site_id,
+            'site_seq': get_gate_seq(gate.site_id),
+            'system_paused': bool(global_pause and global_pause.value.lower() == 'true'),
+            'site_paused': bool(site_pauses and json.loads(site_pauses.value).get(gate.site_id))
+        }
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        subscription = hub.subscribe(
+            lambda event: event.type == 'gate',
+            last_event_id,
+            topics=[('site', gate.site_id)],
+            audits=False
+        )
+        
+        logger.info(f"[API] Gate event stream opened for gate: {tablet_id} ({gate.site_id})")
+        return sse_response(subscription, initial=[('hello', hello)])
+    
+    except Exception as e:
+        logger.error(f"[API] Gate events error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/get-qr/<pass_id>', methods=['GET'])
 def get_qr(pass_id):
     """Generate dynamic QR code for pass"""
@@ -242,6 +351,7 @@ def get_qr(pass_id):
             return jsonify({'error': 'Invalid or expired token'}), 401
         
         # Get pass
+        route_to_pass(pass_id)
         pass_obj = Pass.query.filter_by(pass_id=pass_id, iamsmart_id=user_id).first()
         if not pass_obj:
             return jsonify({'error': 'Pass not found'}), 404
@@ -277,6 +387,7 @@ def get_qr(pass_id):
         
         # Store signature in pass
         pass_obj.qr_signature = signature
+        mark_pass_changed(pass_obj)
         db.session.commit()
         
         logger.info(f"[API] QR code generated for pass: {pass_id}")
@@ -291,6 +402,24 @@ def get_qr(pass_id):
         logger.error(f"[API] Get QR error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def unknown_pass(gate_id, pass_id):
+    """Scan response for an ID that is not a pass; audited in aggregate by the unknown_pass_flush job"""
+    unknown_passes.record(gate_id, pass_id)
+    SCAN_OUTCOMES.inc('PASS_NOT_FOUND')
+    scan_logger.warning("[API] Pass not found: %s", pass_id)
+    return jsonify({'result': 'No Pass', 'reason': 'Pass not found'}), 200
+
+def unverified_reject(gate_id, pass_id):
+    """
+    Scan response for a pass the status index holds used, revoked, rejected or
+    expired; the QR is not verified yet, so it reveals no status and is audited
+    in aggregate by the unknown_pass_flush job
+    """
+    unverified_rejects.record(gate_id, pass_id)
+    SCAN_OUTCOMES.inc('UNVERIFIED_REJECT')
+    scan_logger.warning("[API] Scan rejected from status index for pass: %s", pass_id)
+    return jsonify({'result': 'No Pass', 'reason': 'Pass not valid'}), 200
+
 @api_bp.route('/scan-qr', methods=['POST'])
 def scan_qr():
     """Validate scanned QR code"""
@@ -307,7 +436,7 @@ def scan_qr():
         if not qr_payload_str:
             return jsonify({'error': 'Missing QR payload'}), 400
         
-        logger.info(f"[API] QR scan by gate: {gate_id}")
+        scan_logger.info("[API] QR scan by gate: %s", gate_id)
         
         # Parse minimal QR payload
         try:
@@ -316,23 +445,42 @@ def scan_qr():
             timestamp = qr_payload['t']    # timestamp
             signature = qr_payload['s']    # signature
         except Exception as e:
-            logger.error(f"[API] Invalid QR format: {e}")
+            scan_logger.error("[API] Invalid QR format: %s", e)
             return jsonify({'result': 'No Pass', 'reason': 'Invalid QR format'}), 400
         
+        # Junk and forged IDs are turned away by the filter, logged per gate in aggregate
+        if not pass_filter.might_contain(pass_id):
+            PASS_FILTER_LOOKUPS.inc('absent')
+            return unknown_pass(gate_id, pass_id)
+        PASS_FILTER_LOOKUPS.inc('present')
+        
+        # Used, revoked, rejected and expired passes are turned away by the shared index before the
+        # pass and user reads; nothing is verified yet, so the reply and the audit carry no status
+        indexed = status_index.lookup(pass_id)
+        if indexed and status_index.is_final(indexed, datetime.utcnow()):
+            return unverified_reject(gate_id, pass_id)
+        
+        # Sharded storage: the gate's site database is searched first
+        gate = Gate.query.filter_by(tablet_id=gate_id).first() if shard_sites() else None
+        if gate:
+            use_site(gate.site_id)
+        
         # Fetch pass from database
         pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
+        if not pass_obj and gate and route_to_pass(pass_id):
+            # A pass of another site: not a filter false positive, checked in its own database
+            PASS_FILTER_LOOKUPS.inc('other_shard')
+            pass_obj = Pass.query.filter_by(pass_id=pass_id).first()
         if not pass_obj:
-            create_audit_log('scan', 'PASS_NOT_FOUND', gate_id=gate_id, pass_id=pass_id, 
-                           details='Pass not found in database')
-            logger.warning(f"[API] Pass not found: {pass_id}")
-            return jsonify({'result': 'No Pass', 'reason': 'Pass not found'}), 200
+            PASS_FILTER_LOOKUPS.inc('false_positive')
+            return unknown_pass(gate_id, pass_id)
         
         # Fetch user's public key from database
         user = User.query.filter_by(iamsmart_id=pass_obj.iamsmart_id).first()
         if not user:
             create_audit_log('scan', 'USER_NOT_FOUND', gate_id=gate_id, pass_id=pass_id, 
                            details=f'User {pass_obj.iamsmart_id} not found')
-            logger.warning(f"[API] User not found: {pass_obj.iamsmart_id}")
+            scan_logger.warning("[API] User not found: %s", pass_obj.iamsmart_id)
             return jsonify({'result': 'No Pass', 'reason': 'User not found'}), 200
         
         # Verify signature using public key from database
@@ -340,7 +488,7 @@ def scan_qr():
         if not hsm.verify_signature(user.public_key, data_to_verify, signature):
             create_audit_log('scan', 'INVALID_SIGNATURE', gate_id=gate_id, pass_id=pass_id, 
                            details='Signature verification failed')
-            logger.warning(f"[API] Invalid signature for pass: {pass_id}")
+            scan_logger.warning("[API] Invalid signature for pass: %s", pass_id)
             return jsonify({'result': 'No Pass', 'reason': 'Invalid signature'}), 200
         
         # Check QR timestamp (1 minute expiration)
@@ -350,7 +498,7 @@ def scan_qr():
             if age > Config.QR_EXPIRATION_SECONDS:
                 create_audit_log('scan', 'EXPIRED_QR', gate_id=gate_id, pass_id=pass_id, 
                                details=f'QR age: {age}s')
-                logger.warning(f"[API] Expired QR for pass: {pass_id} (age: {age}s)")
+                scan_logger.warning("[API] Expired QR for pass: %s (age: %ss)", pass_id, age)
                 return jsonify({'result': 'No Pass', 'reason': 'QR code expired'}), 200
         except:
             pass
@@ -360,58 +508,32 @@ def scan_qr():
         if global_pause and global_pause.value.lower() == 'true':
             create_audit_log('scan', 'SYSTEM_PAUSED', gate_id=gate_id, pass_id=pass_id, 
                            details='Global pause active')
-            logger.warning(f"[API] System paused - denying access")
+            scan_logger.warning("[API] System paused - denying access")
             return jsonify({'result': 'No Pass', 'reason': 'System is paused'}), 200
         
         site_pauses = SystemState.query.filter_by(key='site_pauses').first()
         if site_pauses:
             pauses = json.loads(site_pauses.value)
-            gate = Gate.query.filter_by(tablet_id=gate_id).first()
+            gate = gate or Gate.query.filter_by(tablet_id=gate_id).first()
             if gate and gate.site_id in pauses and pauses[gate.site_id]:
                 create_audit_log('scan', 'SITE_PAUSED', gate_id=gate_id, pass_id=pass_id, 
                                details=f'Site {gate.site_id} paused')
-                logger.warning(f"[API] Site {gate.site_id} paused - denying access")
+                scan_logger.warning("[API] Site %s paused - denying access", gate.site_id)
                 return jsonify({'result': 'No Pass', 'reason': f'Site is paused'}), 200
         
-        # Re-fetch pass with lock for atomic transaction
-        pass_obj = Pass.query.filter_by(pass_id=pass_id).with_for_update().first()
-        
-        # Check pass status
-        if pass_obj.status != 'Pass':
-            create_audit_log('scan', 'NOT_APPROVED', gate_id=gate_id, pass_id=pass_id, 
-                           details=f'Status: {pass_obj.status}')
-            logger.warning(f"[API] Pass not approved: {pass_id} (status: {pass_obj.status})")
-            return jsonify({'result': 'No Pass', 'reason': f'Pass not approved'}), 200
-        
-        if pass_obj.used_flag:
-            create_audit_log('scan', 'ALREADY_USED', gate_id=gate_id, pass_id=pass_id, 
-                           details='Pass already used')
-            logger.warning(f"[API] Pass already used: {pass_id}")
-            return jsonify({'result': 'No Pass', 'reason': 'Pass already used'}), 200
-        
-        if pass_obj.revoked_flag:
-            create_audit_log('scan', 'REVOKED', gate_id=gate_id, pass_id=pass_id, 
-                           details='Pass revoked')
-            logger.warning(f"[API] Pass revoked: {pass_id}")
-            return jsonify({'result': 'Revoked', 'reason': 'Pass has been revoked'}), 200
-        
-        # Check expiry
-        if pass_obj.expiry_timestamp and datetime.utcnow() > pass_obj.expiry_timestamp:
-            create_audit_log('scan', 'EXPIRED', gate_id=gate_id, pass_id=pass_id, 
-                           details='Pass expired')
-            logger.warning(f"[API] Pass expired: {pass_id}")
-            return jsonify({'result': 'No Pass', 'reason': 'Pass expired'}), 200
-        
-        # Mark as used
-        pass_obj.used_flag = True
-        pass_obj.used_timestamp = datetime.utcnow()
-        pass_obj.status = 'Used'
-        db.session.commit()
+        # Mark as used: one conditional UPDATE, so of two concurrent scans exactly one wins
+        now = datetime.utcnow()
+        if not apply_transition('use', [pass_id], now=now):
+            db.session.refresh(pass_obj)
+            audit_result, result, reason, details = scan_rejection(pass_obj, now)
+            create_audit_log('scan', audit_result, gate_id=gate_id, pass_id=pass_id, details=details)
+            scan_logger.warning("[API] Scan rejected for pass: %s (%s)", pass_id, audit_result)
+            return jsonify({'result': result, 'reason': reason}), 200
         
         create_audit_log('scan', 'PASS', gate_id=gate_id, pass_id=pass_id, user_id=pass_obj.iamsmart_id,
                         details=f'Site: {pass_obj.site_id}, Purpose: {pass_obj.purpose_id}')
         
-        logger.info(f"[API] Access granted for pass: {pass_id}")
+        scan_logger.info("[API] Access granted for pass: %s", pass_id)
         
         return jsonify({
             'result': 'Pass',
@@ -425,7 +547,7 @@ def scan_qr():
         }), 200
         
     except Exception as e:
-        logger.error(f"[API] Scan QR error: {e}", exc_info=True)
+        scan_logger.error("[API] Scan QR error: %s", e, exc_info=True)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
@@ -450,12 +572,32 @@ def user_info():
         logger.error(f"[API] User info error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def registry_response(kind):
+    """Active sites or purposes, cacheable until the registry version changes"""
+    snapshot = registry.snapshot()
+    etag = f'r{snapshot.version}'
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(jsonify({kind: registry.names(kind, snapshot)}), 200)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={Config.REGISTRY_MAX_AGE}'
+    return response
+
 @api_bp.route('/sites', methods=['GET'])
 def get_sites():
     """Get available sites"""
-    return jsonify({'sites': Config.SITES}), 200
+    try:
+        return registry_response('sites')
+    except Exception as e:
+        logger.error(f"[API] Get sites error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/purposes', methods=['GET'])
 def get_purposes():
     """Get available purposes"""
-    return jsonify({'purposes': Config.PURPOSES}), 200
+    try:
+        return registry_response('purposes')
+    except Exception as e:
+        logger.error(f"[API] Get purposes error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
@@ -11,17 +11,25 @@ from models import db, init_db
 from api_routes import api_bp
 from admin_routes import admin_bp
 from background_jobs import start_background_jobs
+from event_feed import hub
+from shard_outbox import relay
+from registry import registry
+from status_index import status_index
+from pass_filter import pass_filter
+import metrics
+import compression
+import profiling
+import admission
+import rate_limit
+import query_budget
+import serialization
+import read_routing
+import sharding
 from config import Config
+from logging_setup import configure_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.FileHandler('server.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 def create_app():
@@ -30,19 +38,56 @@ def create_app():
         app = Flask(__name__)
         app.config.from_object(Config)
         
+        # orjson/MessagePack responses for jsonify()
+        serialization.init_app(app)
+        
         # Enable CORS for all origins (for demo purposes)
         CORS(app, resources={r"/*": {"origins": "*"}})
         
-        # Initialize database
+        # Initialize database (admin reads get their own read-only engine, sharded sites their own database)
+        read_routing.configure(app)
+        sharding.configure(app)
         db.init_app(app)
         with app.app_context():
+            read_routing.use_wal(app)
             init_db()
+            registry.snapshot()
+            status_index.rebuild()
+            pass_filter.rebuild()
             logger.info("Database initialized")
         
         # Register blueprints
         app.register_blueprint(api_bp, url_prefix='/api')
         app.register_blueprint(admin_bp, url_prefix='/admin')
         
+        # Send read-only routes to the read engine
+        read_routing.init_app(app)
+        
+        # gzip/brotli for clients that accept it (after_request hooks run in reverse,
+        # so registering first makes it see the final response)
+        compression.init_app(app)
+        
+        # Request timing and /metrics
+        metrics.init_app(app)
+        
+        # Token buckets for scan, QR and login (after metrics, so 429s are timed too)
+        rate_limit.init_app(app)
+        
+        # Reserve capacity for scans, shed low-priority reads under overload
+        admission.init_app(app)
+        
+        # Opt-in request profiling (no hooks unless enabled)
+        profiling.init_app(app)
+        
+        # SQL statement counts and per-route budgets
+        query_budget.init_app(app)
+        
+        # Push event feed (poller thread starts with the first subscriber)
+        hub.init_app(app)
+        
+        # Copies sharded sites' audit and change events to the primary (only with shards)
+        relay.init_app(app)
+        
         # Health check endpoint
         @app.route('/health')
         def health():
@@ -0,0 +1,374 @@
+"""
+Time-partitioned audit log storage for iAmSmartGate
+Audit events go to one table per UTC day (audit_logs_YYYYMMDD) so retention
+drops whole partitions instead of running one large DELETE
+"""
+import gzip
+import json
+import os
+import re
+import threading
+import logging
+from collections import deque
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime, Text, inspect, select, func
+from models import db, AuditLog, queue_outbox
+from sharding import current_shard
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = 'audit_logs_'
+PARTITION_PATTERN = re.compile(r'^audit_logs_(\d{8})$')
+ARCHIVE_SUFFIX = '.ndjson.gz'
+
+# Public log IDs encode the partition: day ordinal * ID_SPAN + partition row id
+ID_SPAN = 1_000_000_000
+EPOCH = date(1970, 1, 1)
+
+_metadata = MetaData()
+_tables = {}
+_known = set()
+_lock = threading.Lock()
+
+def partition_name(day):
+    """Table name for the partition holding a given day"""
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def partition_table(day):
+    """Table object for a day partition (does not create it)"""
+    name = partition_name(day)
+    with _lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Table(
+                name, _metadata,
+                Column('log_id', Integer, primary_key=True, autoincrement=True),
+                Column('timestamp', DateTime, nullable=False),
+                Column('event_type', String(50), nullable=False),
+                Column('user_id', String(100)),
+                Column('gate_id', String(100)),
+                Column('pass_id', String(100)),
+                Column('result', String(50)),
+                Column('details', Text),
+                Index(f'ix_{name}_event_result', 'event_type', 'result')
+            )
+            _tables[name] = table
+    return table
+
+def to_log_id(day, row_id):
+    """Build the public log ID for a partition row"""
+    return (day - EPOCH).days * ID_SPAN + row_id
+
+def split_log_id(log_id):
+    """Split a public log ID into (day, partition row id)"""
+    days, row_id = divmod(int(log_id), ID_SPAN)
+    return EPOCH + timedelta(days=days), row_id
+
+def row_to_dict(day, row):
+    """Serialize a partition row like AuditLog.to_dict()"""
+    return {
+        'log_id': to_log_id(day, row.log_id),
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'event_type': row.event_type,
+        'user_id': row.user_id,
+        'gate_id': row.gate_id,
+        'pass_id': row.pass_id,
+        'result': row.result,
+        'details': row.details
+    }
+
+def list_partitions():
+    """Return the days that currently have a partition table, oldest first"""
+    days = []
+    for name in inspect(db.engine).get_table_names():
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            days.append(datetime.strptime(match.group(1), '%Y%m%d').date())
+    with _lock:
+        _known.clear()
+        _known.update(partition_name(day) for day in days)
+    return sorted(days)
+
+def ensure_indexes():
+    """Add indexes to partitions created before the index was defined"""
+    for day in list_partitions():
+        for index in partition_table(day).indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ensure_partition(day):
+    """Create the partition for a day if it does not exist yet"""
+    table = partition_table(day)
+    if table.name not in _known:
+        table.create(bind=db.engine, checkfirst=True)
+        with _lock:
+            _known.add(table.name)
+    return table
+
+def _session_partition(day):
+    """Partition table for a day, created on the session connection if missing"""
+    table = partition_table(day)
+    if table.name not in _known:
+        # Create on the session connection so an open write transaction does not deadlock;
+        # only cache tables that already existed, since this DDL may still roll back
+        conn = db.session.connection()
+        if inspect(conn).has_table(table.name):
+            with _lock:
+                _known.add(table.name)
+        else:
+            table.create(bind=conn)
+    return table
+
+def record_event(event_type, result, user_id=None, gate_id=None, pass_id=None, details=None, timestamp=None):
+    """Add an audit event to the current session (caller commits)"""
+    record_events([{
+        'event_type': event_type,
+        'result': result,
+        'user_id': user_id,
+        'gate_id': gate_id,
+        'pass_id': pass_id,
+        'details': details,
+        'timestamp': timestamp
+    }])
+
+def record_events(events):
+    """
+    Add a batch of audit events (record_event keyword dicts) with one insert per
+    partition, or to the outbox of the shard the session is routed to
+    """
+    by_day = {}
+    for event in events:
+        row = {field: event.get(field) for field in ('event_type', 'user_id', 'gate_id', 'pass_id', 'result', 'details')}
+        row['timestamp'] = event.get('timestamp') or datetime.utcnow()
+        by_day.setdefault(row['timestamp'].date(), []).append(row)
+    
+    if current_shard() is not None:
+        # Relayed to the partitions by shard_outbox.py, keeping their timestamps
+        queue_outbox('audit', [
+            ({field: value for field, value in row.items() if field != 'timestamp'}, row['timestamp'])
+            for rows in by_day.values() for row in rows
+        ])
+        return
+    for day, rows in by_day.items():
+        db.session.execute(_session_partition(day).insert(), rows)
+
+def _days_in_range(days, start=None, end=None):
+    """Filter days to those a [start, end] time range touches, newest first"""
+    return sorted(
+        (day for day in days
+         if (start is None or day >= start.date()) and (end is None or day <= end.date())),
+        reverse=True
+    )
+
+def _matches(log, event_type, start, end):
+    """Apply query filters to an archived log dict"""
+    if event_type:
+        types = [event_type] if isinstance(event_type, str) else event_type
+        if log['event_type'] not in types:
+            return False
+    timestamp = datetime.fromisoformat(log['timestamp'])
+    if start and timestamp < start:
+        return False
+    if end and timestamp > end:
+        return False
+    return True
+
+def _sources(include_archived=False):
+    """Map each stored day to 'table' or 'archive' (tables win if both exist)"""
+    sources = {day: 'table' for day in list_partitions()}
+    if include_archived:
+        for day in list_archives():
+            sources.setdefault(day, 'archive')
+    return sources
+
+def _select_events(table, event_type=None, start=None, end=None, where=None):
+    """Build a filtered select over one partition"""
+    stmt = select(table)
+    if event_type:
+        if isinstance(event_type, str):
+            stmt = stmt.where(table.c.event_type == event_type)
+        else:
+            stmt = stmt.where(table.c.event_type.in_(event_type))
+    if start:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end:
+        stmt = stmt.where(table.c.timestamp <= end)
+    if where is not None:
+        stmt = stmt.where(*where(table))
+    return stmt
+
+def query_events(start=None, end=None, event_type=None, limit=100, include_archived=False,
+                 before_id=None, where=None):
+    """
+    Return the newest audit events in a time range, newest first
+    Only partitions (and archives) whose day falls in the range are read;
+    before_id continues a previous page, where(table) adds SQL predicates
+    """
+    before_day, before_row = split_log_id(before_id) if before_id else (None, 0)
+    sources = _sources(include_archived)
+    
+    logs = []
+    for day in _days_in_range(sources, start, end):
+        remaining = limit - len(logs)
+        if remaining <= 0:
+            break
+        if before_day and day > before_day:
+            continue
+        
+        if sources[day] == 'archive':
+            newest = deque(maxlen=remaining)
+            for log in iter_archive(day):
+                if before_day == day and log['log_id'] >= before_id:
+                    break
+                if _matches(log, event_type, start, end):
+                    newest.append(log)
+            logs.extend(reversed(newest))
+            continue
+        
+        table = partition_table(day)
+        stmt = _select_events(table, event_type, start, end, where)
+        if before_day == day:
+            stmt = stmt.where(table.c.log_id < before_row)
+        stmt = stmt.order_by(table.c.log_id.desc()).limit(remaining)
+        logs.extend(row_to_dict(day, row) for row in db.session.execute(stmt))
+    
+    return logs
+
+def count_events(start=None, end=None, event_type=None, where=None):
+    """Count matching audit events across the partitions a range touches"""
+    total = 0
+    for day in _days_in_range(list_partitions(), start, end):
+        table = partition_table(day)
+        stmt = _select_events(table, event_type, start, end, where).with_only_columns(func.count())
+        total += db.session.execute(stmt).scalar()
+    return total
+
+def iter_events(start=None, end=None, event_type=None, after_id=None, where=None, match=None,
+                include_archived=False, chunk_size=500):
+    """
+    Yield audit events oldest first in keyset-paginated chunks
+    where(table) adds SQL predicates for partitions, match(log) filters archived rows;
+    the session is released between chunks so long exports never pin a read transaction
+    """
+    after_day, after_row = split_log_id(after_id) if after_id else (None, 0)
+    sources = _sources(include_archived)
+    
+    for day in reversed(_days_in_range(sources, start, end)):
+        if after_day and day < after_day:
+            continue
+        last_row = after_row if day == after_day else 0
+        
+        if sources[day] == 'archive':
+            for log in iter_archive(day):
+                if log['log_id'] <= to_log_id(day, last_row):
+                    continue
+                if _matches(log, event_type, start, end) and (match is None or match(log)):
+                    yield log
+            continue
+        
+        table = partition_table(day)
+        while True:
+            stmt = _select_events(table, event_type, start, end, where).where(
+                table.c.log_id > last_row
+            ).order_by(table.c.log_id).limit(chunk_size)
+            rows = db.session.execute(stmt).all()
+            db.session.close()
+            
+            for row in rows:
+                yield row_to_dict(day, row)
+            if len(rows) < chunk_size:
+                break
+            last_row = rows[-1].log_id
+
+def archive_path(day):
+    """Compressed archive file for a partition"""
+    return os.path.join(Config.AUDIT_ARCHIVE_DIR, partition_name(day) + ARCHIVE_SUFFIX)
+
+def list_archives():
+    """Return the days that have an archive file, oldest first"""
+    if not os.path.isdir(Config.AUDIT_ARCHIVE_DIR):
+        return []
+    days = []
+    for filename in os.listdir(Config.AUDIT_ARCHIVE_DIR):
+        if filename.endswith(ARCHIVE_SUFFIX):
+            match = PARTITION_PATTERN.match(filename[:-len(ARCHIVE_SUFFIX)])
+            if match:
+                days.append(datetime.strptime(match.group(1), '%Y%m%d').date())
+    return sorted(days)
+
+def iter_archive(day):
+    """Yield archived audit events for a day, oldest first"""
+    with gzip.open(archive_path(day), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def archive_partition(day):
+    """Write a partition to a gzip-compressed NDJSON file"""
+    os.makedirs(Config.AUDIT_ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(day)
+    tmp_path = path + '.tmp'
+    table = partition_table(day)
+    
+    count = 0
+    with db.engine.connect() as conn, gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        result = conn.execution_options(stream_results=True).execute(
+            select(table).order_by(table.c.log_id)
+        )
+        for row in result:
+            f.write(json.dumps(row_to_dict(day, row)) + '\n')
+            count += 1
+    
+    os.replace(tmp_path, path)
+    logger.info(f"[AUDIT] Archived {count} events from {table.name} to {path}")
+    return count
+
+def drop_expired_partitions(retention_days, archive=False):
+    """Drop (and optionally archive) partitions older than the retention window"""
+    cutoff = datetime.utcnow().date() - timedelta(days=retention_days)
+    dropped = 0
+    
+    for day in list_partitions():
+        if day >= cutoff:
+            break
+        if archive:
+            archive_partition(day)
+        table = partition_table(day)
+        table.drop(bind=db.engine, checkfirst=True)
+        with _lock:
+            _known.discard(table.name)
+        dropped += 1
+        logger.info(f"[AUDIT] Dropped partition {table.name}")
+    
+    return dropped
+
+def migrate_legacy_rows():
+    """Move rows from the unpartitioned audit_logs table into day partitions"""
+    legacy = AuditLog.__table__
+    first, last = db.session.execute(
+        select(func.min(legacy.c.timestamp), func.max(legacy.c.timestamp))
+    ).one()
+    if first is None:
+        return 0
+    
+    columns = [name for name in legacy.c.keys() if name != 'log_id']
+    moved = 0
+    day = first.date()
+    while day <= last.date():
+        lower = datetime.combine(day, time.min)
+        upper = lower + timedelta(days=1)
+        in_day = (legacy.c.timestamp >= lower, legacy.c.timestamp < upper)
+        
+        if db.session.execute(select(func.count()).select_from(legacy).where(*in_day)).scalar():
+            table = ensure_partition(day)
+            moved += db.session.execute(table.insert().from_select(
+                columns,
+                select(*[legacy.c[name] for name in columns]).where(*in_day).order_by(legacy.c.log_id)
+            )).rowcount
+            db.session.execute(legacy.delete().where(*in_day))
+            db.session.commit()
+        
+        day += timedelta(days=1)
+    
+    logger.info(f"[AUDIT] Migrated {moved} legacy audit logs into partitions")
+    return moved
@@ -4,29 +4,28 @@ Background jobs for iAmSmartGate
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
 import logging
+from metrics import JOB_SECONDS
 
 logger = logging.getLogger(__name__)
 
+@JOB_SECONDS.time('pass_expiration_check')
 def pass_expiration_check(app):
     """Check and mark expired passes"""
     with app.app_context():
-        from models import db, Pass
+        from models import db
+        from pass_state import apply_transition
+        from sharding import each_shard
         
         try:
-            # Find passes that have expired
-            expired_passes = Pass.query.filter(
-                Pass.status == 'Pass',
-                Pass.expiry_timestamp <= datetime.utcnow(),
-                Pass.used_flag == False
-            ).all()
-            
+            # One conditional UPDATE and commit per shard, so a pass scanned in the meantime is never marked expired
             count = 0
-            for pass_obj in expired_passes:
-                pass_obj.status = 'Expired'
-                count += 1
+            for _ in each_shard():
+                expired = apply_transition('expire')
+                if expired:
+                    db.session.commit()
+                    count += len(expired)
             
             if count > 0:
-                db.session.commit()
                 logger.info(f"[BACKGROUND] Marked {count} passes as expired")
             else:
                 logger.debug(f"[BACKGROUND] No passes to expire")
@@ -35,27 +34,81 @@ def pass_expiration_check(app):
             logger.error(f"[BACKGROUND] Pass expiration check error: {e}", exc_info=True)
             db.session.rollback()
 
+@JOB_SECONDS.time('audit_log_cleanup')
 def audit_log_cleanup(app):
-    """Clean up old audit logs"""
+    """Drop expired audit log partitions and pre-create tomorrow's"""
     with app.app_context():
-        from models import db, AuditLog
+        from models import db
         from config import Config
+        from audit_partitions import drop_expired_partitions, ensure_partition
         
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=Config.AUDIT_LOG_RETENTION_DAYS)
+            ensure_partition(datetime.utcnow().date() + timedelta(days=1))
             
-            deleted = AuditLog.query.filter(AuditLog.timestamp < cutoff_date).delete()
+            dropped = drop_expired_partitions(
+                Config.AUDIT_LOG_RETENTION_DAYS,
+                archive=Config.AUDIT_ARCHIVE_ENABLED
+            )
             
-            if deleted > 0:
-                db.session.commit()
-                logger.info(f"[BACKGROUND] Cleaned up {deleted} old audit logs")
+            if dropped > 0:
+                logger.info(f"[BACKGROUND] Dropped {dropped} expired audit log partitions")
             else:
-                logger.debug(f"[BACKGROUND] No audit logs to clean up")
+                logger.debug(f"[BACKGROUND] No audit log partitions to drop")
                 
         except Exception as e:
             logger.error(f"[BACKGROUND] Audit log cleanup error: {e}", exc_info=True)
             db.session.rollback()
 
+@JOB_SECONDS.time('change_event_cleanup')
+def change_event_cleanup(app):
+    """Trim change events older than the push feed replay window"""
+    with app.app_context():
+        from models import db, ChangeEvent
+        from config import Config
+        
+        try:
+            cutoff = datetime.utcnow() - timedelta(hours=Config.CHANGE_EVENT_RETENTION_HOURS)
+            deleted = ChangeEvent.query.filter(ChangeEvent.created_at < cutoff).delete()
+            db.session.commit()
+            if deleted > 0:
+                logger.info(f"[BACKGROUND] Trimmed {deleted} old change events")
+        
+        except Exception as e:
+            logger.error(f"[BACKGROUND] Change event cleanup error: {e}", exc_info=True)
+            db.session.rollback()
+
+@JOB_SECONDS.time('pass_filter_rebuild')
+def pass_filter_rebuild(app):
+    """Rebuild the unknown pass ID filter from the passes table"""
+    with app.app_context():
+        from models import db
+        from pass_filter import pass_filter
+        
+        try:
+            pass_filter.rebuild()
+        except Exception as e:
+            logger.error(f"[BACKGROUND] Pass filter rebuild error: {e}", exc_info=True)
+        finally:
+            db.session.rollback()
+
+@JOB_SECONDS.time('unknown_pass_flush')
+def unknown_pass_flush(app):
+    """Write the aggregated unknown pass ID and unverified reject audit rows"""
+    with app.app_context():
+        from models import db
+        from pass_filter import unknown_passes
+        from status_index import unverified_rejects
+        
+        try:
+            count = unknown_passes.flush() + unverified_rejects.flush()
+            if count > 0:
+                db.session.commit()
+                logger.info(f"[BACKGROUND] Logged {count} unknown pass ID and unverified reject scans")
+        
+        except Exception as e:
+            logger.error(f"[BACKGROUND] Unknown pass flush error: {e}", exc_info=True)
+            db.session.rollback()
+
 def start_background_jobs(app):
     """Start background scheduler"""
     from config import Config
@@ -83,6 +136,36 @@ def start_background_jobs(app):
         replace_existing=True
     )
     
+    # Change event trim every hour
+    scheduler.add_job(
+        func=lambda: change_event_cleanup(app),
+        trigger='interval',
+        hours=1,
+        id='change_event_cleanup',
+        name='Trim old change events',
+        replace_existing=True
+    )
+    
+    # Unknown pass ID filter rebuild every hour
+    scheduler.add_job(
+        func=lambda: pass_filter_rebuild(app),
+        trigger='interval',
+        seconds=Config.PASS_FILTER_REBUILD_INTERVAL,
+        id='pass_filter_rebuild',
+        name='Rebuild unknown pass ID filter',
+        replace_existing=True
+    )
+    
+    # Aggregated unknown pass ID audit rows every minute
+    scheduler.add_job(
+        func=lambda: unknown_pass_flush(app),
+        trigger='interval',
+        seconds=Config.UNKNOWN_PASS_FLUSH_INTERVAL,
+        id='unknown_pass_flush',
+        name='Log unknown pass ID scans',
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("[BACKGROUND] Background jobs started")
     
@@ -0,0 +1,85 @@
+"""
+Response compression for iAmSmartGate
+Negotiates brotli (when the brotli package is installed) or gzip from
+Accept-Encoding. Buffered responses are compressed when they reach
+COMPRESS_MIN_SIZE; streamed responses (exports) are compressed chunk by chunk
+as they are sent, so the body is never held in memory. Latency-sensitive
+endpoints (COMPRESS_SKIP_ENDPOINTS) and event streams are sent as they are.
+"""
+import zlib
+from flask import request
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIMETYPES = {
+    'application/json', 'application/msgpack', 'application/x-ndjson',
+    'text/csv', 'text/html', 'text/plain', 'text/javascript'
+}
+
+def _compressor(encoding):
+    """(compress, finish) callables for one response body"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=Config.COMPRESS_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(Config.COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+def _compress_stream(chunks, encoding):
+    compress, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            data = compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def choose_encoding():
+    """Best encoding the client accepts, or None"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+def _should_compress(response):
+    if request.method == 'HEAD' or request.endpoint in Config.COMPRESS_SKIP_ENDPOINTS:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in COMPRESS_MIMETYPES
+
+def init_app(app):
+    """Compress eligible responses for clients that accept it"""
+    
+    @app.after_request
+    def _compress_response(response):
+        if not Config.COMPRESS_ENABLED or not _should_compress(response):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding()
+        if not encoding:
+            return response
+        
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < Config.COMPRESS_MIN_SIZE:
+                return response
+            compress, finish = _compressor(encoding)
+            response.set_data(compress(data) + finish())
+        
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity body, so a strong ETag would be wrong
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
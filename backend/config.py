@@ -9,6 +9,33 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///iamsmartgate.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read/write routing: admin reads go to a read-only engine (a replica URL, or
+    # the primary SQLite file opened read-only, only while it is in WAL mode);
+    # writes always use the primary
+    READ_ROUTING_ENABLED = os.environ.get('READ_ROUTING_ENABLED', 'True').lower() == 'true'
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL', '')
+    READ_ONLY_ENDPOINTS = {
+        'admin.pending_passes',
+        'admin.all_passes',
+        'admin.statistics',
+        'admin.audit_logs',
+        'admin.signature_logs',
+        'admin.export_passes',
+        'admin.export_audit_logs'
+    }
+    
+    # Site-sharded pass storage: each site in SHARD_SITES (every registry site at
+    # startup when empty) keeps its passes in its own database; other tables stay
+    # in the primary. Shards are fixed at startup, so a site added later gets one
+    # at the next start. A shard's audit and change events reach the primary
+    # through its outbox, relayed in batches
+    SHARDING_ENABLED = os.environ.get('SHARDING_ENABLED', 'False').lower() == 'true'
+    SHARD_SITES = [site for site in os.environ.get('SHARD_SITES', '').split(',') if site]
+    SHARD_URL_TEMPLATE = os.environ.get('SHARD_URL_TEMPLATE', 'sqlite:///passes_{site_id}.db')
+    SHARD_URLS = {}  # site_id -> database URL, overriding the template
+    OUTBOX_RELAY_INTERVAL = float(os.environ.get('OUTBOX_RELAY_INTERVAL', '0.5'))  # seconds
+    OUTBOX_BATCH_SIZE = 500  # outbox entries relayed per primary transaction
+    
     # JWT settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_EXPIRATION_HOURS = 24
@@ -20,14 +47,143 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
     TEST_MODE = os.environ.get('TEST_MODE', 'True').lower() == 'true'
     
+    # Logging settings
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO').upper()
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')  # per logger, e.g. "apscheduler=WARNING,crypto_utils=INFO"
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')  # share of sub-WARNING records kept, e.g. "api_routes.scan=0.1"
+    LOG_FILE = os.environ.get('LOG_FILE', 'server.log')
+    LOG_QUEUE_SIZE = 10000  # records beyond this are dropped rather than blocking requests
+    
+    # Profiling settings (off unless a sample rate or header secret is set)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # share of requests profiled
+    PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')  # HMAC key for signed X-Profile headers
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_MAX_FILES = 200
+    
+    # Response compression (gzip, or brotli when installed)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'True').lower() == 'true'
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller buffered bodies are sent as they are
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_SKIP_ENDPOINTS = {'api.scan_qr', 'api.gate_login', 'api.get_qr', 'health'}  # latency over size
+    
+    # SQL statement budgets by endpoint: statements per request, or (fixed, per audit
+    # day partition read) for routes that fan out over partitions; checked by query_budget.py
+    SQL_REPEAT_WARN = 5  # same statement this often in one request is logged as a likely N+1
+    SQL_BUDGETS = {
+        'api.login': 4,
+        'api.gate_login': 3,
+        'api.apply_pass': 8,  # includes the periodic registry version check
+        'api.get_sites': 1,
+        'api.get_purposes': 1,
+        'api.my_passes': 2,
+        'api.user_info': 1,
+        'api.get_qr': 7,
+        'api.scan_qr': 15,
+        'admin.pending_passes': 1,
+        'admin.all_passes': 1,
+        'admin.approve_pass': 9,
+        'admin.reject_pass': 9,
+        'admin.revoke_pass': 11,
+        'admin.bulk_update_passes': 10,  # measured revoking passes at two sites
+        'admin.pause_site': 7,
+        'admin.pause_system': 8,
+        'admin.update_registry': 7,
+        'admin.register_gate': 5,
+        'admin.system_status': 2,
+        'admin.statistics': 3,
+        'admin.audit_logs': (1, 1),
+        'admin.signature_logs': (2, 2)  # a page query and a count per partition
+    }
+    
+    # Shared pass status index (memory-mapped file read by every worker)
+    STATUS_INDEX_ENABLED = os.environ.get('STATUS_INDEX_ENABLED', 'True').lower() == 'true'
+    STATUS_INDEX_PATH = os.environ.get('STATUS_INDEX_PATH', 'pass_status.idx')
+    STATUS_INDEX_SLOTS = 1 << 20  # 16-byte records (16 MiB); keep well above the number of passes
+    
+    # Negative lookup filter for unknown pass IDs (Bloom filter file shared by every worker)
+    PASS_FILTER_ENABLED = os.environ.get('PASS_FILTER_ENABLED', 'True').lower() == 'true'
+    PASS_FILTER_PATH = os.environ.get('PASS_FILTER_PATH', 'pass_filter.bloom')
+    PASS_FILTER_CAPACITY = 1000000  # passes before the false-positive rate rises above target
+    PASS_FILTER_FP_RATE = 0.001
+    PASS_FILTER_REBUILD_INTERVAL = 3600  # 1 hour
+    UNKNOWN_PASS_FLUSH_INTERVAL = 60  # seconds between aggregated PASS_NOT_FOUND and UNVERIFIED_REJECT audit rows
+    
+    # Admission control: per-worker slots by route class, reserving room for the scan path
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '32'))
+    ADMISSION_RESERVED = 8  # slots only critical requests may use
+    ADMISSION_LOW_MAX = 4  # concurrent low-priority requests
+    ADMISSION_DEFER_SECONDS = 0.5  # longest wait for a slot before a 503
+    ADMISSION_SCAN_TARGET_MS = 250  # a slower scan sheds low-priority requests
+    ADMISSION_QUEUE_TARGET_MS = 500  # so does a longer wait in front of the worker (X-Request-Start)
+    ADMISSION_COOLDOWN_SECONDS = 5
+    ADMISSION_RETRY_AFTER = 2  # seconds
+    ADMISSION_CLASSES = {
+        'api.scan_qr': 'critical',
+        'api.gate_login': 'critical',
+        'admin.pending_passes': 'low',
+        'admin.all_passes': 'low',
+        'admin.system_status': 'low',
+        'admin.statistics': 'low',
+        'admin.audit_logs': 'low',
+        'admin.signature_logs': 'low',
+        'admin.export_passes': 'low',
+        'admin.export_audit_logs': 'low',
+        'admin.gate_push_stats': 'low',
+        'admin.get_profiles': 'low',
+        'admin.get_profile': 'low',
+        'admin.get_registry': 'low',
+        'admin.query_public_key': 'low'
+    }
+    ADMISSION_EXEMPT = {'api.pass_events', 'api.gate_events', 'admin.admin_events', 'health', 'metrics'}  # long-lived or trivial
+    
+    # Rate limits: per endpoint, token buckets of (key, tokens per second, burst);
+    # key is 'gate' or 'user' (the token subject) or 'ip'
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')  # 'shared': one set of buckets for all workers
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', 'rate_limits.buckets')
+    RATE_LIMIT_SLOTS = 65536  # shared store buckets (24 bytes each)
+    RATE_LIMIT_MAX_KEYS = 100000  # memory store buckets before idle ones are dropped
+    # Proxies appending to X-Forwarded-For (0 when clients connect directly); 'ip' buckets are skipped until set,
+    # since behind an unconfigured proxy every client would share the proxy's bucket
+    RATE_LIMIT_PROXY_HOPS = int(os.environ['RATE_LIMIT_PROXY_HOPS']) if os.environ.get('RATE_LIMIT_PROXY_HOPS') else None
+    RATE_LIMITS = {
+        'api.scan_qr': [('gate', 1, 5), ('ip', 10, 30)],
+        'api.get_qr': [('user', 0.2, 5)],  # each QR is an RSA private-key operation
+        'api.login': [('ip', 2, 30)],
+        'api.gate_login': [('ip', 1, 10)]
+    }
+    
+    # Dummy iAmSmart settings
+    IAMSMART_AUTH_DELAY = float(os.environ.get('IAMSMART_AUTH_DELAY', '0.5'))  # simulated upstream latency, seconds
+    
     # HSM settings (dummy for demo)
     HSM_ENABLED = False  # Dummy HSM
     
+    # Admin settings
+    BULK_MAX_PASSES = 5000  # max passes one bulk approve/reject/revoke may touch
+    
     # Background job settings
     PASS_EXPIRATION_CHECK_INTERVAL = 300  # 5 minutes
     AUDIT_LOG_RETENTION_DAYS = 30
+    AUDIT_ARCHIVE_ENABLED = os.environ.get('AUDIT_ARCHIVE_ENABLED', 'False').lower() == 'true'
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', 'audit_archive')
+    
+    # Push feed settings
+    EVENT_POLL_INTERVAL = float(os.environ.get('EVENT_POLL_INTERVAL', '0.5'))  # seconds
+    EVENT_BACKLOG_LIMIT = 1000  # max events replayed on reconnect
+    SUBSCRIBER_QUEUE_LIMIT = 1000
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_RETRY_MS = 3000
+    CHANGE_EVENT_RETENTION_HOURS = 24
+    GATE_PUSH_TRACK_SECONDS = 60  # deliveries not completed by then count as incomplete
+    
+    # Site and purpose registry (cached per process, revalidated against the database)
+    REGISTRY_CHECK_SECONDS = 5
+    REGISTRY_MAX_AGE = 3600  # Cache-Control max-age for /api/sites and /api/purposes
     
-    # Site definitions
+    # Initial sites, seeded into the sites table when it is empty
     SITES = {
         'SITE001': 'Main Campus',
         'SITE002': 'Student Halls',
@@ -35,7 +191,7 @@ class Config:
         'SITE004': 'Library'
     }
     
-    # Purpose definitions
+    # Initial purposes, seeded into the purposes table when it is empty
     PURPOSES = {
         'PURP001': 'Meeting',
         'PURP002': 'Tour',
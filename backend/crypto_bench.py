@@ -0,0 +1,138 @@
+"""
+Crypto micro-benchmarks for the HSM layer
+Times key generation, signing and verification through the DummyHSM API
+for each RSA key size, and the pieces of the QR verify path (PEM parsing,
+hex decoding, a cached key object). ECDSA P-256 and Ed25519 are timed directly
+with cryptography as a reference for algorithm choices, since DummyHSM only
+issues RSA keys. Results are written as JSON with sorted keys so runs can be
+diffed across releases.
+
+Usage: python crypto_bench.py [--iterations 200] [--key-sizes 2048,3072] [--output bench.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import cryptography
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding
+from crypto_utils import DummyHSM
+
+QR_DATA = 'PASS0123456789AB|2030-01-01T10:00:00.000000'
+
+def measure(func, iterations):
+    """Per-call timings in microseconds, after one warm-up call"""
+    func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': round(statistics.fmean(timings), 1),
+        'p50_us': round(timings[len(timings) // 2], 1),
+        'p95_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 1),
+        'min_us': round(timings[0], 1)
+    }
+
+def bench_rsa(hsm, key_size, iterations):
+    """DummyHSM sign/verify for one RSA key size plus the verify path split into its steps"""
+    keygen_iterations = max(3, iterations // 20)
+    counter = iter(range(keygen_iterations + 1))
+    results = {'keygen': measure(lambda: hsm.generate_key_pair(f'bench_{key_size}_{next(counter)}', key_size), keygen_iterations)}
+    
+    key_id, public_pem = hsm.generate_key_pair(f'bench_{key_size}', key_size)
+    signature_hex = hsm.sign_data(key_id, QR_DATA)
+    signature = bytes.fromhex(signature_hex)
+    public_key = serialization.load_pem_public_key(public_pem.encode())
+    private_key = hsm.keys[key_id]['private_key']
+    pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+    data = QR_DATA.encode()
+    
+    results['sign_hsm_hex'] = measure(lambda: hsm.sign_data(key_id, QR_DATA), iterations)
+    results['sign_raw_bytes'] = measure(lambda: private_key.sign(data, pss, hashes.SHA256()), iterations)
+    results['verify_hsm_pem_hex'] = measure(lambda: hsm.verify_signature(public_pem, QR_DATA, signature_hex), iterations)
+    results['verify_cached_key_hex'] = measure(
+        lambda: public_key.verify(bytes.fromhex(signature_hex), data, pss, hashes.SHA256()), iterations
+    )
+    results['verify_cached_key_raw'] = measure(lambda: public_key.verify(signature, data, pss, hashes.SHA256()), iterations)
+    results['pem_load_public'] = measure(lambda: serialization.load_pem_public_key(public_pem.encode()), iterations)
+    results['hex_decode_signature'] = measure(lambda: bytes.fromhex(signature_hex), iterations)
+    results['signature_bytes'] = len(signature)
+    results['signature_hex_chars'] = len(signature_hex)
+    return results
+
+def bench_reference(private_key, sign, verify, iterations):
+    """Direct cryptography timings for an algorithm DummyHSM does not issue"""
+    public_key = private_key.public_key()
+    data = QR_DATA.encode()
+    signature = sign(private_key, data)
+    return {
+        'sign_raw_bytes': measure(lambda: sign(private_key, data), iterations),
+        'verify_cached_key_raw': measure(lambda: verify(public_key, signature, data), iterations),
+        'signature_bytes': len(signature)
+    }
+
+def run(iterations, key_sizes):
+    """All benchmarks as one JSON-serializable dict"""
+    workdir = tempfile.mkdtemp(prefix='crypto_bench_')
+    hsm = DummyHSM(storage_file=os.path.join(workdir, 'hsm_keys.json'))
+    
+    algorithms = {f'rsa{key_size}_pss_sha256': bench_rsa(hsm, key_size, iterations) for key_size in key_sizes}
+    
+    ecdsa_key = ec.generate_private_key(ec.SECP256R1())
+    algorithms['ecdsa_p256_sha256'] = bench_reference(
+        ecdsa_key,
+        lambda key, data: key.sign(data, ec.ECDSA(hashes.SHA256())),
+        lambda key, signature, data: key.verify(signature, data, ec.ECDSA(hashes.SHA256())),
+        iterations
+    )
+    algorithms['ecdsa_p256_sha256']['keygen'] = measure(lambda: ec.generate_private_key(ec.SECP256R1()), iterations)
+    
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+    algorithms['ed25519'] = bench_reference(
+        ed_key,
+        lambda key, data: key.sign(data),
+        lambda key, signature, data: key.verify(signature, data),
+        iterations
+    )
+    algorithms['ed25519']['keygen'] = measure(ed25519.Ed25519PrivateKey.generate, iterations)
+    
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'cryptography': cryptography.__version__,
+            'machine': platform.machine(),
+            'system': platform.system()
+        },
+        'iterations': iterations,
+        'qr_data_bytes': len(QR_DATA),
+        'algorithms': algorithms
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Time DummyHSM key generation, signing and verification')
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per operation')
+    parser.add_argument('--key-sizes', default='2048,3072', help='comma-separated RSA key sizes')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    results = run(args.iterations, [int(size) for size in args.key_sizes.split(',')])
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,7 @@ from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.backends import default_backend
 import logging
+from metrics import HSM_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -74,13 +75,14 @@ class DummyHSM:
         except Exception as e:
             logger.error(f"Error saving HSM keys: {e}")
     
-    def generate_key_pair(self, key_id):
+    @HSM_SECONDS.time('generate')
+    def generate_key_pair(self, key_id, key_size=2048):
         """Generate RSA key pair"""
         try:
             # Generate private key
             private_key = rsa.generate_private_key(
                 public_exponent=65537,
-                key_size=2048,
+                key_size=key_size,
                 backend=default_backend()
             )
             public_key = private_key.public_key()
@@ -106,6 +108,7 @@ class DummyHSM:
             logger.error(f"Error generating key pair: {e}")
             raise
     
+    @HSM_SECONDS.time('sign')
     def sign_data(self, key_id, data):
         """Sign data with private key"""
         try:
@@ -128,12 +131,13 @@ class DummyHSM:
                 hashes.SHA256()
             )
             
-            logger.debug(f"Signed data for key {key_id}")
+            logger.debug("Signed data for key %s", key_id)
             return signature.hex()
         except Exception as e:
             logger.error(f"Error signing data: {e}")
             raise
     
+    @HSM_SECONDS.time('verify')
     def verify_signature(self, public_key_pem, data, signature):
         """Verify signature with public key"""
         try:
@@ -164,7 +168,7 @@ class DummyHSM:
             logger.debug("Signature verification successful")
             return True
         except Exception as e:
-            logger.warning(f"Signature verification failed: {e}")
+            logger.warning("Signature verification failed: %s", e)
             return False
     
     def get_public_key(self, key_id):
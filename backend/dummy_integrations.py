@@ -3,6 +3,7 @@ Dummy external integration stubs
 """
 import logging
 import time
+from config import Config
 
 logger = logging.getLogger(__name__)
 
@@ -11,22 +12,23 @@ def dummy_iamsmart_authenticate(iamsmart_id, password):
     Dummy iAmSmart authentication
     Returns True for demo purposes with specific test credentials
     """
-    logger.info(f"[DUMMY iAmSmart] Authenticating user: {iamsmart_id}")
+    logger.info("[DUMMY iAmSmart] Authenticating user: %s", iamsmart_id)
     
     # Simulate network delay
-    time.sleep(0.5)
+    if Config.IAMSMART_AUTH_DELAY > 0:
+        time.sleep(Config.IAMSMART_AUTH_DELAY)
     
     # Test mode: accept specific credentials or any ID starting with 'USER'
     if iamsmart_id.startswith('USER') or iamsmart_id.startswith('GATE'):
-        logger.info(f"[DUMMY iAmSmart] Authentication SUCCESS for {iamsmart_id}")
+        logger.info("[DUMMY iAmSmart] Authentication SUCCESS for %s", iamsmart_id)
         return True
     
     # For demo, accept password 'demo123' for any user
     if password == 'demo123':
-        logger.info(f"[DUMMY iAmSmart] Authentication SUCCESS for {iamsmart_id} with demo password")
+        logger.info("[DUMMY iAmSmart] Authentication SUCCESS for %s with demo password", iamsmart_id)
         return True
     
-    logger.warning(f"[DUMMY iAmSmart] Authentication FAILED for {iamsmart_id}")
+    logger.warning("[DUMMY iAmSmart] Authentication FAILED for %s", iamsmart_id)
     return False
 
 def dummy_validate_gps(tablet_id, reported_gps, expected_gps):
@@ -35,12 +37,12 @@ def dummy_validate_gps(tablet_id, reported_gps, expected_gps):
     Returns True for demo purposes
     Note: Browser geolocation is spoofable - for demo only
     """
-    logger.info(f"[DUMMY GPS] Validating location for {tablet_id}")
-    logger.debug(f"[DUMMY GPS] Reported: {reported_gps}, Expected: {expected_gps}")
+    logger.info("[DUMMY GPS] Validating location for %s", tablet_id)
+    logger.debug("[DUMMY GPS] Reported: %s, Expected: %s", reported_gps, expected_gps)
     
     # For demo, accept any GPS within reasonable range or exact match
     if reported_gps == expected_gps:
-        logger.info(f"[DUMMY GPS] Exact match - VALID")
+        logger.info("[DUMMY GPS] Exact match - VALID")
         return True
     
     # Simple validation - check if coordinates are close (demo only)
@@ -55,11 +57,11 @@ def dummy_validate_gps(tablet_id, reported_gps, expected_gps):
             
             # Accept within 0.01 degrees (roughly 1km)
             if abs(reported_lat - expected_lat) < 0.01 and abs(reported_lng - expected_lng) < 0.01:
-                logger.info(f"[DUMMY GPS] Within tolerance - VALID")
+                logger.info("[DUMMY GPS] Within tolerance - VALID")
                 return True
     except:
         pass
     
     # For demo purposes, accept anyway with warning
-    logger.warning(f"[DUMMY GPS] Location mismatch but accepting for demo")
+    logger.warning("[DUMMY GPS] Location mismatch but accepting for demo")
     return True
@@ -0,0 +1,382 @@
+"""
+Push event feed for iAmSmartGate
+A per-process hub tails change_events and the audit partitions and fans new
+events out to Server-Sent Events subscribers
+"""
+import json
+import threading
+import logging
+from collections import deque, defaultdict
+from datetime import datetime
+from itertools import islice
+from flask import Response
+from sqlalchemy import select, func, or_, event as sa_event
+from sqlalchemy.orm import Session
+from models import db, ChangeEvent
+from audit_partitions import iter_events, query_events
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class FeedEvent:
+    """One event as delivered to subscribers"""
+    __slots__ = ('type', 'seq', 'log_id', 'data', 'user_id', 'site_id')
+    
+    def __init__(self, type, data, seq=None, log_id=None, user_id=None, site_id=None):
+        self.type = type
+        self.data = data
+        self.seq = seq
+        self.log_id = log_id
+        self.user_id = user_id
+        self.site_id = site_id
+
+def event_topics(event):
+    """Topics an event is routed to: its user, its site and its kind"""
+    topics = [('kind', event.type)]
+    if event.user_id:
+        topics.append(('user', event.user_id))
+    if event.site_id:
+        topics.append(('site', event.site_id))
+    return topics
+
+def format_event_id(seq, log_id):
+    """SSE event ID: change sequence and audit log ID the client has seen"""
+    return f"{seq}-{log_id}"
+
+def parse_event_id(value):
+    """Parse a Last-Event-ID header, returning None if absent or malformed"""
+    try:
+        seq, log_id = value.split('-', 1)
+        return int(seq), int(log_id)
+    except (AttributeError, ValueError):
+        return None
+
+class Subscription:
+    """Bounded per-client queue; a client that falls behind is told to resync"""
+    
+    def __init__(self, hub, match, cursor, topics=None):
+        self.hub = hub
+        self.match = match
+        self.topics = topics
+        self.seq, self.log_id = cursor
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.overflowed = False
+    
+    def push(self, events):
+        with self.condition:
+            queued = len(self.queue)
+            for event in events:
+                if not self.match(event):
+                    continue
+                if len(self.queue) >= Config.SUBSCRIBER_QUEUE_LIMIT:
+                    self.overflowed = True
+                    break
+                self.queue.append(event)
+            if len(self.queue) > queued or self.overflowed:
+                self.condition.notify()
+    
+    def get(self, timeout):
+        """Wait up to timeout seconds and drain the queue"""
+        with self.condition:
+            if not self.queue and not self.overflowed:
+                self.condition.wait(timeout)
+            events = list(self.queue)
+            self.queue.clear()
+        return events
+    
+    def accept(self, event):
+        """Advance the cursor, dropping events already delivered (backlog/live overlap)"""
+        if event.seq is not None:
+            if event.seq <= self.seq:
+                return False
+            self.seq = event.seq
+        if event.log_id is not None:
+            if event.log_id <= self.log_id:
+                return False
+            self.log_id = event.log_id
+        return True
+    
+    @property
+    def event_id(self):
+        return format_event_id(self.seq, self.log_id)
+    
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class DeliveryTracker:
+    """
+    Measures the delay from a gate change being recorded until every gate
+    stream connected at dispatch has written it out (per process)
+    """
+    
+    def __init__(self, sample_size=1000):
+        self._pending = {}
+        self._samples = deque(maxlen=sample_size)
+        self._incomplete = 0
+        self._lock = threading.Lock()
+    
+    def expect(self, event, subscriptions):
+        """Start timing an event that the given subscriptions will deliver"""
+        now = datetime.utcnow()
+        with self._lock:
+            for seq, (created_at, waiting) in list(self._pending.items()):
+                if (now - created_at).total_seconds() > Config.GATE_PUSH_TRACK_SECONDS:
+                    del self._pending[seq]
+                    self._incomplete += 1
+            if subscriptions:
+                created_at = datetime.fromisoformat(event.data['created_at'])
+                self._pending[event.seq] = (created_at, set(subscriptions))
+    
+    def delivered(self, event, subscription):
+        with self._lock:
+            entry = self._pending.get(event.seq)
+            if entry is None:
+                return
+            created_at, waiting = entry
+            waiting.discard(subscription)
+            if not waiting:
+                del self._pending[event.seq]
+                self._samples.append((datetime.utcnow() - created_at).total_seconds() * 1000)
+    
+    def forget(self, subscription):
+        """A disconnected gate no longer holds up the events it was sent"""
+        with self._lock:
+            for seq, (created_at, waiting) in list(self._pending.items()):
+                waiting.discard(subscription)
+                if not waiting:
+                    del self._pending[seq]
+                    self._samples.append((datetime.utcnow() - created_at).total_seconds() * 1000)
+    
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            pending = len(self._pending)
+            incomplete = self._incomplete
+        
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1) if samples else None
+        
+        return {
+            'count': len(samples),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(samples[-1], 1) if samples else None,
+            'pending': pending,
+            'incomplete': incomplete
+        }
+
+class EventHub:
+    """Polls the database once per process and dispatches to all subscribers"""
+    
+    def __init__(self):
+        self.app = None
+        self.cursor = (0, 0)
+        self._subscriptions = set()
+        self._broadcast = set()
+        self._topics = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stale = True
+        self._wake = threading.Event()
+        self.tracker = DeliveryTracker()
+    
+    def init_app(self, app):
+        self.app = app
+    
+    def wake(self):
+        """Poll now instead of at the next interval (changes committed in this process)"""
+        self._wake.set()
+    
+    def _current_cursor(self):
+        seq = db.session.execute(select(func.max(ChangeEvent.seq))).scalar() or 0
+        latest = query_events(limit=1)
+        return seq, latest[0]['log_id'] if latest else 0
+    
+    def _fetch_changes(self, after_seq, limit, topics=None):
+        table = ChangeEvent.__table__
+        stmt = select(table).where(table.c.seq > after_seq)
+        if topics is not None:
+            columns = {'kind': table.c.kind, 'user': table.c.user_id, 'site': table.c.site_id}
+            stmt = stmt.where(or_(*[columns[name] == value for name, value in topics]))
+        rows = db.session.execute(stmt.order_by(table.c.seq).limit(limit)).all()
+        events = []
+        for row in rows:
+            data = json.loads(row.payload)
+            data['created_at'] = row.created_at.isoformat()
+            events.append(FeedEvent(row.kind, data, seq=row.seq, user_id=row.user_id, site_id=row.site_id))
+        return events
+    
+    def _fetch_audits(self, after_log_id, limit):
+        return [
+            FeedEvent('audit', log, log_id=log['log_id'], user_id=log['user_id'])
+            for log in islice(iter_events(after_id=after_log_id, chunk_size=limit), limit)
+        ]
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+                self._thread.start()
+                logger.info("[EVENTS] Event hub started")
+    
+    def _run(self):
+        while True:
+            # Other workers' commits are picked up within one poll interval
+            self._wake.wait(Config.EVENT_POLL_INTERVAL)
+            self._wake.clear()
+            if not self._subscriptions:
+                self._stale = True
+                continue
+            
+            try:
+                with self.app.app_context():
+                    seq, log_id = self.cursor
+                    events = self._fetch_changes(seq, Config.EVENT_BACKLOG_LIMIT)
+                    events += self._fetch_audits(log_id, Config.EVENT_BACKLOG_LIMIT)
+                    db.session.remove()
+            except Exception as e:
+                logger.error(f"[EVENTS] Poll error: {e}", exc_info=True)
+                continue
+            
+            if not events:
+                continue
+            for event in events:
+                if event.seq is not None:
+                    seq = event.seq
+                if event.log_id is not None:
+                    log_id = event.log_id
+            
+            # Advance the cursor and snapshot subscribers together so a new
+            # subscriber either receives this batch or starts after it
+            with self._lock:
+                self.cursor = (seq, log_id)
+                broadcast = list(self._broadcast)
+                routed = [
+                    (event, [sub for topic in event_topics(event) for sub in self._topics.get(topic, ())])
+                    for event in events
+                ]
+            for event, subscriptions in routed:
+                if event.type == 'gate':
+                    self.tracker.expect(event, [sub for sub in subscriptions if sub.match(event)])
+            for subscription in broadcast:
+                subscription.push(events)
+            # Topic subscribers only see their events, so thousands of idle
+            # per-user streams cost nothing per unrelated event
+            for event, subscriptions in routed:
+                for subscription in subscriptions:
+                    subscription.push([event])
+    
+    def subscribe(self, match, last_event_id=None, topics=None, audits=True):
+        """
+        Register a subscriber; match(event) selects the events it receives
+        topics limits delivery to events routed to those topics (see event_topics);
+        with a Last-Event-ID, missed events are replayed from the database first
+        """
+        self._ensure_started()
+        if self._stale:
+            self.cursor = self._current_cursor()
+            self._stale = False
+        
+        resume = parse_event_id(last_event_id)
+        with self._lock:
+            subscription = Subscription(self, match, resume or self.cursor, topics)
+            self._subscriptions.add(subscription)
+            if topics is None:
+                self._broadcast.add(subscription)
+            else:
+                for topic in topics:
+                    self._topics[topic].add(subscription)
+        
+        if resume:
+            limit = Config.EVENT_BACKLOG_LIMIT
+            oldest = db.session.execute(select(func.min(ChangeEvent.seq))).scalar()
+            changes = self._fetch_changes(resume[0], limit + 1, topics)
+            audits = self._fetch_audits(resume[1], limit + 1) if audits else []
+            if len(changes) > limit or len(audits) > limit:
+                subscription.overflowed = True
+            elif oldest is not None and resume[0] < oldest - 1:
+                # Events after the client's cursor were already cleaned up
+                subscription.overflowed = True
+            else:
+                with subscription.condition:
+                    backlog = [event for event in changes + audits if match(event)]
+                    subscription.queue.extendleft(reversed(backlog))
+        
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        self.tracker.forget(subscription)
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            self._broadcast.discard(subscription)
+            for topic in subscription.topics or ():
+                self._topics[topic].discard(subscription)
+                if not self._topics[topic]:
+                    del self._topics[topic]
+
+def format_sse(event_type, data, event_id=None):
+    """Serialize one Server-Sent Events message"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def sse_stream(subscription, initial=()):
+    """
+    Yield SSE messages for a subscription until the client disconnects
+    initial is a list of (event_type, data) sent once before any events
+    """
+    try:
+        yield f"retry: {Config.SSE_RETRY_MS}\n\n"
+        for event_type, data in initial:
+            yield format_sse(event_type, data)
+        while True:
+            events = subscription.get(Config.SSE_HEARTBEAT_SECONDS)
+            if subscription.overflowed:
+                # Client missed events it cannot replay: reload everything and reconnect fresh
+                yield format_sse('resync', {'reason': 'backlog exceeded'}, format_event_id(*subscription.hub.cursor))
+                return
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            
+            accepted = []
+            messages = []
+            for event in events:
+                if subscription.accept(event):
+                    accepted.append(event)
+                    messages.append(format_sse(event.type, event.data, subscription.event_id))
+            if messages:
+                yield ''.join(messages)
+                # Resumed once the server has written the chunk out
+                for event in accepted:
+                    if event.type == 'gate':
+                        subscription.hub.tracker.delivered(event, subscription)
+    finally:
+        subscription.close()
+
+def sse_response(subscription, initial=()):
+    """Streaming text/event-stream response for a subscription"""
+    return Response(
+        sse_stream(subscription, initial),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# Global hub instance
+hub = EventHub()
+
+@sa_event.listens_for(Session, 'after_commit')
+def _wake_on_commit(session):
+    if session.info.pop('change_recorded', False):
+        hub.wake()
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('change_recorded', None)
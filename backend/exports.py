@@ -0,0 +1,173 @@
+"""
+Streaming exports for iAmSmartGate
+Passes and audit events are read in keyset-paginated chunks and written out
+as NDJSON or CSV while they are read, so memory stays flat for any range
+"""
+import csv
+import heapq
+import io
+import json
+import logging
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy import select, or_, and_
+from models import db, Pass, Gate
+from audit_partitions import iter_events
+from sharding import shard_key, shard_keys, on_shard, execute_all
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_CHUNK_SIZE = 500
+FLUSH_BYTES = 64 * 1024
+
+PASS_FIELDS = [
+    'pass_id', 'iamsmart_id', 'site_id', 'purpose_id', 'visit_date_time', 'status',
+    'qr_signature', 'created_timestamp', 'approved_timestamp', 'used_timestamp',
+    'expiry_timestamp', 'used_flag', 'revoked_flag', 'device_id'
+]
+AUDIT_FIELDS = ['log_id', 'timestamp', 'event_type', 'user_id', 'gate_id', 'pass_id', 'result', 'details']
+
+def encode_pass_cursor(created_timestamp, pass_id):
+    """Resume token for the pass export ordering (created_timestamp, pass_id)"""
+    return f"{created_timestamp.isoformat()}|{pass_id}"
+
+def decode_pass_cursor(cursor):
+    """Parse a pass export resume token (raises ValueError)"""
+    created, pass_id = cursor.rsplit('|', 1)
+    return datetime.fromisoformat(created), pass_id
+
+def iter_passes(start=None, end=None, site_id=None, status=None, cursor=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield pass dicts oldest first, each carrying its resume cursor"""
+    last = decode_pass_cursor(cursor) if cursor else None
+    shards = [_iter_shard_passes(key, start, end, site_id, status, last, chunk_size) for key in shard_keys(site_id)]
+    
+    for row in heapq.merge(*shards, key=lambda row: (row.created_timestamp, row.pass_id)):
+        record = {
+            field: value.isoformat() if isinstance(value, datetime) else value
+            for field, value in zip(PASS_FIELDS, (getattr(row, f) for f in PASS_FIELDS))
+        }
+        record['cursor'] = encode_pass_cursor(row.created_timestamp, row.pass_id)
+        yield record
+
+def _iter_shard_passes(key, start, end, site_id, status, last, chunk_size):
+    """Yield one shard's pass rows oldest first, read in keyset-paginated chunks"""
+    table = Pass.__table__
+    while True:
+        stmt = select(table)
+        if start:
+            stmt = stmt.where(table.c.created_timestamp >= start)
+        if end:
+            stmt = stmt.where(table.c.created_timestamp <= end)
+        if site_id:
+            stmt = stmt.where(table.c.site_id == site_id)
+        if status:
+            stmt = stmt.where(table.c.status == status)
+        if last:
+            stmt = stmt.where(or_(
+                table.c.created_timestamp > last[0],
+                and_(table.c.created_timestamp == last[0], table.c.pass_id > last[1])
+            ))
+        stmt = stmt.order_by(table.c.created_timestamp, table.c.pass_id).limit(chunk_size)
+        
+        with on_shard(key):
+            rows = db.session.execute(stmt).all()
+        db.session.close()
+        
+        yield from rows
+        
+        if len(rows) < chunk_size:
+            break
+        last = (rows[-1].created_timestamp, rows[-1].pass_id)
+
+def iter_audit_events(start=None, end=None, site_id=None, event_type=None, cursor=None,
+                      include_archived=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield audit event dicts oldest first, each carrying its resume cursor"""
+    where = match = None
+    if site_id:
+        # Audit rows have no site column; attribute them through the gate or the pass
+        gate_ids = select(Gate.tablet_id).where(Gate.site_id == site_id)
+        pass_ids = select(Pass.pass_id).where(Pass.site_id == site_id)
+        sharded = shard_key(site_id) is not None
+        if sharded:
+            # The site's passes are in its shard, not beside the audit partitions, so match a list of IDs
+            pass_ids = [pass_id for pass_id, in execute_all(pass_ids, site_id=site_id)]
+        where = lambda table: [or_(table.c.gate_id.in_(gate_ids), table.c.pass_id.in_(pass_ids))]
+        
+        if include_archived:
+            site_gates = set(db.session.execute(gate_ids).scalars())
+            site_passes = set(pass_ids) if sharded else set(db.session.execute(pass_ids).scalars())
+            match = lambda log: log['gate_id'] in site_gates or log['pass_id'] in site_passes
+    
+    for log in iter_events(start=start, end=end, event_type=event_type,
+                           after_id=int(cursor) if cursor else None,
+                           where=where, match=match, include_archived=include_archived,
+                           chunk_size=chunk_size):
+        log['cursor'] = str(log['log_id'])
+        yield log
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+def _csv_lines(records, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields + ['cursor'], extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def _batched(lines):
+    """Group lines into ~64 KB writes instead of one write per row (a failure still writes the lines read)"""
+    batch = []
+    size = 0
+    try:
+        for line in lines:
+            batch.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(batch)
+                batch = []
+                size = 0
+    except Exception:
+        if batch:
+            yield ''.join(batch)
+        raise
+    if batch:
+        yield ''.join(batch)
+
+def export_response(records, export_format, fields, name):
+    """Build a streaming response for an export generator"""
+    sent = {'cursor': None}  # cursor of the last record written
+    
+    def tracked():
+        for record in records:
+            sent['cursor'] = record.get('cursor')
+            yield record
+    
+    lines = _csv_lines(tracked(), fields) if export_format == 'csv' else _ndjson_lines(tracked())
+    
+    def generate():
+        try:
+            yield from _batched(lines)
+        except Exception as e:
+            # Headers are already sent: end NDJSON with an error record, then abort the response
+            # without its final chunk so no client takes a cut-off export for a complete one
+            logger.error(f"[EXPORT] {name} export aborted: {e}", exc_info=True)
+            if export_format == 'ndjson':
+                yield json.dumps({'error': str(e), 'resume_cursor': sent['cursor']}) + '\n'
+            raise
+    
+    filename = f"{name}-{datetime.utcnow():%Y%m%dT%H%M%S}.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings for iAmSmartGate
+Push feeds keep connections open, so workers default to gevent: an idle SSE
+client then costs a greenlet instead of a whole worker
+"""
+import os
+
+try:
+    import gevent
+    _default_worker = 'gevent'
+except ImportError:
+    _default_worker = 'sync'
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', _default_worker)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '2000'))
@@ -0,0 +1,267 @@
+"""
+Multi-actor load generator for iAmSmartGate
+Drives a running server through its real HTTP endpoints with three kinds of
+virtual actors:
+  wallets  log in, apply for a pass, poll until it is approved, fetch a QR
+           and keep refreshing it until a gate has used the pass, then repeat
+  gates    log in and scan presented QR codes at their site (Poisson arrivals)
+  admin    bulk-approves everything pending at a fixed interval
+Throughput, error rate and latency percentiles are reported per endpoint for
+each interval and for the whole run.
+
+Start the server with a short simulated iAmSmart delay, and without rate
+limits unless they are what is being measured, e.g.
+  IAMSMART_AUTH_DELAY=0.05 RATE_LIMIT_ENABLED=False python app.py
+Usage: python load_test.py [--url http://localhost:5000] [--wallets 20] [--gates 4]
+                           [--duration 60] [--scan-rate 2] [--json results.json]
+"""
+import argparse
+import json
+import math
+import queue
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+import requests
+
+GATE_IDS = ['GATE001', 'GATE002', 'GATE003', 'GATE004']
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+class Recorder:
+    """Latencies and errors per endpoint, bucketed into report intervals"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.start = time.monotonic()
+        self.windows = defaultdict(lambda: defaultdict(lambda: {'latencies': [], 'errors': 0}))
+        self.lock = threading.Lock()
+    
+    def record(self, endpoint, seconds, ok):
+        window = int((time.monotonic() - self.start) // self.interval)
+        with self.lock:
+            stats = self.windows[window][endpoint]
+            stats['latencies'].append(seconds)
+            if not ok:
+                stats['errors'] += 1
+    
+    def summarize(self, windows, elapsed):
+        merged = defaultdict(lambda: {'latencies': [], 'errors': 0})
+        with self.lock:
+            for window in windows:
+                for endpoint, stats in self.windows.get(window, {}).items():
+                    merged[endpoint]['latencies'].extend(stats['latencies'])
+                    merged[endpoint]['errors'] += stats['errors']
+        summary = {}
+        for endpoint, stats in sorted(merged.items()):
+            latencies = sorted(stats['latencies'])
+            summary[endpoint] = {
+                'requests': len(latencies),
+                'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                'error_rate': round(stats['errors'] / len(latencies), 4),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1)
+            }
+        return summary
+
+def print_summary(title, summary):
+    print(f"\n{title}")
+    print(f"{'Endpoint':<32}{'Reqs':>7}{'RPS':>8}{'Err%':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for endpoint, stats in summary.items():
+        print(f"{endpoint:<32}{stats['requests']:>7}{stats['rps']:>8}{stats['error_rate'] * 100:>6.1f}%"
+              f"{stats['p50_ms']:>8}{stats['p95_ms']:>8}{stats['p99_ms']:>8}{stats['max_ms']:>8}")
+
+class Client:
+    """requests.Session that records every call under an endpoint label"""
+    
+    def __init__(self, base_url, recorder, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.session = requests.Session()
+        if token:
+            self.authorize(token)
+    
+    def authorize(self, token):
+        self.session.headers['Authorization'] = f'Bearer {token}'
+    
+    def call(self, label, method, path, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(label, time.perf_counter() - start, False)
+            return None
+        self.recorder.record(label, time.perf_counter() - start, res.status_code in expected)
+        return res if res.status_code in expected else None
+
+class LoadTest:
+    """Shared state for one run: presented QR codes per site and the stop flag"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.recorder = Recorder(args.report_interval)
+        self.stop = threading.Event()
+        self.presented = defaultdict(queue.Queue)  # site_id -> QR payloads waiting at a gate
+        self.sites = []
+        self.purposes = []
+        self.outcomes = defaultdict(int)
+        self.lock = threading.Lock()
+    
+    def wait(self, seconds):
+        """Sleep unless the run is stopping; returns False once it is"""
+        return not self.stop.wait(seconds)
+    
+    def wallet(self, index):
+        args = self.args
+        client = Client(args.url, self.recorder)
+        res = client.call('POST /api/login', 'post', '/api/login', json={
+            'iamsmart_id': f'USERLOAD{index:04d}', 'password': 'demo123', 'device_id': f'load-{index}'
+        })
+        if res is None:
+            return
+        client.authorize(res.json()['token'])
+        
+        while not self.stop.is_set():
+            site_id = random.choice(self.sites)
+            res = client.call('POST /api/apply-pass', 'post', '/api/apply-pass', expected=(201,), json={
+                'site_id': site_id, 'purpose_id': random.choice(self.purposes),
+                'visit_date_time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() + 3600))
+            })
+            if res is None:
+                self.wait(args.poll_interval)
+                continue
+            pass_id = res.json()['pass']['pass_id']
+            
+            # Poll until approved, then present QRs until a gate uses the pass
+            qr_at = None
+            etag = None
+            while self.wait(args.poll_interval):
+                # Like the wallet app: revalidate with the ETag, 304 while nothing changed
+                res = client.call('GET /api/my-passes', 'get', '/api/my-passes', expected=(200, 304),
+                                  headers={'If-None-Match': etag} if etag else {})
+                if res is None or res.status_code == 304:
+                    continue
+                etag = res.headers.get('ETag')
+                status = next((p['status'] for p in res.json()['passes'] if p['pass_id'] == pass_id), None)
+                if status not in ('In Process', 'Pass'):
+                    break
+                if status == 'Pass' and (qr_at is None or time.monotonic() - qr_at >= args.qr_refresh):
+                    res = client.call('GET /api/get-qr/<pass_id>', 'get', f'/api/get-qr/{pass_id}')
+                    if res is not None:
+                        qr_at = time.monotonic()
+                        self.presented[site_id].put((qr_at, res.json()['qr_payload']))
+    
+    def gate_login(self, index):
+        """Logged-in client and site for a virtual gate, or None"""
+        client = Client(self.args.url, self.recorder)
+        tablet_id = GATE_IDS[index % len(GATE_IDS)]
+        res = client.call('POST /api/gate-login', 'post', '/api/gate-login', json={'tablet_id': tablet_id, 'password': 'demo123'})
+        if res is None:
+            return None
+        body = res.json()
+        client.authorize(body['token'])
+        return client, body['gate']['site_id']
+    
+    def gate(self, client, site_id):
+        args = self.args
+        # Exponential gaps give Poisson arrivals at --scan-rate per gate
+        while self.wait(random.expovariate(args.scan_rate)):
+            try:
+                presented_at, qr_payload = self.presented[site_id].get_nowait()
+            except queue.Empty:
+                continue
+            if time.monotonic() - presented_at > args.qr_refresh:
+                continue  # the wallet has refreshed it since
+            res = client.call('POST /api/scan-qr', 'post', '/api/scan-qr', json={'qr_payload': qr_payload})
+            if res is not None:
+                with self.lock:
+                    self.outcomes[res.json().get('result')] += 1
+    
+    def admin(self):
+        client = Client(self.args.url, self.recorder)
+        while self.wait(self.args.approve_interval):
+            client.call('POST /admin/bulk/approve', 'post', '/admin/bulk/approve', json={'filter': {'status': 'In Process'}})
+            client.call('GET /admin/statistics', 'get', '/admin/statistics')
+    
+    def reporter(self):
+        window = 0
+        while self.wait(self.args.report_interval):
+            print_summary(f"--- {(window + 1) * self.args.report_interval:g}s ---",
+                          self.recorder.summarize([window], self.args.report_interval))
+            window += 1
+    
+    def run(self):
+        args = self.args
+        setup = Client(args.url, self.recorder)
+        res_sites = setup.call('GET /api/sites', 'get', '/api/sites')
+        res_purposes = setup.call('GET /api/purposes', 'get', '/api/purposes')
+        if res_sites is None or res_purposes is None:
+            print(f"Server at {args.url} is not answering")
+            return None
+        self.purposes = list(res_purposes.json()['purposes'])
+        
+        # Gates log in first so wallets only apply where a gate will be scanning
+        gates = [gate for gate in (self.gate_login(i) for i in range(args.gates)) if gate]
+        scanned = {site_id for _, site_id in gates}
+        self.sites = [site for site in res_sites.json()['sites'] if site in scanned]
+        if not self.sites:
+            print('No virtual gate could log in at an active site')
+            return None
+        
+        threads = [threading.Thread(target=self.wallet, args=(i,), daemon=True) for i in range(args.wallets)]
+        threads += [threading.Thread(target=self.gate, args=gate, daemon=True) for gate in gates]
+        threads += [threading.Thread(target=self.admin, daemon=True), threading.Thread(target=self.reporter, daemon=True)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        self.stop.set()
+        for thread in threads:
+            thread.join(timeout=35)
+        elapsed = time.monotonic() - started
+        
+        summary = self.recorder.summarize(sorted(self.recorder.windows), elapsed)
+        return {'duration_s': round(elapsed, 1), 'scan_results': dict(self.outcomes), 'endpoints': summary}
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate wallets, gates and an admin against a running server')
+    parser.add_argument('--url', default='http://localhost:5000', help='server base URL')
+    parser.add_argument('--wallets', type=int, default=20, help='virtual wallet users')
+    parser.add_argument('--gates', type=int, default=4, help='virtual gates (spread over GATE001-GATE004)')
+    parser.add_argument('--duration', type=float, default=60, help='run time in seconds')
+    parser.add_argument('--scan-rate', type=float, default=2, help='scan attempts per second per gate')
+    parser.add_argument('--poll-interval', type=float, default=1, help='wallet my-passes polling interval')
+    parser.add_argument('--qr-refresh', type=float, default=20, help='seconds before a wallet refreshes its QR')
+    parser.add_argument('--approve-interval', type=float, default=2, help='seconds between admin bulk approvals')
+    parser.add_argument('--report-interval', type=float, default=10, help='seconds per progress report')
+    parser.add_argument('--json', help='also write the final results to this file')
+    args = parser.parse_args()
+    
+    print(f"\n{'='*60}")
+    print(f"LOAD TEST: {args.wallets} wallets, {args.gates} gates, {args.duration:g}s against {args.url}")
+    print(f"{'='*60}")
+    
+    results = LoadTest(args).run()
+    if results is None:
+        return 1
+    
+    print(f"\n{'='*60}")
+    print_summary(f"TOTAL ({results['duration_s']}s)", results['endpoints'])
+    print(f"\nScan results: {results['scan_results']}")
+    print(f"{'='*60}\n")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Logging pipeline for iAmSmartGate
+Request threads only put records on a bounded in-memory queue; a background
+listener formats them and writes the log file and console, so request latency
+does not depend on disk speed
+"""
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+_listener = None
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks: records are dropped (and counted) when the queue is full"""
+    
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record):
+        # The listener runs in this process, so the record needs no pickling;
+        # message formatting is left to the writer thread
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class SamplingFilter(logging.Filter):
+    """Pass only a fraction of records below WARNING; warnings and errors always pass"""
+    
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+def parse_settings(value):
+    """Parse 'name=value,name=value' settings from the environment"""
+    settings = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            settings[name.strip()] = setting.strip()
+    return settings
+
+def configure_logging():
+    """Install the queue-based root handler, per-logger levels and sampling (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(Config.LOG_FILE), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    
+    root = logging.getLogger()
+    root.setLevel(Config.LOG_LEVEL)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    
+    for name, level in parse_settings(Config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in parse_settings(Config.LOG_SAMPLING).items():
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+    
+    return _listener
@@ -0,0 +1,191 @@
+"""
+In-process metrics for iAmSmartGate
+Counters and histograms aggregate in memory (one lock per metric, no I/O on
+the request path) and are rendered in the Prometheus text format by /metrics.
+Each worker process keeps its own values.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+
+_registry = []
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class Histogram:
+    """Bucketed distribution of observations (seconds) keyed by label values"""
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+    
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items())
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+class Gauge:
+    """
+    Value read from a function when metrics are rendered; with labelnames the
+    function returns {label values: value}
+    """
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._function = None
+        _registry.append(self)
+    
+    def set_function(self, function):
+        self._function = function
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        value = self._function() if self._function else None
+        if value is None:
+            return lines
+        values = sorted(value.items()) if self.labelnames else [((), value)]
+        for labels, labeled_value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {labeled_value}')
+        return lines
+
+REQUEST_SECONDS = Histogram(
+    'iamsmartgate_request_duration_seconds', 'Request latency by route',
+    ('endpoint', 'method', 'status')
+)
+SCAN_OUTCOMES = Counter('iamsmartgate_scan_outcomes_total', 'QR scans by result', ('result',))
+DB_QUERY_SECONDS = Histogram('iamsmartgate_db_query_duration_seconds', 'SQL statement latency by kind', ('statement',))
+HSM_SECONDS = Histogram('iamsmartgate_hsm_operation_duration_seconds', 'DummyHSM operation latency', ('operation',))
+ADMISSION_SHED = Counter(
+    'iamsmartgate_admission_shed_total', 'Requests refused by admission control', ('endpoint', 'class', 'reason')
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    'iamsmartgate_admission_wait_seconds', 'Time spent waiting for an admission slot', ('class',)
+)
+ADMISSION_IN_FLIGHT = Gauge('iamsmartgate_admission_in_flight', 'Requests in progress by admission class', ('class',))
+RATE_LIMITED = Counter('iamsmartgate_rate_limited_total', 'Requests refused by rate limits', ('endpoint', 'kind'))
+PASS_FILTER_LOOKUPS = Counter(
+    'iamsmartgate_pass_filter_lookups_total', 'Scanned pass IDs by filter answer (false_positive: maybe, not in DB; other_shard: another site\'s pass)',
+    ('result',)
+)
+PASS_FILTER_FP_RATE = Gauge(
+    'iamsmartgate_pass_filter_false_positive_rate', 'Estimated false-positive rate of the unknown pass ID filter'
+)
+JOB_SECONDS = Histogram(
+    'iamsmartgate_background_job_duration_seconds', 'Background job run time', ('job',), buckets=JOB_BUCKETS
+)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_QUERY_SECONDS.observe(time.perf_counter() - start, kind)
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute; drop their start time
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def init_app(app):
+    """Time every request and expose /metrics"""
+    
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+    
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            # Streaming responses are timed until their headers are ready
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                request.url_rule.rule if request.url_rule else 'unmatched',
+                request.method,
+                response.status_code
+            )
+        return response
+    
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -2,10 +2,20 @@
 Database models for iAmSmartGate
 """
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import bindparam, case, inspect, select, text
+from collections import Counter
+from datetime import datetime, timedelta
 import json
+from serialization import Projection
+from config import Config
+from read_routing import RoutingSession
+from sharding import (OUTBOX, current_shard, each_shard, migrate_to_shards, shard_engines, shard_layout,
+                      shard_sites, shard_tables)
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Pass statuses pushed to gate readers so they stop admitting the pass
+GATE_PASS_STATUSES = ('Revoked', 'Used', 'Expired')
 
 class User(db.Model):
     """User account model"""
@@ -50,6 +60,10 @@ class Gate(db.Model):
 class Pass(db.Model):
     """Visit pass model"""
     __tablename__ = 'passes'
+    __table_args__ = (
+        db.Index('ix_passes_created', 'created_timestamp', 'pass_id'),
+        db.Index('ix_passes_user_version', 'iamsmart_id', 'change_version'),
+    )
     
     pass_id = db.Column(db.String(100), primary_key=True)
     iamsmart_id = db.Column(db.String(100), db.ForeignKey('users.iamsmart_id'), nullable=False)
@@ -65,6 +79,7 @@ class Pass(db.Model):
     used_flag = db.Column(db.Boolean, default=False)
     revoked_flag = db.Column(db.Boolean, default=False)
     device_id = db.Column(db.String(100))
+    change_version = db.Column(db.Integer, server_default='0')  # Owner's pass version at last change
     
     def to_dict(self):
         return {
@@ -81,11 +96,62 @@ class Pass(db.Model):
             'expiry_timestamp': self.expiry_timestamp.isoformat() if self.expiry_timestamp else None,
             'used_flag': self.used_flag,
             'revoked_flag': self.revoked_flag,
-            'device_id': self.device_id
+            'device_id': self.device_id,
+            'change_version': self.change_version
+        }
+
+# Pass.to_dict() fields, read straight from Core rows by the list endpoints
+PASS_PROJECTION = Projection(Pass.__table__, [
+    'pass_id', 'iamsmart_id', 'site_id', 'purpose_id', 'visit_date_time', 'status',
+    'qr_signature', 'created_timestamp', 'approved_timestamp', 'used_timestamp',
+    'expiry_timestamp', 'used_flag', 'revoked_flag', 'device_id', 'change_version'
+])
+
+class PassVersion(db.Model):
+    """Per-user pass change counter for wallet ETags and ?since= deltas (one per database holding passes)"""
+    __tablename__ = 'pass_versions'
+    
+    iamsmart_id = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChangeEvent(db.Model):
+    """Ordered log of state changes that push feeds replay to subscribers"""
+    __tablename__ = 'change_events'
+    
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # pass/pause/gate
+    user_id = db.Column(db.String(100))
+    site_id = db.Column(db.String(50))
+    payload = db.Column(db.Text, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'site_id': self.site_id,
+            'payload': json.loads(self.payload)
         }
 
+class GateSequence(db.Model):
+    """Per-site sequence numbers for the gate push stream"""
+    __tablename__ = 'gate_sequences'
+    
+    site_id = db.Column(db.String(50), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+class OutboxCursor(db.Model):
+    """Last shard outbox entry relayed to the primary, per sharded site"""
+    __tablename__ = 'outbox_cursors'
+    
+    site_id = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
 class AuditLog(db.Model):
-    """Audit log model"""
+    """Legacy unpartitioned audit log model (new events live in audit_partitions)"""
     __tablename__ = 'audit_logs'
     
     log_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -109,6 +175,24 @@ class AuditLog(db.Model):
             'details': self.details
         }
 
+class Site(db.Model):
+    """Site registry entry (read through registry.py)"""
+    __tablename__ = 'sites'
+    
+    site_id = db.Column(db.String(50), primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Purpose(db.Model):
+    """Visit purpose registry entry (read through registry.py)"""
+    __tablename__ = 'purposes'
+    
+    purpose_id = db.Column(db.String(50), primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class SystemState(db.Model):
     """System state for pause controls"""
     __tablename__ = 'system_state'
@@ -124,11 +208,253 @@ class SystemState(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def record_change(kind, payload, user_id=None, site_id=None):
+    """Add a change event to the current session so it commits with the change itself"""
+    record_changes([(kind, payload, user_id, site_id)])
+
+def record_changes(changes):
+    """
+    Add a batch of (kind, payload, user_id, site_id) change events in one insert;
+    gate events get their site's next sequence numbers in batch order. While
+    the session is routed to a shard they go to its outbox instead, unnumbered
+    """
+    if not changes:
+        return
+    now = datetime.utcnow()
+    if current_shard() is not None:
+        queue_outbox('change', [
+            ({'kind': kind, 'payload': payload, 'user_id': user_id, 'site_id': site_id}, now)
+            for kind, payload, user_id, site_id in changes
+        ])
+        return
+    
+    counts = Counter(site_id for kind, _, _, site_id in changes if kind == 'gate')
+    lasts = next_gate_seqs(counts)
+    seqs = {site_id: lasts[site_id] - count for site_id, count in counts.items()}
+    rows = []
+    for kind, payload, user_id, site_id in changes:
+        if kind == 'gate':
+            seqs[site_id] += 1
+            payload = dict(payload, site_seq=seqs[site_id])
+        rows.append({
+            'created_at': now, 'kind': kind, 'user_id': user_id, 'site_id': site_id, 'payload': json.dumps(payload)
+        })
+    
+    # Lets the event hub wake up on commit instead of waiting for its next poll
+    db.session.info['change_recorded'] = True
+    db.session.execute(ChangeEvent.__table__.insert(), rows)
+
+def queue_outbox(kind, entries):
+    """Add (payload, created_at) audit or change events to the outbox of the session's shard (caller commits)"""
+    if not entries:
+        return
+    # Lets the outbox relay run on commit instead of waiting for its next poll
+    db.session.info['outbox_queued'] = True
+    db.session.execute(OUTBOX.insert(), [
+        {'kind': kind, 'payload': json.dumps(payload), 'created_at': created_at} for payload, created_at in entries
+    ])
+
+def next_gate_seqs(counts):
+    """
+    Allocate counts[site_id] gate stream sequence numbers for each site with one
+    UPDATE (plus one INSERT for sites seen for the first time), returning
+    {site_id: last allocated number} (caller commits)
+    """
+    if not counts:
+        return {}
+    table = GateSequence.__table__
+    last = dict(db.session.execute(
+        table.update().where(table.c.site_id.in_(list(counts)))
+        .values(seq=table.c.seq + case(counts, value=table.c.site_id))
+        .returning(table.c.site_id, table.c.seq)
+    ).all())
+    missing = [site_id for site_id in counts if site_id not in last]
+    if missing:
+        db.session.execute(table.insert(), [{'site_id': site_id, 'seq': counts[site_id]} for site_id in missing])
+        last.update((site_id, counts[site_id]) for site_id in missing)
+    return last
+
+def get_gate_seq(site_id):
+    """Latest gate stream sequence number for a site"""
+    table = GateSequence.__table__
+    return db.session.execute(select(table.c.seq).where(table.c.site_id == site_id)).scalar() or 0
+
+def record_gate_change(site_id, change_type, payload):
+    """
+    Queue a gate stream event (revoke/pause/resume/config) for one site, or for
+    every site with gates when site_id is None; each site numbers its events
+    """
+    if site_id is None:
+        sites = db.session.execute(select(Gate.site_id).distinct()).scalars().all()
+    else:
+        sites = [site_id]
+    record_changes([('gate', dict(payload, type=change_type), None, site) for site in sites])
+
+def stage_pass_status(passes):
+    """Queue pass statuses for the shared status index, written once the session commits"""
+    pending = db.session.info.setdefault('pass_status', {})
+    for pass_obj in passes:
+        pending[pass_obj.pass_id] = (
+            pass_obj.status, bool(pass_obj.used_flag), bool(pass_obj.revoked_flag), pass_obj.expiry_timestamp
+        )
+
+def mark_pass_changed(pass_obj):
+    """Bump the owner's pass version and stamp the pass with it (caller commits)"""
+    table = PassVersion.__table__
+    owner = table.c.iamsmart_id == pass_obj.iamsmart_id
+    
+    result = db.session.execute(
+        table.update().where(owner).values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount:
+        version = db.session.execute(select(table.c.version).where(owner)).scalar()
+    else:
+        version = 1
+        db.session.execute(table.insert().values(
+            iamsmart_id=pass_obj.iamsmart_id, version=version, updated_at=datetime.utcnow()
+        ))
+    
+    pass_obj.change_version = version
+    stage_pass_status([pass_obj])
+    record_change('pass', {
+        'pass_id': pass_obj.pass_id,
+        'status': pass_obj.status,
+        'used_flag': bool(pass_obj.used_flag),
+        'revoked_flag': bool(pass_obj.revoked_flag),
+        'change_version': version
+    }, user_id=pass_obj.iamsmart_id, site_id=pass_obj.site_id)
+    if pass_obj.status in GATE_PASS_STATUSES:
+        # Gates only need to hear about passes that must no longer open them
+        record_gate_change(pass_obj.site_id, 'revoke', {
+            'pass_id': pass_obj.pass_id,
+            'status': pass_obj.status
+        })
+    return version
+
+def mark_passes_changed(rows):
+    """
+    Set-based mark_pass_changed for passes already updated in SQL (caller commits)
+    rows need pass_id, iamsmart_id, site_id, status, used_flag, revoked_flag and
+    expiry_timestamp; each owner's version is bumped once for the whole batch
+    """
+    if not rows:
+        return
+    versions = PassVersion.__table__
+    passes = Pass.__table__
+    now = datetime.utcnow()
+    owners = sorted({row.iamsmart_id for row in rows})
+    
+    db.session.execute(
+        versions.update().where(versions.c.iamsmart_id.in_(owners))
+        .values(version=versions.c.version + 1, updated_at=now)
+    )
+    existing = set(db.session.execute(
+        select(versions.c.iamsmart_id).where(versions.c.iamsmart_id.in_(owners))
+    ).scalars())
+    missing = [owner for owner in owners if owner not in existing]
+    if missing:
+        db.session.execute(versions.insert(), [
+            {'iamsmart_id': owner, 'version': 1, 'updated_at': now} for owner in missing
+        ])
+    current = dict(db.session.execute(
+        select(versions.c.iamsmart_id, versions.c.version).where(versions.c.iamsmart_id.in_(owners))
+    ).all())
+    
+    # Stamped from the versions read above rather than a subquery, since passes may live in a site shard
+    db.session.execute(
+        passes.update().where(passes.c.pass_id == bindparam('b_pass_id')).values(change_version=bindparam('b_version')),
+        [{'b_pass_id': row.pass_id, 'b_version': current[row.iamsmart_id]} for row in rows]
+    )
+    
+    stage_pass_status(rows)
+    changes = [('pass', {
+        'pass_id': row.pass_id,
+        'status': row.status,
+        'used_flag': bool(row.used_flag),
+        'revoked_flag': bool(row.revoked_flag),
+        'change_version': current[row.iamsmart_id]
+    }, row.iamsmart_id, row.site_id) for row in rows]
+    
+    # record_changes numbers each affected site's gate events from one block of sequence numbers
+    changes += [('gate', {
+        'pass_id': row.pass_id,
+        'status': row.status,
+        'type': 'revoke'
+    }, None, row.site_id) for row in rows if row.status in GATE_PASS_STATUSES]
+    
+    record_changes(changes)
+
+def get_pass_version(iamsmart_id):
+    """
+    Current pass version for a user (0 if none of their passes changed yet)
+    With site shards each database counts changes to the passes it holds, and
+    the version is the shard layout tag and those counts joined by dots
+    """
+    table = PassVersion.__table__
+    stmt = select(table.c.version).where(table.c.iamsmart_id == iamsmart_id)
+    return format_pass_version([db.session.execute(stmt).scalar() or 0 for _ in each_shard()])
+
+def format_pass_version(versions):
+    """Pass version from the per-database versions, in shard_keys() order"""
+    if not shard_sites():
+        return versions[0]
+    return '.'.join([shard_layout()] + [str(version) for version in versions])
+
+def parse_pass_version(value):
+    """
+    Per-database versions (in shard_keys() order) from a pass version, or None
+    if it is missing, malformed or from before the shards changed
+    """
+    try:
+        if not shard_sites():
+            return [int(value)]
+        layout, *versions = value.split('.')
+        if layout != shard_layout() or len(versions) != len(shard_sites()) + 1:
+            return None
+        return [int(version) for version in versions]
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def upgrade_schema(engine=None, tables=None):
+    """Add columns introduced after a table was first created"""
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    for table in tables or db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
 def init_db():
     """Initialize database with tables and demo data"""
     from crypto_utils import DummyHSM
     
     db.create_all()
+    upgrade_schema()
+    
+    # create_all() skips indexes on tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    
+    # Each site shard has its own passes, pass versions and outbox; passes of sharded sites move there
+    for engine in shard_engines():
+        for table in shard_tables():
+            table.create(bind=engine, checkfirst=True)
+            upgrade_schema(engine, [table])
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+    migrate_to_shards()
+    for site_id in shard_sites():
+        if not db.session.get(OutboxCursor, site_id):
+            db.session.add(OutboxCursor(site_id=site_id, last_id=0))
     
     # Initialize system state if not exists
     if not SystemState.query.filter_by(key='global_pause').first():
@@ -137,6 +463,15 @@ def init_db():
     if not SystemState.query.filter_by(key='site_pauses').first():
         db.session.add(SystemState(key='site_pauses', value=json.dumps({})))
     
+    if not SystemState.query.filter_by(key='registry_version').first():
+        db.session.add(SystemState(key='registry_version', value='1'))
+    
+    # Seed the site and purpose registry the first time
+    if not Site.query.first():
+        db.session.add_all(Site(site_id=site_id, name=name) for site_id, name in Config.SITES.items())
+    if not Purpose.query.first():
+        db.session.add_all(Purpose(purpose_id=purpose_id, name=name) for purpose_id, name in Config.PURPOSES.items())
+    
     # Create test gates if not exist
     hsm = DummyHSM()
     
@@ -162,3 +497,11 @@ def init_db():
             db.session.add(gate)
     
     db.session.commit()
+    
+    # Move any pre-partitioning audit rows and make sure today's partitions exist
+    from audit_partitions import migrate_legacy_rows, ensure_partition, ensure_indexes
+    migrate_legacy_rows()
+    ensure_indexes()
+    today = datetime.utcnow().date()
+    ensure_partition(today)
+    ensure_partition(today + timedelta(days=1))
@@ -0,0 +1,221 @@
+"""
+Negative lookup filter for iAmSmartGate
+A Bloom filter over every pass ID, kept in a memory-mapped file shared by all
+workers, so scan_qr can answer "definitely not a pass" for junk or forged QR
+codes without querying the database. IDs are added before the creating
+transaction commits and again once it has, so the filter never misses a real
+pass. It is rebuilt from the passes table at startup and every
+PASS_FILTER_REBUILD_INTERVAL into a second bit array, which then replaces the
+live one. Unknown IDs are counted per gate and written as one audit row per
+gate and flush interval instead of one row per scan.
+"""
+import hashlib
+import logging
+import math
+import struct
+import threading
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from config import Config
+from models import db, Pass
+from audit_partitions import record_events
+from sharding import each_shard
+from metrics import PASS_FILTER_FP_RATE
+from shared_file import HEADER_SIZE, SharedFile
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IASBLM02'
+HEADER = struct.Struct('<8sQIIQ')  # magic, bits per array, hash count, live array, rebuild generation
+LAYOUT = struct.Struct('<QI')  # the bits and hash count in HEADER, which fix the file's layout
+SET_BITS = struct.Struct('<Q')  # set bits in one array, kept after HEADER for arrays 0 and 1
+NOT_BUILT = 0xFFFFFFFF  # live array value until the first rebuild: every ID might be a pass
+UNKNOWN_SAMPLES = 5  # example IDs kept per gate for the aggregated audit row
+
+def filter_size(capacity, fp_rate):
+    """(bits, hashes) for a Bloom filter holding capacity IDs at the target false-positive rate"""
+    bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2 / 8) * 8
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+def _popcount(value):
+    """Set bits in a non-negative int (int.bit_count needs Python 3.10)"""
+    if hasattr(value, 'bit_count'):
+        return value.bit_count()
+    return bin(value).count('1')
+
+def _positions(pass_id, bits, hashes):
+    """Bit positions for an ID by double hashing one blake2b digest"""
+    digest = hashlib.blake2b(pass_id.encode(), digest_size=16).digest()
+    h1, h2 = struct.unpack('<QQ', digest)
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+def _mark_not_built(mm):
+    _, bits, hashes, _, _ = HEADER.unpack_from(mm)
+    HEADER.pack_into(mm, 0, MAGIC, bits, hashes, NOT_BUILT, 0)
+
+def _array(mm, index):
+    """(start, end) offsets of bit array 0 or 1"""
+    length = (len(mm) - HEADER_SIZE) // 2
+    start = HEADER_SIZE + index * length
+    return start, start + length
+
+class PassFilter:
+    """Double-buffered Bloom filter of pass IDs in a file shared by all workers"""
+    
+    def __init__(self):
+        self._file = SharedFile(
+            MAGIC, LAYOUT,
+            size=lambda bits, hashes: HEADER_SIZE + 2 * (bits // 8),
+            settings=lambda: (Config.PASS_FILTER_PATH, filter_size(Config.PASS_FILTER_CAPACITY, Config.PASS_FILTER_FP_RATE)),
+            init=_mark_not_built
+        )
+    
+    def _set_bits(self, mm, index):
+        return SET_BITS.unpack_from(mm, HEADER.size + index * SET_BITS.size)[0]
+    
+    def _store_set_bits(self, mm, index, count):
+        SET_BITS.pack_into(mm, HEADER.size + index * SET_BITS.size, count)
+    
+    def _set(self, mm, pass_id):
+        _, bits, hashes, _, _ = HEADER.unpack_from(mm)
+        positions = _positions(pass_id, bits, hashes)
+        for index in (0, 1):
+            start, _ = _array(mm, index)
+            added = 0
+            for position in positions:
+                offset, mask = start + (position >> 3), 1 << (position & 7)
+                if not mm[offset] & mask:
+                    mm[offset] |= mask
+                    added += 1
+            if added:
+                self._store_set_bits(mm, index, self._set_bits(mm, index) + added)
+    
+    def add(self, pass_id):
+        """Add a new pass ID now and again when the session commits (call before committing)"""
+        if not Config.PASS_FILTER_ENABLED:
+            return
+        with self._file.locked() as mm:
+            self._set(mm, pass_id)
+        # A rebuild that started before this pass committed may not see it; the second add covers that
+        db.session.info.setdefault('pass_filter', []).append(pass_id)
+    
+    def add_committed(self, pass_ids):
+        if not Config.PASS_FILTER_ENABLED or not pass_ids:
+            return
+        with self._file.locked() as mm:
+            for pass_id in pass_ids:
+                self._set(mm, pass_id)
+    
+    def might_contain(self, pass_id):
+        """False only when pass_id is certainly not a pass"""
+        if not Config.PASS_FILTER_ENABLED or not isinstance(pass_id, str):
+            return True
+        mm = self._file.mapped()
+        _, bits, hashes, live, _ = HEADER.unpack_from(mm)
+        if live == NOT_BUILT:
+            return True
+        start, _ = _array(mm, live)
+        return all(
+            mm[start + (position >> 3)] & (1 << (position & 7))
+            for position in _positions(pass_id, bits, hashes)
+        )
+    
+    def rebuild(self):
+        """Rebuild the spare bit array from the database and make it live (needs an app context)"""
+        if not Config.PASS_FILTER_ENABLED:
+            return 0
+        # Clear the spare array first: adds go to both arrays, so IDs added while the query runs are kept
+        with self._file.locked() as mm:
+            _, bits, hashes, live, generation = HEADER.unpack_from(mm)
+            generation += 1
+            spare = 1 if live == 0 else 0
+            start, end = _array(mm, spare)
+            mm[start:end] = bytes(end - start)
+            self._store_set_bits(mm, spare, 0)
+            HEADER.pack_into(mm, 0, MAGIC, bits, hashes, live, generation)
+        
+        built = bytearray(bits // 8)
+        count = 0
+        for _ in each_shard():
+            for pass_id in db.session.execute(select(Pass.pass_id).execution_options(yield_per=5000)).scalars():
+                for position in _positions(pass_id, bits, hashes):
+                    built[position >> 3] |= 1 << (position & 7)
+                count += 1
+        
+        with self._file.locked() as mm:
+            if HEADER.unpack_from(mm)[4] != generation:
+                # Another worker started a rebuild since and will publish its own
+                logger.info("[PASS_FILTER] Rebuild superseded by another worker")
+                return count
+            merged = int.from_bytes(mm[start:end], 'little') | int.from_bytes(built, 'little')
+            mm[start:end] = merged.to_bytes(end - start, 'little')
+            self._store_set_bits(mm, spare, _popcount(merged))
+            HEADER.pack_into(mm, 0, MAGIC, bits, hashes, spare, generation)
+        logger.info(f"[PASS_FILTER] Rebuilt with {count} passes")
+        return count
+    
+    def estimated_fp_rate(self):
+        """False-positive rate implied by the share of set bits in the live array (read from its counter)"""
+        if not Config.PASS_FILTER_ENABLED:
+            return None
+        mm = self._file.mapped()
+        _, bits, hashes, live, _ = HEADER.unpack_from(mm)
+        if live == NOT_BUILT:
+            return 1.0
+        filled = self._set_bits(mm, live) / bits
+        return round(filled ** hashes, 8)
+
+class UnknownPassLog:
+    """Pass IDs turned away per gate without an audit row each, written as one audit row per gate on flush"""
+    
+    def __init__(self, result='PASS_NOT_FOUND', label='unknown pass IDs'):
+        self._result = result
+        self._label = label
+        self._gates = {}
+        self._since = datetime.utcnow()
+        self._lock = threading.Lock()
+    
+    def record(self, gate_id, pass_id):
+        with self._lock:
+            entry = self._gates.setdefault(gate_id, [0, []])
+            entry[0] += 1
+            sample = str(pass_id)[:40]
+            if len(entry[1]) < UNKNOWN_SAMPLES and sample not in entry[1]:
+                entry[1].append(sample)
+    
+    def flush(self):
+        """Add the aggregated audit rows to the session and reset (caller commits)"""
+        now = datetime.utcnow()
+        with self._lock:
+            gates, since = self._gates, self._since
+            self._gates, self._since = {}, now
+        if not gates:
+            return 0
+        record_events([{
+            'event_type': 'scan',
+            'result': self._result,
+            'gate_id': gate_id,
+            'details': f"{count} {self._label} since {since.isoformat(timespec='seconds')}, e.g. {', '.join(samples)}",
+            'timestamp': now
+        } for gate_id, (count, samples) in gates.items()])
+        return sum(count for count, _ in gates.values())
+
+# Global filter and unknown ID log instances
+pass_filter = PassFilter()
+unknown_passes = UnknownPassLog()
+
+PASS_FILTER_FP_RATE.set_function(pass_filter.estimated_fp_rate)
+
+@event.listens_for(Session, 'after_commit')
+def _add_on_commit(session):
+    pass_ids = session.info.pop('pass_filter', None)
+    if pass_ids:
+        try:
+            pass_filter.add_committed(pass_ids)
+        except Exception as e:
+            logger.error(f"[PASS_FILTER] Add error: {e}", exc_info=True)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('pass_filter', None)
@@ -0,0 +1,87 @@
+"""
+Pass state machine for iAmSmartGate
+Every transition is a single conditional UPDATE whose WHERE clause repeats the
+preconditions, so concurrent scans or admin actions cannot both succeed; the
+rows the UPDATE returns are the passes that actually changed
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from models import db, Pass, mark_passes_changed
+
+logger = logging.getLogger(__name__)
+
+# action: allowed source statuses (None = any but the target), target status and audit event
+TRANSITIONS = {
+    'approve': {'from': ['In Process'], 'status': 'Pass', 'event_type': 'approval', 'result': 'APPROVED'},
+    'reject': {'from': ['In Process'], 'status': 'No Pass', 'event_type': 'rejection', 'result': 'REJECTED'},
+    'revoke': {'from': None, 'status': 'Revoked', 'event_type': 'revoke', 'result': 'REVOKED'},
+    'use': {'from': ['Pass'], 'status': 'Used', 'event_type': 'scan', 'result': 'PASS'},
+    'expire': {'from': ['Pass'], 'status': 'Expired', 'event_type': 'expiry', 'result': 'EXPIRED'}
+}
+
+def _conditions(table, action, now):
+    """WHERE clauses that must still hold for the transition to apply"""
+    spec = TRANSITIONS[action]
+    if spec['from']:
+        conditions = [table.c.status.in_(spec['from'])]
+    else:
+        conditions = [table.c.status != spec['status']]
+    
+    if action == 'use':
+        conditions += [
+            table.c.used_flag == False,
+            table.c.revoked_flag == False,
+            or_(table.c.expiry_timestamp.is_(None), table.c.expiry_timestamp >= now)
+        ]
+    elif action == 'expire':
+        conditions += [table.c.used_flag == False, table.c.expiry_timestamp <= now]
+    return conditions
+
+def _values(action, now, expiry_hours):
+    """Columns a transition sets besides the status"""
+    values = {'status': TRANSITIONS[action]['status']}
+    if action == 'approve':
+        values.update(approved_timestamp=now, expiry_timestamp=now + timedelta(hours=expiry_hours))
+    elif action == 'revoke':
+        values['revoked_flag'] = True
+    elif action == 'use':
+        values.update(used_flag=True, used_timestamp=now)
+    return values
+
+def apply_transition(action, pass_ids=None, now=None, expiry_hours=24):
+    """
+    Apply a transition to the given passes (or every pass it applies to when
+    pass_ids is None) and return the updated rows (caller commits)
+    """
+    now = now or datetime.utcnow()
+    table = Pass.__table__
+    
+    stmt = table.update().where(*_conditions(table, action, now))
+    if pass_ids is not None:
+        if not pass_ids:
+            return []
+        stmt = stmt.where(table.c.pass_id.in_(pass_ids))
+    
+    rows = db.session.execute(
+        stmt.values(**_values(action, now, expiry_hours)).returning(*table.c)
+    ).all()
+    mark_passes_changed(rows)
+    return rows
+
+def scan_rejection(pass_obj, now=None):
+    """
+    Why a pass cannot be admitted, as (audit result, response result, reason, details);
+    pass_obj must be freshly loaded after a failed 'use' transition
+    """
+    now = now or datetime.utcnow()
+    if pass_obj.status != 'Pass':
+        return 'NOT_APPROVED', 'No Pass', 'Pass not approved', f'Status: {pass_obj.status}'
+    if pass_obj.used_flag:
+        return 'ALREADY_USED', 'No Pass', 'Pass already used', 'Pass already used'
+    if pass_obj.revoked_flag:
+        return 'REVOKED', 'Revoked', 'Pass has been revoked', 'Pass revoked'
+    if pass_obj.expiry_timestamp and now > pass_obj.expiry_timestamp:
+        return 'EXPIRED', 'No Pass', 'Pass expired', 'Pass expired'
+    # Admissible again when re-read: it changed once more after the UPDATE ran
+    return 'NOT_APPROVED', 'No Pass', 'Pass not approved', f'Status: {pass_obj.status}'
@@ -0,0 +1,118 @@
+"""
+On-demand request profiling for iAmSmartGate
+Profiles a sampled share of requests (PROFILE_SAMPLE_RATE) or requests that
+carry a valid signed X-Profile header, and writes cProfile dumps to
+PROFILE_DIR. When neither is configured no hooks are installed at all.
+
+Mint a header value with: python profiling.py [ttl_seconds]
+"""
+import cProfile
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from flask import g, request
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SUFFIX = '.prof'
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+\.prof$')
+
+# Only one cProfile can be active per process at a time
+_active = threading.Lock()
+
+def make_profile_token(ttl_seconds=300):
+    """Header value that enables profiling until it expires"""
+    expires = int(time.time()) + ttl_seconds
+    signature = hmac.new(Config.PROFILE_SECRET.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def verify_profile_token(token):
+    """Check a signed, unexpired X-Profile header value"""
+    try:
+        expires, signature = token.split('.', 1)
+        if int(expires) < time.time():
+            return False
+    except (AttributeError, ValueError):
+        return False
+    expected = hmac.new(Config.PROFILE_SECRET.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+def _should_profile():
+    if Config.PROFILE_SECRET and PROFILE_HEADER in request.headers:
+        return verify_profile_token(request.headers[PROFILE_HEADER])
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+def list_profiles():
+    """Saved profiles, newest first"""
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(Config.PROFILE_DIR):
+        if name.endswith(PROFILE_SUFFIX):
+            stat = os.stat(os.path.join(Config.PROFILE_DIR, name))
+            profiles.append({
+                'name': name,
+                'size': stat.st_size,
+                'created': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+            })
+    return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+def profile_path(name):
+    """Path of a saved profile, or None for names that are not profile files"""
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(Config.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+def _save(profiler, elapsed):
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{endpoint}-{int(elapsed * 1000)}ms{PROFILE_SUFFIX}"
+    profiler.dump_stats(os.path.join(Config.PROFILE_DIR, name))
+    logger.info(f"[PROFILE] Saved {name}")
+    
+    # Keep the directory bounded
+    for profile in list_profiles()[Config.PROFILE_MAX_FILES:]:
+        os.remove(os.path.join(Config.PROFILE_DIR, profile['name']))
+
+def init_app(app):
+    """Install profiling hooks if sampling or signed headers are configured"""
+    if Config.PROFILE_SAMPLE_RATE <= 0 and not Config.PROFILE_SECRET:
+        return
+    
+    @app.before_request
+    def _start_profile():
+        if _should_profile() and _active.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+            g.profile_start = time.perf_counter()
+            g.profiler.enable()
+    
+    @app.teardown_request
+    def _stop_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        try:
+            _save(profiler, time.perf_counter() - g.pop('profile_start'))
+        except Exception as e:
+            logger.error(f"[PROFILE] Could not save profile: {e}", exc_info=True)
+        finally:
+            _active.release()
+    
+    logger.info(f"[PROFILE] Request profiling enabled (sample rate {Config.PROFILE_SAMPLE_RATE}, "
+                f"signed header {'on' if Config.PROFILE_SECRET else 'off'})")
+
+if __name__ == '__main__':
+    if not Config.PROFILE_SECRET:
+        sys.exit('Set PROFILE_SECRET to mint profiling headers')
+    print(f"{PROFILE_HEADER}: {make_profile_token(int(sys.argv[1]) if len(sys.argv) > 1 else 300)}")
@@ -0,0 +1,134 @@
+"""
+QR payload density analyzer
+Builds real QR payloads for each encoding and signature algorithm and
+encodes them with segno to find the QR version, modules per side and total
+modules at each error-correction level. A smaller version decodes faster on
+gate cameras, so this is the basis for choosing the production format.
+
+Encodings:
+  json_hex        what get_qr returns today: json.dumps({p, t, s}) with a hex signature
+  json_base64     what the wallet renders: compact JSON with a base64 signature
+  compact_binary  format byte, 6-byte pass id, 8-byte microsecond timestamp, raw signature
+
+RSA keys come from DummyHSM and ECDSA/Ed25519 from cryptography. The PQC rows
+use random bytes of the standard signature size (no Python implementation is
+installed), which is all that matters for density.
+
+Usage: python qr_density.py [--levels L,M] [--json results.json]
+"""
+import argparse
+import base64
+import json
+import os
+import struct
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+import segno
+from crypto_utils import DummyHSM
+
+COMPACT_FORMAT_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+# Signature sizes in bytes for algorithms without a local implementation
+PQC_SIGNATURE_SIZES = {
+    'falcon512': 666,
+    'falcon1024': 1280,
+    'dilithium2': 2420,
+    'dilithium3': 3293,
+    'sphincs128s': 7856
+}
+
+def sample_pass():
+    """A pass id and timestamp in the format get_qr signs"""
+    return f"PASS{uuid.uuid4().hex[:12].upper()}", datetime.utcnow().isoformat()
+
+def signatures(pass_id, timestamp):
+    """{algorithm: (raw signature bytes, measured)} over the get_qr signing input"""
+    data = f"{pass_id}|{timestamp}"
+    hsm = DummyHSM(storage_file=os.path.join(tempfile.mkdtemp(prefix='qr_density_'), 'hsm_keys.json'))
+    results = {}
+    for key_size in (2048, 3072):
+        key_id, _ = hsm.generate_key_pair(f'density_{key_size}', key_size)
+        results[f'rsa{key_size}_pss'] = (bytes.fromhex(hsm.sign_data(key_id, data)), True)
+    results['ecdsa_p256'] = (ec.generate_private_key(ec.SECP256R1()).sign(data.encode(), ec.ECDSA(hashes.SHA256())), True)
+    results['ed25519'] = (ed25519.Ed25519PrivateKey.generate().sign(data.encode()), True)
+    for name, size in PQC_SIGNATURE_SIZES.items():
+        results[name] = (os.urandom(size), False)
+    return results
+
+def encode_json_hex(pass_id, timestamp, signature):
+    return json.dumps({'p': pass_id, 't': timestamp, 's': signature.hex()})
+
+def encode_json_base64(pass_id, timestamp, signature):
+    return json.dumps({'p': pass_id, 't': timestamp, 's': base64.b64encode(signature).decode()}, separators=(',', ':'))
+
+def encode_compact_binary(pass_id, timestamp, signature):
+    micros = int((datetime.fromisoformat(timestamp) - EPOCH).total_seconds() * 1_000_000)
+    return struct.pack('>B6sQ', COMPACT_FORMAT_VERSION, bytes.fromhex(pass_id[4:]), micros) + signature
+
+ENCODINGS = {
+    'json_hex': encode_json_hex,
+    'json_base64': encode_json_base64,
+    'compact_binary': encode_compact_binary
+}
+
+def qr_metrics(payload, level):
+    """Smallest QR symbol for a payload at one error-correction level, or None if it does not fit"""
+    try:
+        qr = segno.make(payload, error=level, micro=False, boost_error=False)
+    except segno.DataOverflowError:
+        return None
+    side = qr.symbol_size(border=0)[0]
+    return {'version': qr.version, 'mode': qr.mode, 'modules_per_side': side, 'modules': side * side}
+
+def analyze(levels):
+    """One row per algorithm, encoding and error-correction level"""
+    pass_id, timestamp = sample_pass()
+    rows = []
+    for algorithm, (signature, measured) in signatures(pass_id, timestamp).items():
+        for encoding, encode in ENCODINGS.items():
+            payload = encode(pass_id, timestamp, signature)
+            payload_bytes = len(payload.encode() if isinstance(payload, str) else payload)
+            for level in levels:
+                rows.append({
+                    'algorithm': algorithm,
+                    'signature_bytes': len(signature),
+                    'measured_signature': measured,
+                    'encoding': encoding,
+                    'payload_bytes': payload_bytes,
+                    'error_correction': level,
+                    'qr': qr_metrics(payload, level)
+                })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='QR version and module count per payload encoding and signature algorithm')
+    parser.add_argument('--levels', default='L,M', help='error-correction levels to try (L, M, Q, H)')
+    parser.add_argument('--json', help='also write the rows to this file')
+    args = parser.parse_args()
+    
+    rows = analyze([level.strip().upper() for level in args.levels.split(',')])
+    
+    print(f"\n{'='*86}")
+    print(f"{'Algorithm':<14}{'Sig B':>7}  {'Encoding':<16}{'Payload B':>10}{'EC':>4}{'Version':>9}{'Modules':>10}{'Total':>9}")
+    print(f"{'='*86}")
+    for row in rows:
+        qr = row['qr']
+        side = qr and f"{qr['modules_per_side']}x{qr['modules_per_side']}"
+        size = f"{qr['version']:>9}{side:>10}{qr['modules']:>9}" if qr else f"{'too large':>28}"
+        sig = f"{row['signature_bytes']}{'' if row['measured_signature'] else '*'}"
+        print(f"{row['algorithm']:<14}{sig:>7}  {row['encoding']:<16}{row['payload_bytes']:>10}{row['error_correction']:>4}{size}")
+    print(f"{'='*86}")
+    print("* nominal signature size (random bytes)\n")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
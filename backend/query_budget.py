@@ -0,0 +1,217 @@
+"""
+Per-request SQL statement accounting for iAmSmartGate
+Counts the statements each request runs and the time spent in them. In test
+mode the totals go out in an X-SQL-Statements header. Statements repeated
+SQL_REPEAT_WARN times in one request are logged as a likely N+1, and routes
+listed in SQL_BUDGETS that go over budget are logged. Live responses are
+never changed: budgets are enforced by the test run below, which fails when a
+route goes over. Budgets of routes that read audit day partitions grow with
+the number of partitions the request read. Statements run while a streaming
+response is being sent are not counted.
+
+Check the standard workload against the budgets with: python query_budget.py
+"""
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+from audit_partitions import PARTITION_PREFIX, record_event
+
+logger = logging.getLogger(__name__)
+
+SQL_HEADER = 'X-SQL-Statements'
+PARTITION_NAME = re.compile(rf'\b{PARTITION_PREFIX}\d{{8}}\b')
+EXTRA_PARTITIONS = 3  # older audit partitions the workload creates, so fan-out routes are measured across several
+
+class QueryStats:
+    """Statements run by one request"""
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.partitions = set()
+    
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        self.partitions.update(PARTITION_NAME.findall(statement))
+    
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+    
+    def header(self):
+        return f"count={self.count}; time_ms={self.seconds * 1000:.1f}; partitions={len(self.partitions)}"
+
+def parse_header(value):
+    """(statements, audit partitions read) from an X-SQL-Statements header value"""
+    fields = dict(field.strip().split('=', 1) for field in value.split(';'))
+    return int(fields['count']), int(fields.get('partitions', 0))
+
+def allowance(budget, partitions):
+    """Statements a budget allows: a fixed count, or (fixed, per partition read)"""
+    if isinstance(budget, tuple):
+        fixed, per_partition = budget
+        return fixed + per_partition * partitions
+    return budget
+
+def _current_stats():
+    return g.get('query_stats') if has_request_context() else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('budget_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    starts = conn.info.get('budget_start')
+    if stats is not None and starts:
+        stats.add(statement, time.perf_counter() - starts.pop())
+
+def _handle_error(context):
+    starts = context.connection.info.get('budget_start') if context.connection is not None else None
+    if starts and _current_stats() is not None:
+        starts.pop()
+
+def init_app(app):
+    """Count SQL statements per request and check route budgets"""
+    # Registered here rather than at import so running this file as a script
+    # (which imports it a second time through app) does not count twice
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    
+    @app.before_request
+    def _start_accounting():
+        g.query_stats = QueryStats()
+    
+    @app.after_request
+    def _check_budget(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        
+        endpoint = request.endpoint or 'unmatched'
+        for statement, count in stats.repeated(Config.SQL_REPEAT_WARN):
+            logger.warning(f"[SQL] Possible N+1 in {endpoint}: {count}x {' '.join(statement.split())[:200]}")
+        
+        budget = Config.SQL_BUDGETS.get(endpoint)
+        if budget is not None:
+            allowed = allowance(budget, len(stats.partitions))
+            if stats.count > allowed:
+                # Logged only: the request has usually committed, so its response must stand
+                logger.warning(f"[SQL] {endpoint} ran {stats.count} statements (budget {allowed})")
+        
+        if Config.TEST_MODE:
+            response.headers[SQL_HEADER] = stats.header()
+        return response
+
+def run_workload(client):
+    """Exercise the main routes once; returns [(endpoint, status, statements, partitions read)]"""
+    results = []
+    
+    def call(endpoint, method, url, **kwargs):
+        res = getattr(client, method)(url, **kwargs)
+        results.append((endpoint, res.status_code) + parse_header(res.headers[SQL_HEADER]))
+        return res
+    
+    user = call('api.login', 'post', '/api/login',
+                json={'iamsmart_id': 'USER_BUDGET', 'password': 'demo123', 'device_id': 'budget'}).json
+    call('api.login', 'post', '/api/login',
+         json={'iamsmart_id': 'USER_BUDGET', 'password': 'demo123', 'device_id': 'budget'})
+    gate = call('api.gate_login', 'post', '/api/gate-login',
+                json={'tablet_id': 'GATE001', 'password': 'demo123'}).json
+    user_headers = {'Authorization': f"Bearer {user['token']}"}
+    gate_headers = {'Authorization': f"Bearer {gate['token']}"}
+    
+    # Passes at several sites, so per-site work (gate sequences, gate events) is part of the measurement
+    pass_ids = []
+    for site_id in ('SITE001', 'SITE001', 'SITE001', 'SITE002', 'SITE003'):
+        pass_ids.append(call('api.apply_pass', 'post', '/api/apply-pass', headers=user_headers, json={
+            'site_id': site_id, 'purpose_id': 'PURP001', 'visit_date_time': '2030-01-01T10:00:00'
+        }).json['pass']['pass_id'])
+    call('api.my_passes', 'get', '/api/my-passes', headers=user_headers)
+    call('api.user_info', 'get', '/api/user-info', headers=user_headers)
+    call('api.get_sites', 'get', '/api/sites')
+    call('api.get_purposes', 'get', '/api/purposes')
+    call('admin.pending_passes', 'get', '/admin/pending-passes')
+    
+    call('admin.approve_pass', 'post', f'/admin/approve-pass/{pass_ids[0]}', json={})
+    call('admin.reject_pass', 'post', f'/admin/reject-pass/{pass_ids[1]}', json={})
+    call('admin.bulk_update_passes', 'post', '/admin/bulk/approve', json={'pass_ids': pass_ids[2:]})
+    call('admin.revoke_pass', 'post', f'/admin/revoke-pass/{pass_ids[2]}', json={})
+    call('admin.bulk_update_passes', 'post', '/admin/bulk/revoke', json={'pass_ids': pass_ids[3:]})
+    
+    qr_payload = call('api.get_qr', 'get', f'/api/get-qr/{pass_ids[0]}', headers=user_headers).json['qr_payload']
+    call('api.scan_qr', 'post', '/api/scan-qr', headers=gate_headers, json={'qr_payload': qr_payload})
+    call('api.scan_qr', 'post', '/api/scan-qr', headers=gate_headers, json={'qr_payload': qr_payload})
+    
+    call('admin.pause_site', 'post', '/admin/pause-site', json={'site_id': 'SITE002', 'paused': True})
+    call('admin.pause_site', 'post', '/admin/pause-site', json={'site_id': 'SITE002', 'paused': False})
+    call('admin.pause_system', 'post', '/admin/pause-system', json={'paused': True})
+    call('admin.pause_system', 'post', '/admin/pause-system', json={'paused': False})
+    call('admin.update_registry', 'post', '/admin/registry/purposes', json={'id': 'PURP_BUDGET', 'name': 'Budget check'})
+    call('admin.register_gate', 'post', '/admin/register-gate',
+         json={'tablet_id': 'GATE_BUDGET', 'gps_location': '22.3193,114.1694', 'site_id': 'SITE003'})
+    call('admin.system_status', 'get', '/admin/system-status')
+    call('admin.all_passes', 'get', '/admin/all-passes')
+    call('admin.statistics', 'get', '/admin/statistics')
+    call('admin.audit_logs', 'get', '/admin/audit-logs')
+    call('admin.signature_logs', 'get', '/admin/hsm/signature-logs')
+    return results
+
+def main():
+    # Keep the database, HSM key store and log out of the working tree
+    workdir = tempfile.mkdtemp(prefix='query_budget_')
+    os.chdir(workdir)
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'budget.db')}"
+    
+    from app import app
+    from models import db
+    logging.disable(logging.WARNING)
+    Config.TEST_MODE = True
+    
+    # Older day partitions holding HSM events, so routes that fan out over partitions read several
+    with app.app_context():
+        for days_ago in range(1, EXTRA_PARTITIONS + 1):
+            record_event('sign', 'SUCCESS', user_id='USER_BUDGET', details='budget workload',
+                         timestamp=datetime.utcnow() - timedelta(days=days_ago))
+        db.session.commit()
+    
+    # Worst request per endpoint, measured against its budget for the partitions that request read
+    worst = {}
+    for endpoint, status, count, partitions in run_workload(app.test_client()):
+        if status >= 400:
+            print(f"{endpoint}: HTTP {status}")
+        budget = Config.SQL_BUDGETS.get(endpoint)
+        allowed = allowance(budget, partitions) if budget is not None else None
+        margin = allowed - count if allowed is not None else 0
+        if endpoint not in worst or margin < worst[endpoint][3]:
+            worst[endpoint] = (count, partitions, allowed, margin)
+    
+    print(f"\n{'='*70}")
+    print(f"{'Endpoint':<32}{'Statements':>12}{'Partitions':>12}{'Budget':>10}")
+    print(f"{'='*70}")
+    failures = 0
+    for endpoint, (count, partitions, allowed, _) in sorted(worst.items()):
+        # A route without a budget fails too, so new routes cannot slip past the check
+        over = allowed is None or count > allowed
+        failures += over
+        note = '  NO BUDGET' if allowed is None else '  OVER' if over else ''
+        print(f"{endpoint:<32}{count:>12}{partitions:>12}{allowed if allowed is not None else '-':>10}{note}")
+    print(f"{'='*70}")
+    print(f"Result: {'PASS' if not failures else f'FAIL ({failures} routes over or without a budget)'}\n")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Token-bucket rate limiting for iAmSmartGate
+Each policy in Config.RATE_LIMITS gives an endpoint one or more buckets keyed
+by gate, user (the token subject) or client IP. A request takes one token from
+each of its buckets; when one is empty it is answered 429 with Retry-After
+before any route code (database, HSM) runs. Client IPs are only known once
+RATE_LIMIT_PROXY_HOPS is set; until then buckets keyed by IP are skipped.
+Buckets live in process memory, or with RATE_LIMIT_STORE=shared in a
+memory-mapped file so every worker draws from the same buckets.
+"""
+import hashlib
+import logging
+import math
+import struct
+import threading
+import time
+import jwt
+from flask import jsonify, request
+from config import Config
+from metrics import RATE_LIMITED
+from shared_file import HEADER_SIZE, SharedFile
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IASRLB01'
+LAYOUT = struct.Struct('<I')  # slot count
+RECORD = struct.Struct('<Qdd')  # key hash (0 = empty), tokens, last refill (epoch seconds)
+MAX_PROBES = 16
+
+def _refill(tokens, updated, rate, burst, now):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+class MemoryStore:
+    """Buckets in a dict, for a single worker process"""
+    
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def take(self, key, rate, burst, now):
+        """(allowed, seconds until a token is available)"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, updated, rate, burst, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > Config.RATE_LIMIT_MAX_KEYS:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+    
+    def _prune(self, now):
+        # A bucket idle for a minute has refilled under every policy, so dropping it changes nothing
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < 60}
+
+class SharedStore:
+    """Buckets in an open-addressing table in a file mapped by every worker"""
+    
+    def __init__(self):
+        self._file = SharedFile(
+            MAGIC, LAYOUT,
+            size=lambda slots: HEADER_SIZE + slots * RECORD.size,
+            settings=lambda: (Config.RATE_LIMIT_PATH, (Config.RATE_LIMIT_SLOTS,))
+        )
+    
+    def take(self, key, rate, burst, now):
+        """(allowed, seconds until a token is available)"""
+        key_hash = struct.unpack('<Q', hashlib.blake2b(key.encode(), digest_size=8).digest())[0] or 1
+        with self._file.locked() as mm:
+            slots = (len(mm) - HEADER_SIZE) // RECORD.size
+            slot = key_hash % slots
+            offset, oldest = None, None
+            for _ in range(min(MAX_PROBES, slots)):
+                record_offset = HEADER_SIZE + slot * RECORD.size
+                stored, tokens, updated = RECORD.unpack_from(mm, record_offset)
+                if stored == key_hash:
+                    offset = record_offset
+                    tokens = _refill(tokens, updated, rate, burst, now)
+                    break
+                if stored == 0:
+                    offset, tokens = record_offset, burst
+                    break
+                if oldest is None or updated < oldest[1]:
+                    oldest = (record_offset, updated)
+                slot = (slot + 1) % slots
+            else:
+                # No free slot in the probe window: take over the least recently used one
+                offset, tokens = oldest[0], burst
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            RECORD.pack_into(mm, offset, key_hash, tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+def _subject():
+    """Gate or user id from the bearer token, or None"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])['user_id']
+    except (jwt.InvalidTokenError, KeyError):
+        return None
+
+def _client_ip():
+    """Client address, taken from X-Forwarded-For when trusted proxies add to it; None until the hops are configured"""
+    hops = Config.RATE_LIMIT_PROXY_HOPS
+    if hops is None:
+        return None
+    if hops:
+        forwarded = [addr.strip() for addr in request.headers.get('X-Forwarded-For', '').split(',') if addr.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.remote_addr
+
+def _bucket_key(kind):
+    """Bucket identity for a policy kind (gate and user buckets fall back to the IP without a valid token), or None"""
+    subject = (_subject() if kind in ('gate', 'user') else None) or _client_ip()
+    return f'{kind}:{subject}' if subject else None
+
+def init_app(app):
+    """Enforce Config.RATE_LIMITS before each matching request"""
+    if not Config.RATE_LIMIT_ENABLED:
+        return
+    store = SharedStore() if Config.RATE_LIMIT_STORE == 'shared' else MemoryStore()
+    if Config.RATE_LIMIT_PROXY_HOPS is None:
+        logger.warning("[RATE_LIMIT] RATE_LIMIT_PROXY_HOPS is not set, per-IP limits are off")
+    
+    @app.before_request
+    def _rate_limit():
+        policies = Config.RATE_LIMITS.get(request.endpoint)
+        if not policies or request.method == 'OPTIONS':
+            return None
+        now = time.time()
+        for kind, rate, burst in policies:
+            key = _bucket_key(kind)
+            if key is None:
+                continue
+            allowed, retry_after = store.take(f'{request.endpoint}|{key}', rate, burst, now)
+            if not allowed:
+                seconds = max(1, math.ceil(retry_after))
+                RATE_LIMITED.inc(request.endpoint, kind)
+                logger.warning(f"[RATE_LIMIT] {request.endpoint} limited for {key} ({kind}), retry in {seconds}s")
+                response = jsonify({'error': f'Too many requests, retry in {seconds}s', 'retry_after': seconds})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(seconds)
+                return response
+        return None
@@ -0,0 +1,103 @@
+"""
+Read/write routing for iAmSmartGate
+Routes in Config.READ_ONLY_ENDPOINTS read through a separate engine: a replica
+when DATABASE_READ_URL is set, otherwise a read-only (mode=ro) connection to
+the primary SQLite file. The SQLite files (primary and shards) are put in WAL
+mode, where a reader works from a snapshot and never holds up a commit; a
+long read only delays checkpoints. If the primary stays in rollback-journal
+mode (e.g. on a network filesystem) admin reads stay on it, as a read-only
+connection would block commits all the same there. Flushes and
+INSERT/UPDATE/DELETE statements always go to the primary, so a write on such
+a route still lands in the right place. A request forces primary reads with
+?fresh=1 or an X-Fresh-Read: 1 header, and code can do the same with
+fresh_read() where staleness matters. Statements on the passes table of a
+sharded site go to that site's shard before any of this applies.
+"""
+import logging
+from contextlib import contextmanager
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from config import Config
+from sharding import shard_engine
+
+logger = logging.getLogger(__name__)
+
+READ_BIND = 'read'
+
+class RoutingSession(Session):
+    """Session that sends pass statements to the current shard, and reads to the read engine while session.info['read_only'] is set"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = shard_engine(self, mapper, clause)
+            if engine is None and self.info.get('read_only') and not self._flushing:
+                is_write = getattr(clause, 'is_dml', False) or getattr(clause, 'is_ddl', False)
+                engine = None if is_write else self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_url(app):
+    """URL of the read engine, or None when reads cannot be split off (in-memory SQLite)"""
+    if Config.DATABASE_READ_URL:
+        return Config.DATABASE_READ_URL
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:') or url.query.get('uri'):
+        return None
+    # Flask-SQLAlchemy resolves a relative file: URI against the instance folder, like the primary
+    return f"sqlite:///file:{url.database}?mode=ro&uri=true"
+
+def configure(app):
+    """Add the read bind to the app config (call before db.init_app)"""
+    if not Config.READ_ROUTING_ENABLED:
+        return
+    url = read_url(app)
+    if url:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{READ_BIND: url})
+
+def wants_fresh():
+    return request.args.get('fresh') in ('1', 'true') or request.headers.get('X-Fresh-Read') == '1'
+
+@contextmanager
+def fresh_read():
+    """Read from the primary inside the block"""
+    session = current_app.extensions['sqlalchemy'].session
+    routed = session.info.pop('read_only', False)
+    try:
+        yield
+    finally:
+        if routed:
+            session.info['read_only'] = True
+
+def _set_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    finally:
+        cursor.close()
+
+def use_wal(app):
+    """Open the primary and shard SQLite databases in WAL mode (call in an app context, before the first query)"""
+    for key, engine in app.extensions['sqlalchemy'].engines.items():
+        if key != READ_BIND and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _set_wal)
+
+def journal_mode(app):
+    with app.app_context():
+        with app.extensions['sqlalchemy'].engine.connect() as conn:
+            return conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+
+def init_app(app):
+    """Route read-only endpoints to the read engine"""
+    if READ_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return
+    if not Config.DATABASE_READ_URL and journal_mode(app) != 'wal':
+        logger.warning("[READ_ROUTING] Primary is not in WAL mode, admin reads stay on the primary")
+        return
+    
+    @app.before_request
+    def _route_reads():
+        if request.endpoint in Config.READ_ONLY_ENDPOINTS and not wants_fresh():
+            app.extensions['sqlalchemy'].session.info['read_only'] = True
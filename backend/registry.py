@@ -0,0 +1,101 @@
+"""
+Site and purpose registry for iAmSmartGate
+Sites and purposes live in the database; each process keeps a snapshot of both
+tables and answers lookups from dicts. The snapshot is tagged with the
+registry_version system state row, which every change bumps in the same
+transaction, and is revalidated at most every REGISTRY_CHECK_SECONDS.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select
+from config import Config
+from models import db, Site, Purpose, SystemState
+
+Snapshot = namedtuple('Snapshot', ['version', 'sites', 'purposes'])
+
+REGISTRY_MODELS = {
+    'sites': (Site, Site.site_id),
+    'purposes': (Purpose, Purpose.purpose_id)
+}
+
+class Registry:
+    """Process-local cache of the sites and purposes tables"""
+    
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def _version(self):
+        value = db.session.execute(
+            select(SystemState.value).where(SystemState.key == 'registry_version')
+        ).scalar()
+        return int(value or 0)
+    
+    def _load(self, version):
+        def rows(model, key):
+            return {
+                row_id: {'name': name, 'active': bool(active)}
+                for row_id, name, active in db.session.execute(select(key, model.name, model.active).order_by(key))
+            }
+        return Snapshot(version, *(rows(model, key) for model, key in REGISTRY_MODELS.values()))
+    
+    def snapshot(self):
+        """Current snapshot, revalidated if the last check is too old"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < Config.REGISTRY_CHECK_SECONDS:
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                version = self._version()
+                if snapshot is None or snapshot.version != version:
+                    self._snapshot = self._load(version)
+                self._checked_at = time.monotonic()
+            return self._snapshot
+    
+    def invalidate(self):
+        """Make the next lookup check the database version"""
+        self._checked_at = 0.0
+    
+    def names(self, kind, snapshot=None):
+        """{id: name} for the active sites or purposes"""
+        entries = getattr(snapshot or self.snapshot(), kind)
+        return {row_id: row['name'] for row_id, row in entries.items() if row['active']}
+    
+    def site_ids(self):
+        return [site_id for site_id, site in self.snapshot().sites.items() if site['active']]
+    
+    def has_site(self, site_id):
+        site = self.snapshot().sites.get(site_id)
+        return site is not None and site['active']
+    
+    def has_purpose(self, purpose_id):
+        purpose = self.snapshot().purposes.get(purpose_id)
+        return purpose is not None and purpose['active']
+
+def upsert_entry(kind, entry_id, name=None, active=None):
+    """Create or update a site or purpose and bump the registry version (caller commits)"""
+    model, key = REGISTRY_MODELS[kind]
+    entry = db.session.get(model, entry_id)
+    if entry is None:
+        if not name:
+            raise ValueError('name is required for a new entry')
+        entry = model(**{key.key: entry_id}, name=name, active=True if active is None else active)
+        db.session.add(entry)
+    else:
+        if name:
+            entry.name = name
+        if active is not None:
+            entry.active = active
+    
+    table = SystemState.__table__
+    db.session.execute(
+        table.update().where(table.c.key == 'registry_version')
+        .values(value=(table.c.value.cast(db.Integer) + 1).cast(db.Text), updated_at=datetime.utcnow())
+    )
+    return entry
+
+# Global registry instance
+registry = Registry()
@@ -0,0 +1,94 @@
+"""
+Response serialization for iAmSmartGate
+All jsonify() responses go through FastJSONProvider, which encodes with orjson
+when it is installed (the stdlib json module otherwise) and writes datetimes
+as ISO 8601. Clients that send Accept: application/msgpack get MessagePack
+instead when msgpack is installed. List endpoints build rows with a
+Projection straight from Core result tuples instead of ORM objects.
+"""
+import json
+from datetime import date, datetime
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with MessagePack content negotiation"""
+    
+    def default(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return DefaultJSONProvider.default(value)
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            return self._encode(obj, sort_keys=kwargs.get('sort_keys', False), indent=bool(kwargs.get('indent'))).decode()
+        kwargs.setdefault('default', self.default)
+        return json.dumps(obj, **kwargs)
+    
+    def _encode(self, obj, sort_keys, indent):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        
+        if msgpack is not None and wants_msgpack():
+            response = self._app.response_class(
+                msgpack.packb(obj, default=self.default, use_bin_type=True), mimetype=MSGPACK_MIMETYPE
+            )
+            response.vary.add('Accept')
+            return response
+        
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        if orjson is not None:
+            body = self._encode(obj, sort_keys=self.sort_keys, indent=indent) + b'\n'
+        else:
+            body = self.dumps(obj, sort_keys=self.sort_keys, indent=2 if indent else None) + '\n'
+        response = self._app.response_class(body, mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+def wants_msgpack():
+    """True when the request's Accept header prefers MessagePack over JSON"""
+    if not has_request_context():
+        return False
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+class Projection:
+    """Fixed column list for a table, turning Core result tuples into response dicts"""
+    
+    def __init__(self, table, fields):
+        self.fields = tuple(fields)
+        self.columns = [table.c[field] for field in self.fields]
+    
+    def select(self):
+        return select(*self.columns)
+    
+    def dicts(self, rows):
+        # Datetimes are left for the encoder to format
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+def init_app(app):
+    """Serve jsonify() responses through the fast provider"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,115 @@
+"""
+Shard outbox relay for iAmSmartGate
+Audit and change events of a sharded site are written to its shard's outbox
+in the same transaction as the pass change they describe. A thread in each
+process copies them in batches to the audit partitions and change_events in
+the primary, where the event hub picks them up, and deletes them from the
+shard once the primary has committed them. A batch is claimed by advancing
+the site's outbox cursor with a conditional UPDATE, so when several workers
+relay the same shard each entry still reaches the primary once.
+"""
+import json
+import threading
+import logging
+from sqlalchemy import select, event as sa_event
+from sqlalchemy.orm import Session
+from models import db, OutboxCursor, record_changes
+from audit_partitions import record_events
+from sharding import OUTBOX, on_shard, shard_key, shard_sites
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def relay_site(site_id):
+    """Relay the next batch of a site's outbox to the primary, returning the number of entries relayed"""
+    session = db.session
+    cursors = OutboxCursor.__table__
+    key = shard_key(site_id)
+    
+    last_id = session.execute(select(cursors.c.last_id).where(cursors.c.site_id == site_id)).scalar() or 0
+    with on_shard(key):
+        entries = session.execute(
+            select(OUTBOX).where(OUTBOX.c.entry_id > last_id)
+            .order_by(OUTBOX.c.entry_id).limit(Config.OUTBOX_BATCH_SIZE)
+        ).all()
+    # End the read so the claim below sees other workers' commits
+    session.rollback()
+    if not entries:
+        return 0
+    
+    claimed = session.execute(
+        cursors.update().where(cursors.c.site_id == site_id, cursors.c.last_id == last_id)
+        .values(last_id=entries[-1].entry_id)
+    ).rowcount
+    if not claimed:
+        # Another worker relayed this batch first
+        session.rollback()
+        return 0
+    
+    audits, changes = [], []
+    for entry in entries:
+        payload = json.loads(entry.payload)
+        if entry.kind == 'audit':
+            audits.append(dict(payload, timestamp=entry.created_at))
+        else:
+            changes.append((payload['kind'], payload['payload'], payload['user_id'], payload['site_id']))
+    record_events(audits)
+    record_changes(changes)
+    session.commit()
+    
+    # Entries up to the cursor are never read again; one left behind by a crash goes with the next batch
+    with on_shard(key):
+        session.execute(OUTBOX.delete().where(OUTBOX.c.entry_id <= entries[-1].entry_id))
+        session.commit()
+    return len(entries)
+
+class OutboxRelay:
+    """Relays every shard's outbox to the primary from one thread per process"""
+    
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+    
+    def init_app(self, app):
+        self.app = app
+        if shard_sites():
+            self._ensure_started()
+    
+    def wake(self):
+        """Relay now instead of at the next interval (outbox entries committed in this process)"""
+        self._wake.set()
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+                self._thread.start()
+                logger.info("[OUTBOX] Outbox relay started")
+    
+    def _run(self):
+        while True:
+            # Other workers' entries are relayed within one interval (by them or by this process)
+            self._wake.wait(Config.OUTBOX_RELAY_INTERVAL)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    for site_id in shard_sites():
+                        while relay_site(site_id) == Config.OUTBOX_BATCH_SIZE:
+                            pass
+                    db.session.remove()
+            except Exception as e:
+                logger.error(f"[OUTBOX] Relay error: {e}", exc_info=True)
+
+# Global relay instance
+relay = OutboxRelay()
+
+@sa_event.listens_for(Session, 'after_commit')
+def _relay_on_commit(session):
+    if session.info.pop('outbox_queued', False):
+        relay.wake()
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('outbox_queued', None)
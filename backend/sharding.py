@@ -0,0 +1,234 @@
+"""
+Site-sharded pass storage for iAmSmartGate
+With SHARDING_ENABLED each site in SHARD_SITES (by default every site in the
+registry when the app starts) keeps its passes in a database of its own, from
+SHARD_URL_TEMPLATE or SHARD_URLS, so scans and approvals at one site only
+contend for that site's write lock. Shards are fixed at startup: a site added
+to the registry later keeps its passes in the primary until the next start. Passes of any other site stay in the primary, which also keeps
+users, gates, the audit log and the change feed. Code picks the shard with
+use_site() or route_to_pass(); statements on the sharded tables then run on
+that shard's engine and everything else on the primary. Cross-site reads go
+through each_shard()/execute_all() and merge the per-shard results. Passes
+of a sharded site still in the primary move to its shard at startup.
+A shard also counts its owners' pass versions and keeps an outbox: audit and
+change events written while the session is routed to a shard go there, in the
+same transaction as the pass change, and shard_outbox.py relays them to the
+primary, so a sharded site's scans and approvals never write to the primary.
+"""
+import heapq
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import (Column, DateTime, Integer, MetaData, Select, String, Table, Text, UpdateBase,
+                        column, create_engine, func, inspect, select, table)
+from sqlalchemy.engine import make_url
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = 'shard_'
+SHARDED_TABLES = ('passes', 'pass_versions', 'shard_outbox')
+MIGRATE_BATCH = 1000
+SITES_TABLE = table('sites', column('site_id'))
+
+# Audit and change events waiting to be relayed to the primary (only created in the shards);
+# AUTOINCREMENT so IDs are never reused once relayed rows are deleted
+OUTBOX = Table(
+    'shard_outbox', MetaData(),
+    Column('entry_id', Integer, primary_key=True, autoincrement=True),
+    Column('kind', String(20), nullable=False),  # audit/change
+    Column('payload', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    sqlite_autoincrement=True
+)
+
+_registry_sites = None  # registry sites read by configure()
+
+def shard_sites():
+    """Sites whose passes live in a shard of their own (none when sharding is off)"""
+    if not Config.SHARDING_ENABLED:
+        return []
+    if Config.SHARD_SITES:
+        return Config.SHARD_SITES
+    return list(Config.SITES) if _registry_sites is None else _registry_sites
+
+def shard_key(site_id):
+    """Bind key of a site's shard, or None when its passes live in the primary"""
+    return f'{SHARD_PREFIX}{site_id}' if site_id in shard_sites() else None
+
+def shard_layout():
+    """Short tag of the shard set, so values that list one entry per database can tell if it changed"""
+    return f"s{zlib.crc32(','.join(shard_sites()).encode()):08x}"
+
+def shard_url(site_id):
+    return Config.SHARD_URLS.get(site_id) or Config.SHARD_URL_TEMPLATE.format(site_id=site_id)
+
+def shard_keys(site_id=None):
+    """Bind keys of the databases holding passes: the primary (None) and each shard, or just the site's"""
+    if site_id:
+        return [shard_key(site_id)]
+    return [None] + [shard_key(site) for site in shard_sites()]
+
+def registry_sites(app):
+    """Site IDs in the primary's registry, or the sites init_db seeds when it has none yet"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if (url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+            and not url.query.get('uri') and not os.path.isabs(url.database)):
+        # Flask-SQLAlchemy resolves a relative SQLite path against the instance folder
+        os.makedirs(app.instance_path, exist_ok=True)
+        url = url.set(database=os.path.join(app.instance_path, url.database))
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            if not inspect(conn).has_table('sites'):
+                return list(Config.SITES)
+            sites = conn.execute(select(SITES_TABLE.c.site_id).order_by(SITES_TABLE.c.site_id)).scalars().all()
+    finally:
+        engine.dispose()
+    return sites or list(Config.SITES)
+
+def configure(app):
+    """Add a bind per shard to the app config (call before db.init_app); the shards are fixed from then on"""
+    global _registry_sites
+    if Config.SHARDING_ENABLED and not Config.SHARD_SITES:
+        _registry_sites = registry_sites(app)
+    binds = {shard_key(site_id): shard_url(site_id) for site_id in shard_sites()}
+    if binds:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **binds)
+
+def _tables(mapper, clause):
+    if mapper is not None:
+        return [inspect(mapper).local_table]
+    if isinstance(clause, UpdateBase):
+        return [clause.table]
+    if isinstance(clause, Select):
+        return clause.get_final_froms()
+    return []
+
+def shard_engine(session, mapper, clause):
+    """Engine of the session's shard for a statement on a sharded table, else None"""
+    key = session.info.get('shard')
+    if key is None:
+        return None
+    if any(getattr(table, 'name', None) in SHARDED_TABLES for table in _tables(mapper, clause)):
+        return session._db.engines[key]
+    return None
+
+def _db():
+    return current_app.extensions['sqlalchemy']
+
+def shard_engines():
+    """Engine of every shard (empty when sharding is off)"""
+    return [_db().engines[shard_key(site_id)] for site_id in shard_sites()]
+
+def shard_tables():
+    """Tables every shard has"""
+    tables = _db().metadata.tables
+    return [tables['passes'], tables['pass_versions'], OUTBOX]
+
+def current_shard():
+    """Bind key of the shard the session is routed to, or None for the primary"""
+    return _db().session.info.get('shard')
+
+def use_site(site_id):
+    """Send pass statements in this session to the site's shard"""
+    _db().session.info['shard'] = shard_key(site_id)
+
+def route_to_pass(pass_id):
+    """
+    Send pass statements in this session to the shard holding pass_id (no query
+    when unsharded); False when no database holds it
+    """
+    if not shard_sites():
+        return True
+    db = _db()
+    table = db.metadata.tables['passes']
+    for key in shard_keys():
+        db.session.info['shard'] = key
+        if db.session.execute(select(table.c.pass_id).where(table.c.pass_id == pass_id)).first():
+            return True
+    db.session.info['shard'] = None
+    return False
+
+@contextmanager
+def on_shard(key):
+    """Send pass statements to one shard inside the block"""
+    session = _db().session
+    previous = session.info.get('shard')
+    session.info['shard'] = key
+    try:
+        yield
+    finally:
+        session.info['shard'] = previous
+
+def each_shard(site_id=None):
+    """Yield the bind key of each shard (only the site's with site_id) while the session is routed to it"""
+    for key in shard_keys(site_id):
+        with on_shard(key):
+            yield key
+
+def execute_all(stmt, order_by=None, reverse=False, site_id=None):
+    """
+    Rows of a pass statement from every shard (only the site's with site_id);
+    stmt may also be a function of the shard's position in shard_keys(). With
+    order_by, a row key the statement already sorts by, the shards' rows are
+    merged in that order
+    """
+    session = _db().session
+    results = [
+        session.execute(stmt(index) if callable(stmt) else stmt).all()
+        for index, _ in enumerate(each_shard(site_id))
+    ]
+    if order_by is None:
+        return [row for rows in results for row in rows]
+    return list(heapq.merge(*results, key=order_by, reverse=reverse))
+
+def migrate_to_shards():
+    """Move passes of sharded sites from the primary to their shard (needs an app context)"""
+    db = _db()
+    table = db.metadata.tables['passes']
+    for site_id in shard_sites():
+        engine = db.engines[shard_key(site_id)]
+        moved = 0
+        while True:
+            with db.engine.connect() as primary:
+                rows = primary.execute(
+                    select(table).where(table.c.site_id == site_id).limit(MIGRATE_BATCH)
+                ).mappings().all()
+            if not rows:
+                break
+            pass_ids = [row['pass_id'] for row in rows]
+            with engine.begin() as shard:
+                copied = set(shard.execute(select(table.c.pass_id).where(table.c.pass_id.in_(pass_ids))).scalars())
+                new_rows = [dict(row) for row in rows if row['pass_id'] not in copied]
+                if new_rows:
+                    shard.execute(table.insert(), new_rows)
+            # Deleted only once the shard has committed them; an interrupted move is picked up next start
+            with db.engine.begin() as primary:
+                primary.execute(table.delete().where(table.c.pass_id.in_(pass_ids)))
+            moved += len(pass_ids)
+        if moved:
+            logger.info(f"[SHARDING] Moved {moved} passes of {site_id} to its shard")
+        with engine.begin() as shard:
+            _sync_versions(shard)
+
+def _sync_versions(conn):
+    """
+    Raise a shard's pass versions to the highest version its passes are stamped
+    with, so passes moved in from the primary (stamped by its counter) are not
+    sent as changed again on every ?since= request
+    """
+    tables = _db().metadata.tables
+    passes, versions = tables['passes'], tables['pass_versions']
+    stamped = select(func.max(passes.c.change_version)).where(
+        passes.c.iamsmart_id == versions.c.iamsmart_id
+    ).scalar_subquery()
+    conn.execute(versions.update().where(versions.c.version < stamped).values(version=stamped))
+    known = select(versions.c.iamsmart_id)
+    conn.execute(versions.insert().from_select(
+        ['iamsmart_id', 'version'],
+        select(passes.c.iamsmart_id, func.coalesce(func.max(passes.c.change_version), 0))
+        .where(passes.c.iamsmart_id.not_in(known)).group_by(passes.c.iamsmart_id)
+    ))
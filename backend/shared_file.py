@@ -0,0 +1,147 @@
+"""
+Memory-mapped files shared by all worker processes
+The status index, the pass filter and the shared rate-limit store each keep a
+fixed-size table in a file that every worker maps. The file starts with a
+magic and the layout parameters it was built with (the owner's own header
+fields follow). A file is never truncated or reformatted in place, since
+shrinking a file another process has mapped kills that process with SIGBUS:
+a process starting with another layout (e.g. new workers after a config
+change) builds a new file under a temporary name and moves it into place.
+Processes still mapping the old file switch to the new one, taking the
+layout from its header, when a writer next takes the lock or a reader's
+REOPEN_CHECK_SECONDS are up. Writers serialize on an flock of the file.
+"""
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows: writes are only serialized within the process
+    fcntl = None
+
+HEADER_SIZE = 64  # magic and layout parameters, then the owner's header fields
+MAGIC_SIZE = 8
+REOPEN_CHECK_SECONDS = 1.0  # how long a reader may keep using a file that has been replaced
+
+class SharedFile:
+    """A fixed-size file mapped by every worker, created or replaced on first use"""
+    
+    def __init__(self, magic, layout, size, settings, init=None):
+        """
+        magic: 8 bytes naming the format; layout: struct of the parameters stored
+        after it; size(*params): file size; settings(): (path, params) from Config;
+        init(mm): writes the owner's header fields into a new file
+        """
+        self._magic = magic
+        self._layout = layout
+        self._size = size
+        self._settings = settings
+        self._init = init
+        self._path = None
+        self._mm = None
+        self._fd = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def _file_lock(self, fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    
+    def _is_current(self, fd):
+        """Whether fd is still the file at the path (not replaced since it was opened)"""
+        try:
+            current = os.stat(self._path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(fd)
+        return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+    
+    def _layout_of(self, fd):
+        """Layout parameters of a complete file in this format, else None"""
+        os.lseek(fd, 0, os.SEEK_SET)
+        header = os.read(fd, HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:MAGIC_SIZE] != self._magic:
+            return None
+        params = self._layout.unpack_from(header, MAGIC_SIZE)
+        return params if os.fstat(fd).st_size == self._size(*params) else None
+    
+    def _replace(self, params):
+        """Build a new file with these parameters and move it over the path"""
+        temp = f'{self._path}.{os.getpid()}.tmp'
+        size = self._size(*params)
+        fd = os.open(temp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+            mm[:MAGIC_SIZE] = self._magic
+            self._layout.pack_into(mm, MAGIC_SIZE, *params)
+            if self._init is not None:
+                self._init(mm)
+            mm.close()
+        finally:
+            os.close(fd)
+        os.replace(temp, self._path)
+    
+    def _try_open(self, params):
+        """(fd, mm) of the file at the path, replaced first when params is given and differs; None to retry"""
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._file_lock(fd):
+            mm = None
+            if self._is_current(fd):
+                layout = self._layout_of(fd)
+                if layout is None or (params is not None and layout != tuple(params)):
+                    # Under the old file's lock, so its writers find it replaced once they get the lock
+                    self._replace(params or self._settings()[1])
+                else:
+                    mm = mmap.mmap(fd, self._size(*layout))
+        if mm is None:
+            os.close(fd)
+            return None
+        return fd, mm
+    
+    def _open(self):
+        """Map the file at the path; the first open replaces a file of another layout, later ones adopt it"""
+        if self._path is None:
+            self._path, params = self._settings()
+        else:
+            params = None
+        opened = None
+        while opened is None:
+            opened = self._try_open(params)
+        if self._fd is not None:
+            # The old mapping stays valid for readers still holding it; only the descriptor goes
+            os.close(self._fd)
+        self._fd, self._mm = opened
+        self._checked = time.monotonic()
+    
+    def mapped(self):
+        """The mapped file, opened on first use and reopened once it has been replaced"""
+        if self._mm is None or time.monotonic() - self._checked >= REOPEN_CHECK_SECONDS:
+            with self._lock:
+                if self._mm is None or not self._is_current(self._fd):
+                    self._open()
+                self._checked = time.monotonic()
+        return self._mm
+    
+    @contextmanager
+    def locked(self):
+        """The mapped file, exclusive against writers in this and every other process"""
+        with self._lock:
+            if self._mm is None:
+                self._open()
+            while True:
+                fd = self._fd
+                with self._file_lock(fd):
+                    if self._is_current(fd):
+                        yield self._mm
+                        return
+                self._open()
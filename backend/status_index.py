@@ -0,0 +1,160 @@
+"""
+Shared pass status index for iAmSmartGate
+A memory-mapped file of fixed-width records (pass ordinal, status code, flags,
+expiry epoch) that every worker process maps, so scan_qr can turn away used,
+revoked, rejected and expired passes without reading SQLite. That happens
+before the QR is verified, so the reply does not say which state it was.
+Records are written once the transaction that changed the pass has committed,
+and the whole file is rebuilt from the passes table at startup. Only final states are
+trusted; any other status, or a pass missing from the index, is checked
+against the database as before.
+"""
+import logging
+import math
+import re
+import struct
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from config import Config
+from models import db, Pass
+from pass_filter import UnknownPassLog
+from shared_file import HEADER_SIZE, SharedFile
+from sharding import each_shard
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IASIDX01'
+LAYOUT = struct.Struct('<I')  # slot count
+KEY = struct.Struct('<Q')  # pass ordinal, 0 = empty slot
+PAYLOAD = struct.Struct('<BBxxI')  # status code, flags, expiry epoch seconds (0 = none)
+RECORD_SIZE = KEY.size + PAYLOAD.size
+MAX_PROBES = 64  # bounds lookups; a pass that finds no slot within this is left to the database
+
+STATUS_CODES = {'In Process': 1, 'Pass': 2, 'No Pass': 3, 'Used': 4, 'Revoked': 5, 'Expired': 6}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+FLAG_USED = 1
+FLAG_REVOKED = 2
+
+# No transition leaves these except to Revoked, so a record that lags the database is still right to reject
+FINAL_STATUSES = ('No Pass', 'Used', 'Revoked', 'Expired')
+
+PASS_ID = re.compile(r'PASS([0-9A-F]{12})')
+EPOCH = datetime(1970, 1, 1)
+
+# Same attributes scan_rejection reads from a Pass
+Entry = namedtuple('Entry', ['status', 'used_flag', 'revoked_flag', 'expiry_timestamp'])
+
+def pass_ordinal(pass_id):
+    """Non-zero integer key for a PASS + 12 hex digit id, or None for any other id"""
+    match = PASS_ID.fullmatch(pass_id) if isinstance(pass_id, str) else None
+    return int(match.group(1), 16) + 1 if match else None
+
+class StatusIndex:
+    """Open-addressing hash table of pass statuses in a file shared by all workers"""
+    
+    def __init__(self):
+        self._file = SharedFile(
+            MAGIC, LAYOUT,
+            size=lambda slots: HEADER_SIZE + slots * RECORD_SIZE,
+            settings=lambda: (Config.STATUS_INDEX_PATH, (Config.STATUS_INDEX_SLOTS,))
+        )
+    
+    def _find(self, mm, ordinal):
+        """(offset, key) of the pass's record or of the empty slot it would take; (None, None) past MAX_PROBES"""
+        slots = (len(mm) - HEADER_SIZE) // RECORD_SIZE
+        slot = ((ordinal * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) % slots
+        for _ in range(min(MAX_PROBES, slots)):
+            offset = HEADER_SIZE + slot * RECORD_SIZE
+            key = KEY.unpack_from(mm, offset)[0]
+            if key == ordinal or key == 0:
+                return offset, key
+            slot = (slot + 1) % slots
+        return None, None
+    
+    def _write(self, mm, pass_id, status, used, revoked, expiry):
+        ordinal = pass_ordinal(pass_id)
+        if ordinal is None or status not in STATUS_CODES:
+            return
+        offset, key = self._find(mm, ordinal)
+        if offset is None:
+            logger.warning(f"[STATUS_INDEX] No free slot for {pass_id}; raise STATUS_INDEX_SLOTS")
+            return
+        # Rounded up, so the index never calls a pass expired before the database does
+        expiry_epoch = math.ceil((expiry - EPOCH).total_seconds()) if expiry else 0
+        flags = (FLAG_USED if used else 0) | (FLAG_REVOKED if revoked else 0)
+        PAYLOAD.pack_into(mm, offset + KEY.size, STATUS_CODES[status], flags, expiry_epoch)
+        if not key:
+            # Payload first, so a reader never finds the key without it
+            KEY.pack_into(mm, offset, ordinal)
+    
+    def lookup(self, pass_id):
+        """Indexed Entry for a pass, or None when it is not indexed"""
+        if not Config.STATUS_INDEX_ENABLED:
+            return None
+        ordinal = pass_ordinal(pass_id)
+        if ordinal is None:
+            return None
+        mm = self._file.mapped()
+        offset, key = self._find(mm, ordinal)
+        if not key:
+            return None
+        code, flags, expiry_epoch = PAYLOAD.unpack_from(mm, offset + KEY.size)
+        status = STATUS_NAMES.get(code)
+        if status is None:
+            return None
+        expiry = EPOCH + timedelta(seconds=expiry_epoch) if expiry_epoch else None
+        return Entry(status, bool(flags & FLAG_USED), bool(flags & FLAG_REVOKED), expiry)
+    
+    @staticmethod
+    def is_final(entry, now):
+        """Whether an indexed pass can be rejected without asking the database"""
+        if entry.status in FINAL_STATUSES:
+            return True
+        return entry.status == 'Pass' and entry.expiry_timestamp is not None and now > entry.expiry_timestamp
+    
+    def update(self, statuses):
+        """Write {pass_id: (status, used_flag, revoked_flag, expiry_timestamp)}"""
+        if not Config.STATUS_INDEX_ENABLED or not statuses:
+            return
+        with self._file.locked() as mm:
+            for pass_id, values in statuses.items():
+                self._write(mm, pass_id, *values)
+    
+    def rebuild(self):
+        """Replace the index with every pass in the database (needs an app context)"""
+        if not Config.STATUS_INDEX_ENABLED:
+            return 0
+        count = 0
+        # Writers wait for the lock, so a transition committed meanwhile is written after the reload
+        with self._file.locked() as mm:
+            mm[HEADER_SIZE:] = bytes(len(mm) - HEADER_SIZE)
+            for _ in each_shard():
+                rows = db.session.execute(
+                    select(Pass.pass_id, Pass.status, Pass.used_flag, Pass.revoked_flag, Pass.expiry_timestamp)
+                    .execution_options(yield_per=5000)
+                )
+                for row in rows:
+                    self._write(mm, *row)
+                    count += 1
+        logger.info(f"[STATUS_INDEX] Rebuilt with {count} passes")
+        return count
+
+# Global status index instance
+status_index = StatusIndex()
+unverified_rejects = UnknownPassLog('UNVERIFIED_REJECT', 'scans of indexed final passes before QR verification')
+
+@event.listens_for(Session, 'after_commit')
+def _write_on_commit(session):
+    statuses = session.info.pop('pass_status', None)
+    if statuses:
+        try:
+            status_index.update(statuses)
+        except Exception as e:
+            # A stale record only sends scans to the database, it never rejects a valid pass
+            logger.error(f"[STATUS_INDEX] Update error: {e}", exc_info=True)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('pass_status', None)
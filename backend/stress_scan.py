@@ -0,0 +1,88 @@
+"""
+Concurrency stress test for pass scanning
+Fires many simultaneous scans of one QR code (like gates scanning a shared
+screenshot) and checks that exactly one of them is granted, round after round.
+Runs against a throwaway database in a temporary directory.
+
+Usage: python stress_scan.py [--scans 50] [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel scans of one pass must admit exactly once')
+    parser.add_argument('--scans', type=int, default=50, help='concurrent scans per round')
+    parser.add_argument('--rounds', type=int, default=20, help='passes to test')
+    args = parser.parse_args()
+    
+    # Keep the database, HSM key store and log out of the working tree
+    workdir = tempfile.mkdtemp(prefix='stress_scan_')
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'stress.db')}"
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'  # every round is a burst of scans by design
+    
+    import logging
+    from app import app
+    logging.disable(logging.WARNING)
+    
+    client = app.test_client()
+    user = client.post('/api/login', json={'iamsmart_id': 'USER_STRESS', 'password': 'demo123', 'device_id': 'stress'}).json
+    gates = [
+        client.post('/api/gate-login', json={'tablet_id': f'GATE00{i}', 'password': 'demo123'}).json['token']
+        for i in range(1, 5)
+    ]
+    user_headers = {'Authorization': f"Bearer {user['token']}"}
+    
+    print(f"\n{'='*60}")
+    print(f"SCAN STRESS TEST: {args.rounds} rounds x {args.scans} parallel scans")
+    print(f"Work directory: {workdir}")
+    print(f"{'='*60}")
+    
+    failures = 0
+    totals = Counter()
+    for round_number in range(1, args.rounds + 1):
+        pass_id = client.post('/api/apply-pass', headers=user_headers, json={
+            'site_id': 'SITE001', 'purpose_id': 'PURP001', 'visit_date_time': '2030-01-01T10:00:00'
+        }).json['pass']['pass_id']
+        client.post(f'/admin/approve-pass/{pass_id}', json={})
+        qr_payload = client.get(f'/api/get-qr/{pass_id}', headers=user_headers).json['qr_payload']
+        
+        barrier = threading.Barrier(args.scans)
+        outcomes = Counter()
+        lock = threading.Lock()
+        
+        def scan(index):
+            scanner = app.test_client()
+            headers = {'Authorization': f'Bearer {gates[index % len(gates)]}'}
+            barrier.wait()
+            res = scanner.post('/api/scan-qr', headers=headers, json={'qr_payload': qr_payload})
+            outcome = res.json.get('result') if res.status_code == 200 else f'HTTP {res.status_code}'
+            if outcome == 'No Pass':
+                outcome = f"No Pass ({res.json.get('reason')})"
+            with lock:
+                outcomes[outcome] += 1
+        
+        threads = [threading.Thread(target=scan, args=(i,)) for i in range(args.scans)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        granted = outcomes['Pass']
+        totals.update(outcomes)
+        if granted != 1:
+            failures += 1
+        print(f"Round {round_number:>3}: granted={granted} {'OK' if granted == 1 else 'FAIL'}  {dict(outcomes)}")
+    
+    print(f"\n{'='*60}")
+    print(f"Outcomes: {dict(totals)}")
+    print(f"Result: {'PASS' if not failures else f'FAIL ({failures} rounds did not admit exactly once)'}")
+    print(f"{'='*60}\n")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())